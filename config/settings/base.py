@@ -32,6 +32,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # En premier: la latence mesuree couvre tous les autres middlewares.
+    "core.metrics.MetriquesRequetesMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -93,7 +95,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.RoleJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
@@ -104,8 +106,41 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
     "AUTH_HEADER_TYPES": ("Bearer",),
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.RoleTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.RoleTokenRefreshSerializer",
 }
 
+# Duree (secondes) du cache processus des parametres systeme.
+PARAMETRES_CACHE_TTL = int(os.getenv("DJANGO_PARAMETRES_CACHE_TTL", "60"))
+
+# Duree (secondes) avant reconstruction de l'index memoire du catalogue (hors PostgreSQL).
+CATALOGUE_INDEX_TTL = int(os.getenv("DJANGO_CATALOGUE_INDEX_TTL", "300"))
+
+# Budget de latence (ms) de la recherche approximative (?fuzzy=true).
+RECHERCHE_APPROX_BUDGET_MS = int(os.getenv("DJANGO_RECHERCHE_APPROX_BUDGET_MS", "200"))
+
+# Cache LRU des scans de codes-barres (taille, TTL en secondes).
+SCAN_CACHE_TAILLE = int(os.getenv("DJANGO_SCAN_CACHE_TAILLE", "2048"))
+SCAN_CACHE_TTL = int(os.getenv("DJANGO_SCAN_CACHE_TTL", "10"))
+
+# Chronologies de disponibilite par ouvrage (nombre en memoire, TTL en secondes).
+DISPONIBILITE_CACHE_TAILLE = int(os.getenv("DJANGO_DISPONIBILITE_CACHE_TAILLE", "1024"))
+DISPONIBILITE_CACHE_TTL = int(os.getenv("DJANGO_DISPONIBILITE_CACHE_TTL", "3600"))
+
+# Journal d'activites ecrit par un thread (lots de TAILLE, ou toutes les INTERVALLE secondes).
+# Desactive par defaut: insertion synchrone (tests, dev).
+ACTIVITES_ASYNC = os.getenv("DJANGO_ACTIVITES_ASYNC", "False") == "True"
+ACTIVITES_TAMPON_TAILLE = int(os.getenv("DJANGO_ACTIVITES_TAMPON_TAILLE", "100"))
+ACTIVITES_TAMPON_INTERVALLE = float(os.getenv("DJANGO_ACTIVITES_TAMPON_INTERVALLE", "1.0"))
+
+# Retention du journal d'activites (commande archiver_activites): mois conserves en base
+# et dossier des archives mensuelles gzip JSONL.
+ACTIVITES_RETENTION_MOIS = int(os.getenv("DJANGO_ACTIVITES_RETENTION_MOIS", "12"))
+ACTIVITES_ARCHIVE_DIR = os.getenv("DJANGO_ACTIVITES_ARCHIVE_DIR", str(BASE_DIR / "archives" / "activites"))
+
+# En-tetes X-DB-Queries / X-DB-Time / Server-Timing sur chaque reponse (voir core/metrics.py).
+METRIQUES_ENTETES = os.getenv("DJANGO_METRIQUES_ENTETES", str(DEBUG)) == "True"
+
 CORS_ALLOW_ALL_ORIGINS = DEBUG
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOWED_ORIGINS = [
@@ -1,3 +1,4 @@
+from django.http import HttpResponse
 from django.utils import timezone
 from django.db import models
 from rest_framework import status
@@ -7,12 +8,13 @@ from rest_framework.response import Response
 
 from emprunts.models import Reservation, Penalite, StatutReservation
 from ouvrages.models import Ebook
-from users.views import IsAdminOrBibliothecaire
+from users.views import IsAdmin, IsAdminOrBibliothecaire
 from django.contrib.auth import get_user_model
 from .models import Paiement, StatutPaiement, TypePaiement
 from .serializers import PaiementSerializer, MessageSerializer
 from users.views import get_user_role, UserRole
 from .models import Message
+from .metrics import registre_metriques
 
 User = get_user_model()
 
@@ -52,7 +54,7 @@ def payer(request, paiement_id: int):
         return Response(PaiementSerializer(paiement).data, status=status.HTTP_200_OK)
 
     is_staff = IsAdminOrBibliothecaire().has_permission(request, None)
-    if paiement.user != request.user and not is_staff:
+    if paiement.user_id != request.user.id and not is_staff:
         return Response({"detail": "Acces interdit."}, status=status.HTTP_403_FORBIDDEN)
 
     paiement.statut = StatutPaiement.PAYE
@@ -116,3 +118,11 @@ def messages(request):
         contenu=contenu,
     )
     return Response(MessageSerializer(message).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdmin])
+def metriques(request):
+    # Ce que ca fait: histogrammes par route (latence, temps DB, nombre de requetes SQL) du processus.
+    # Reponse: format texte Prometheus.
+    return HttpResponse(registre_metriques.exporter(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,79 @@
+# Role de ce fichier: caches en memoire de processus (TTL + invalidation).
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheProcessus:
+    # Valeur unique chargee a la demande et gardee `ttl` secondes dans le processus.
+    # Les valeurs servies sont partagees entre threads: a traiter en lecture seule.
+    def __init__(self, chargeur, ttl: float):
+        self._chargeur = chargeur
+        self.ttl = ttl
+        self._valeur = None
+        self._expire_a = 0.0
+        self._lock = threading.RLock()
+
+    def get(self):
+        valeur, expire_a = self._valeur, self._expire_a
+        if valeur is not None and time.monotonic() < expire_a:
+            return valeur
+        with self._lock:
+            if self._valeur is None or time.monotonic() >= self._expire_a:
+                self._valeur = self._chargeur()
+                self._expire_a = time.monotonic() + self.ttl
+            return self._valeur
+
+    def peek(self):
+        # Valeur deja chargee et valide, sans declencher de chargement.
+        if self._valeur is not None and time.monotonic() < self._expire_a:
+            return self._valeur
+        return None
+
+    def invalider(self) -> None:
+        with self._lock:
+            self._valeur = None
+            self._expire_a = 0.0
+
+
+class CacheLRU:
+    # Cache cle -> valeur borne a `taille` entrees (moins recemment lue evincee), TTL par entree.
+    def __init__(self, taille: int, ttl: float):
+        self.taille = taille
+        self.ttl = ttl
+        self._entrees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cle):
+        with self._lock:
+            entree = self._entrees.get(cle)
+            if entree is None:
+                return None
+            valeur, expire_a = entree
+            if time.monotonic() >= expire_a:
+                del self._entrees[cle]
+                return None
+            self._entrees.move_to_end(cle)
+            return valeur
+
+    def set(self, cle, valeur) -> None:
+        with self._lock:
+            self._entrees[cle] = (valeur, time.monotonic() + self.ttl)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille:
+                self._entrees.popitem(last=False)
+
+    def invalider(self, *cles) -> None:
+        with self._lock:
+            for cle in cles:
+                self._entrees.pop(cle, None)
+
+    def invalider_si(self, predicat) -> None:
+        # Retire les entrees dont la valeur verifie `predicat` (parcours en memoire, sans chargement).
+        with self._lock:
+            for cle in [cle for cle, (valeur, _) in self._entrees.items() if predicat(valeur)]:
+                del self._entrees[cle]
+
+    def vider(self) -> None:
+        with self._lock:
+            self._entrees.clear()
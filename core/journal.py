@@ -0,0 +1,155 @@
+# Role de ce fichier: retention du journal d'activites (partitions mensuelles PostgreSQL + archives JSONL).
+import gzip
+import json
+import os
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import Activity
+
+TABLE_ACTIVITES = Activity._meta.db_table
+PARTITION_DEFAUT = f"{TABLE_ACTIVITES}_defaut"
+# Partitions creees a l'avance (mois courant + N), pour que la partition par defaut reste vide.
+MOIS_D_AVANCE = 3
+TAILLE_LOT_ARCHIVE = 2000
+
+
+def debut_mois(annee: int, mois: int) -> datetime:
+    # Bornes de partition en UTC (created_at est un timestamptz).
+    return datetime(annee + (mois - 1) // 12, (mois - 1) % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def mois_suivant(debut: datetime) -> datetime:
+    return debut_mois(debut.year, debut.month + 1)
+
+
+def nom_partition(debut: datetime) -> str:
+    return f"{TABLE_ACTIVITES}_p{debut:%Y%m}"
+
+
+def _est_partitionnee(connection) -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE_ACTIVITES])
+        return cursor.fetchone() is not None
+
+
+def _partitions_existantes(connection) -> set:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [TABLE_ACTIVITES],
+        )
+        return {ligne[0] for ligne in cursor.fetchall()}
+
+
+def _creer_partition(connection, debut: datetime) -> None:
+    # Partition du mois; les lignes du mois deja tombees dans la partition par defaut (tache
+    # manquee, date anterieure) y sont deplacees, sinon PostgreSQL refuse la creation.
+    fin = mois_suivant(debut)
+    nom = nom_partition(debut)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM "{PARTITION_DEFAUT}" WHERE created_at >= %s AND created_at < %s)',
+            [debut, fin],
+        )
+        a_deplacer = cursor.fetchone()[0]
+        if a_deplacer:
+            cursor.execute(f'ALTER TABLE "{TABLE_ACTIVITES}" DETACH PARTITION "{PARTITION_DEFAUT}"')
+        cursor.execute(
+            f'CREATE TABLE "{nom}" PARTITION OF "{TABLE_ACTIVITES}" FOR VALUES FROM (%s) TO (%s)',
+            [debut, fin],
+        )
+        if a_deplacer:
+            cursor.execute(
+                f'INSERT INTO "{nom}" SELECT * FROM "{PARTITION_DEFAUT}" WHERE created_at >= %s AND created_at < %s',
+                [debut, fin],
+            )
+            cursor.execute(
+                f'DELETE FROM "{PARTITION_DEFAUT}" WHERE created_at >= %s AND created_at < %s',
+                [debut, fin],
+            )
+            cursor.execute(f'ALTER TABLE "{TABLE_ACTIVITES}" ATTACH PARTITION "{PARTITION_DEFAUT}" DEFAULT')
+
+
+def assurer_partitions(mois_d_avance: int = MOIS_D_AVANCE, using: str = "default") -> list:
+    # Cree les partitions mensuelles manquantes jusqu'a mois courant + `mois_d_avance`.
+    # Retourne les noms crees (liste vide hors PostgreSQL ou si la table n'est pas partitionnee).
+    connection = connections[using]
+    if not _est_partitionnee(connection):
+        return []
+    existantes = _partitions_existantes(connection)
+    maintenant = timezone.now()
+    creees = []
+    for decalage in range(mois_d_avance + 1):
+        debut = debut_mois(maintenant.year, maintenant.month + decalage)
+        nom = nom_partition(debut)
+        if nom in existantes:
+            continue
+        # Une transaction par mois: la partition par defaut n'est jamais laissee detachee.
+        with transaction.atomic(using=using):
+            _creer_partition(connection, debut)
+        creees.append(nom)
+    return creees
+
+
+def _exporter(qs, chemin: Path) -> int:
+    # Ecrit dans un fichier temporaire puis renomme: une archive presente est toujours complete.
+    temporaire = chemin.with_name(chemin.name + ".tmp")
+    nombre = 0
+    with gzip.open(temporaire, "wt", encoding="utf-8") as fichier:
+        for ligne in qs.values("id", "type", "message", "user_id", "created_at").order_by("id").iterator(
+            chunk_size=TAILLE_LOT_ARCHIVE
+        ):
+            ligne["created_at"] = ligne["created_at"].isoformat()
+            fichier.write(json.dumps(ligne, ensure_ascii=False) + "\n")
+            nombre += 1
+    os.replace(temporaire, chemin)
+    return nombre
+
+
+def archiver_activites(*, avant: datetime, dossier, using: str = "default") -> list:
+    # Archive puis retire du journal chaque mois entierement anterieur a `avant`.
+    # Un fichier gzip JSONL par mois (activites-AAAA-MM.jsonl.gz); sur PostgreSQL la partition
+    # du mois est detachee et supprimee, ailleurs les lignes sont supprimees par plage.
+    # Retourne [(mois "AAAA-MM", nombre de lignes, chemin)].
+    connection = connections[using]
+    dossier = Path(dossier)
+    dossier.mkdir(parents=True, exist_ok=True)
+    avant = debut_mois(avant.year, avant.month)
+    activites = Activity.objects.using(using)
+    plus_ancienne = activites.filter(created_at__lt=avant).order_by("created_at").values_list(
+        "created_at", flat=True
+    ).first()
+    if plus_ancienne is None:
+        return []
+
+    partitions = _partitions_existantes(connection) if _est_partitionnee(connection) else set()
+    resultats = []
+    debut = debut_mois(plus_ancienne.year, plus_ancienne.month)
+    while debut < avant:
+        fin = mois_suivant(debut)
+        du_mois = activites.filter(created_at__gte=debut, created_at__lt=fin)
+        chemin = dossier / f"activites-{debut:%Y-%m}.jsonl.gz"
+        partition = nom_partition(debut) if nom_partition(debut) in partitions else None
+        # Le verrou bloque les insertions du mois (improbables) entre export et suppression.
+        with transaction.atomic(using=using):
+            if partition:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LOCK TABLE "{partition}" IN SHARE MODE')
+            if du_mois.exists():
+                nombre = _exporter(du_mois, chemin)
+                if partition:
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'ALTER TABLE "{TABLE_ACTIVITES}" DETACH PARTITION "{partition}"')
+                        cursor.execute(f'DROP TABLE "{partition}"')
+                # Lignes hors partition mensuelle (partition par defaut, autres moteurs).
+                du_mois.delete()
+                resultats.append((f"{debut:%Y-%m}", nombre, chemin))
+        debut = fin
+    return resultats
@@ -0,0 +1,37 @@
+# Role de ce fichier: commande d'archivage des mois anciens du journal d'activites.
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.journal import archiver_activites, assurer_partitions, debut_mois
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive (gzip JSONL) puis retire du journal les activites plus anciennes que la retention; "
+        "sur PostgreSQL, cree aussi les partitions mensuelles a venir."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mois",
+            type=int,
+            default=getattr(settings, "ACTIVITES_RETENTION_MOIS", 12),
+            help="Mois complets conserves en base, en plus du mois courant.",
+        )
+        parser.add_argument(
+            "--dossier",
+            default=getattr(settings, "ACTIVITES_ARCHIVE_DIR", settings.BASE_DIR / "archives" / "activites"),
+        )
+
+    def handle(self, *args, **options):
+        creees = assurer_partitions()
+        if creees:
+            self.stdout.write(f"Partitions creees: {', '.join(creees)}.")
+
+        maintenant = timezone.now()
+        avant = debut_mois(maintenant.year, maintenant.month - max(0, options["mois"]))
+        archives = archiver_activites(avant=avant, dossier=options["dossier"])
+        for mois, nombre, chemin in archives:
+            self.stdout.write(f"{mois}: {nombre} activite(s) -> {chemin}")
+        self.stdout.write(self.style.SUCCESS(f"Mois archives: {len(archives)}."))
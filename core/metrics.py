@@ -0,0 +1,126 @@
+# Role de ce fichier: instrumentation des requetes HTTP (nombre de requetes SQL, temps DB, latence).
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+# Bornes des histogrammes (format Prometheus: "le" = inferieur ou egal).
+BORNES_SECONDES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BORNES_REQUETES_SQL = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRIQUES = {
+    "http_request_duration_seconds": ("Latence totale de la requete HTTP.", BORNES_SECONDES),
+    "db_time_per_request_seconds": ("Temps passe en base par requete HTTP.", BORNES_SECONDES),
+    "db_queries_per_request": ("Nombre de requetes SQL par requete HTTP.", BORNES_REQUETES_SQL),
+}
+
+
+class Histogramme:
+    def __init__(self, bornes: tuple):
+        self.bornes = bornes
+        self.compteurs = [0] * (len(bornes) + 1)
+        self.somme = 0.0
+        self.nombre = 0
+
+    def observer(self, valeur: float) -> None:
+        position = next((i for i, borne in enumerate(self.bornes) if valeur <= borne), len(self.bornes))
+        self.compteurs[position] += 1
+        self.somme += valeur
+        self.nombre += 1
+
+
+def _libelles(libelles: tuple) -> str:
+    echappes = []
+    for nom, valeur in libelles:
+        valeur = str(valeur).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        echappes.append(f'{nom}="{valeur}"')
+    return ",".join(echappes)
+
+
+class RegistreMetriques:
+    # Histogrammes par (metrique, libelles), agreges dans le processus (un registre par worker).
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observer(self, nom: str, libelles: tuple, valeur: float) -> None:
+        with self._lock:
+            histogramme = self._series.get((nom, libelles))
+            if histogramme is None:
+                histogramme = self._series[(nom, libelles)] = Histogramme(METRIQUES[nom][1])
+            histogramme.observer(valeur)
+
+    def vider(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def exporter(self) -> str:
+        # Format texte d'exposition Prometheus (version 0.0.4).
+        with self._lock:
+            series = sorted(
+                (nom, libelles, list(h.compteurs), h.somme, h.nombre, h.bornes)
+                for (nom, libelles), h in self._series.items()
+            )
+        lignes = []
+        for nom, (aide, _) in METRIQUES.items():
+            lignes.append(f"# HELP {nom} {aide}")
+            lignes.append(f"# TYPE {nom} histogram")
+            for nom_serie, libelles, compteurs, somme, nombre, bornes in series:
+                if nom_serie != nom:
+                    continue
+                cumul = 0
+                for borne, compteur in zip(list(bornes) + ["+Inf"], compteurs):
+                    cumul += compteur
+                    lignes.append(f"{nom}_bucket{{{_libelles(libelles + (('le', borne),))}}} {cumul}")
+                lignes.append(f"{nom}_sum{{{_libelles(libelles)}}} {somme}")
+                lignes.append(f"{nom}_count{{{_libelles(libelles)}}} {nombre}")
+        return "\n".join(lignes) + "\n"
+
+
+registre_metriques = RegistreMetriques()
+
+
+class CompteurRequetesSQL:
+    # execute_wrapper: compte les requetes et cumule leur duree (connexions du thread courant).
+    def __init__(self):
+        self.nombre = 0
+        self.duree = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duree += time.perf_counter() - debut
+            self.nombre += 1
+
+
+class MetriquesRequetesMiddleware:
+    # Mesure chaque requete HTTP; libelle = route Django (ex: "api/emprunts/<int:emprunt_id>/retour/").
+    # Avec METRIQUES_ENTETES, ajoute X-DB-Queries, X-DB-Time (ms) et Server-Timing a la reponse.
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        compteur = CompteurRequetesSQL()
+        debut = time.perf_counter()
+        with ExitStack() as pile:
+            # Objets connexion du thread (sans ouvrir de connexion a la base).
+            for connection in connections.all():
+                pile.enter_context(connection.execute_wrapper(compteur))
+            response = self.get_response(request)
+        duree = time.perf_counter() - debut
+
+        match = getattr(request, "resolver_match", None)
+        libelles = (("route", match.route if match else "non_resolue"), ("method", request.method))
+        registre_metriques.observer("http_request_duration_seconds", libelles, duree)
+        registre_metriques.observer("db_time_per_request_seconds", libelles, compteur.duree)
+        registre_metriques.observer("db_queries_per_request", libelles, compteur.nombre)
+
+        if getattr(settings, "METRIQUES_ENTETES", False):
+            response["X-DB-Queries"] = str(compteur.nombre)
+            response["X-DB-Time"] = f"{compteur.duree * 1000:.1f}"
+            response["Server-Timing"] = f"db;dur={compteur.duree * 1000:.1f}, total;dur={duree * 1000:.1f}"
+        return response
@@ -0,0 +1,116 @@
+import re
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Journal d'activites partitionne par mois sur PostgreSQL (PARTITION BY RANGE (created_at)).
+# La table est recreee sous le meme nom et les donnees recopiees; la cle primaire devient
+# (id, created_at), la cle de partition devant en faire partie (Django ne lit que id).
+# L'id est alimente par une sequence ordinaire (bigserial) plutot qu'une colonne identite.
+# Partitions suivantes: core/journal.py (commande archiver_activites). Autres moteurs: inchange.
+TABLE = "core_activity"
+ANCIENNE = "core_activity_ancienne"
+PARTITION_DEFAUT = "core_activity_defaut"
+MOIS_D_AVANCE = 3
+
+
+def _debut_mois(annee, mois):
+    return datetime(annee + (mois - 1) // 12, (mois - 1) % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def _creer_partitions(schema_editor, cursor):
+    cursor.execute(f"SELECT min(created_at) FROM {ANCIENNE}")
+    maintenant = datetime.now(timezone.utc)
+    premier = cursor.fetchone()[0] or maintenant
+    debut = _debut_mois(premier.year, premier.month)
+    dernier = _debut_mois(maintenant.year, maintenant.month + MOIS_D_AVANCE)
+    while debut <= dernier:
+        fin = _debut_mois(debut.year, debut.month + 1)
+        schema_editor.execute(
+            f"CREATE TABLE {TABLE}_p{debut:%Y%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+            [debut, fin],
+        )
+        debut = fin
+    schema_editor.execute(f"CREATE TABLE {PARTITION_DEFAUT} PARTITION OF {TABLE} DEFAULT")
+
+
+def _recreer_table(schema_editor, partitionnee):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        schema_editor.execute(f"ALTER TABLE {TABLE} RENAME TO {ANCIENNE}")
+        cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [ANCIENNE])
+        schema_editor.execute(f"ALTER TABLE {ANCIENNE} RENAME CONSTRAINT {cursor.fetchone()[0]} TO {ANCIENNE}_pkey")
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+            [ANCIENNE, f"{ANCIENNE}_pkey"],
+        )
+        index = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [ANCIENNE],
+        )
+        cles_etrangeres = cursor.fetchall()
+        cursor.execute("SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'", [ANCIENNE])
+        identite = bool(cursor.fetchone()[0])
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [ANCIENNE])
+        sequence = cursor.fetchone()[0]
+        if identite or not sequence:
+            # Pas de colonne identite sur la table partitionnee (non supportee avant PostgreSQL 17):
+            # une sequence ordinaire (bigserial), partagee par toutes les partitions.
+            if identite:
+                schema_editor.execute(f"ALTER TABLE {ANCIENNE} ALTER COLUMN id DROP IDENTITY")
+            sequence = f"{TABLE}_id_seq"
+            schema_editor.execute(f"CREATE SEQUENCE {sequence} AS bigint")
+
+        partition = " PARTITION BY RANGE (created_at)" if partitionnee else ""
+        schema_editor.execute(f"CREATE TABLE {TABLE} (LIKE {ANCIENNE} INCLUDING DEFAULTS){partition}")
+        schema_editor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{sequence}'::regclass)")
+        cle = "id, created_at" if partitionnee else "id"
+        schema_editor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({cle})")
+        for nom, definition in cles_etrangeres:
+            schema_editor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {nom} {definition}")
+        if partitionnee:
+            _creer_partitions(schema_editor, cursor)
+
+        schema_editor.execute(f"INSERT INTO {TABLE} SELECT * FROM {ANCIENNE}")
+        # Sequence placee apres le dernier id recopie; elle doit survivre a la suppression de l'ancienne table.
+        schema_editor.execute(
+            f"SELECT setval('{sequence}'::regclass, COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)"
+        )
+        schema_editor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id")
+
+        schema_editor.execute(f"DROP TABLE {ANCIENNE}")
+        for nom, definition in index:
+            schema_editor.execute(re.sub(rf" ON (ONLY )?(\S+\.)?{ANCIENNE} ", f" ON {TABLE} ", definition))
+
+
+def partitionner(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    _recreer_table(schema_editor, partitionnee=True)
+
+
+def departitionner(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    _recreer_table(schema_editor, partitionnee=False)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0006_activity_created_at_default"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(partitionner, departitionner),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(fields=["created_at", "id"], name="activity_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(fields=["user", "created_at", "id"], name="activity_user_created_idx"),
+        ),
+    ]
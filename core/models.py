@@ -1,9 +1,13 @@
 # Role de ce fichier: modele et helpers de base (parametres systeme, activites).
-from typing import Optional
+from typing import Iterable, List, Optional
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+
+from .cache import CacheProcessus
+from .tampon import TamponEcriture
 
 class Parametre(models.Model):
     # Parametres systeme: penalites, duree, quota emprunts.
@@ -43,7 +47,16 @@ class Activity(models.Model):
         blank=True,
         related_name="activities",
     )
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Horodatage a la creation de l'objet (et non a l'insertion, qui peut etre differee).
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        # Fil d'activites (tri -created_at, -id), global ou par utilisateur.
+        # Sur PostgreSQL la table est partitionnee par mois (voir migration 0007, core/journal.py).
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="activity_created_idx"),
+            models.Index(fields=["user", "created_at", "id"], name="activity_user_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.type} - {self.message}"
@@ -77,6 +90,12 @@ class Paiement(models.Model):
     )
     date_paiement = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Controle "deja paye" (ex: telechargement d'un ebook payant).
+            models.Index(fields=["user", "type", "reference_objet", "statut"], name="paiement_lookup_idx"),
+        ]
+
     def __str__(self):
         return f"Paiement {self.type} #{self.reference_objet} - {self.statut}"
 
@@ -97,6 +116,12 @@ class Message(models.Model):
     contenu = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Fil des messages (tri -created_at).
+            models.Index(fields=["created_at"], name="message_created_idx"),
+        ]
+
     def __str__(self):
         return f"Message {self.sender_id} -> {self.recipient_id or 'staff'}"
 
@@ -104,7 +129,44 @@ class Message(models.Model):
 User = get_user_model()
 
 
+def _charger_parametres() -> Parametre:
+    # Utilise une seule ligne (id=1) pour les parametres systeme.
+    p, _ = Parametre.objects.get_or_create(id=1)
+    return p
+
+
+# Cache processus des parametres, invalide par signal (voir core/signals.py).
+parametres_cache = CacheProcessus(
+    _charger_parametres,
+    ttl=getattr(settings, "PARAMETRES_CACHE_TTL", 60),
+)
+
+
+# Journal ecrit hors du chemin critique quand ACTIVITES_ASYNC est actif.
+tampon_activites = TamponEcriture(
+    lambda lot: Activity.objects.bulk_create(lot),
+    taille_lot=getattr(settings, "ACTIVITES_TAMPON_TAILLE", 100),
+    intervalle=getattr(settings, "ACTIVITES_TAMPON_INTERVALLE", 1.0),
+)
+
+
+def _enregistrer_activites(activites: List[Activity]) -> List[Activity]:
+    # Synchrone (tests, dev): insertion immediate.
+    # Asynchrone: mise en tampon au commit (rien si la transaction est annulee).
+    if not getattr(settings, "ACTIVITES_ASYNC", False):
+        return Activity.objects.bulk_create(activites)
+    transaction.on_commit(lambda: tampon_activites.ajouter(activites))
+    return activites
+
+
 # Helper: enregistre une activite systeme.
 def log_activity(*, type: str, message: str, user: Optional[User] = None) -> Activity:
     # Permissions: gerees par les vues qui appellent cette fonction.
-    return Activity.objects.create(type=type, message=message, user=user)
+    # En mode asynchrone, l'activite retournee n'est pas encore en base.
+    return _enregistrer_activites([Activity(type=type, message=message, user=user)])[0]
+
+
+# Helper: enregistre plusieurs activites en une seule insertion groupee.
+def log_activities(activites: Iterable[dict]) -> List[Activity]:
+    # Chaque element: { type, message, user ou user_id }.
+    return _enregistrer_activites([Activity(**a) for a in activites])
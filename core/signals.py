@@ -0,0 +1,14 @@
+# Role de ce fichier: signaux du core (invalidation des caches processus).
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Parametre, parametres_cache
+
+
+@receiver(post_save, sender=Parametre)
+@receiver(post_delete, sender=Parametre)
+def invalider_parametres(sender, **kwargs):
+    # Invalide tout de suite (meme connexion) puis au commit (autres threads).
+    parametres_cache.invalider()
+    transaction.on_commit(parametres_cache.invalider)
@@ -0,0 +1,54 @@
+# Role de ce fichier: tampon d'ecriture differee (file en memoire + thread d'ecriture).
+import atexit
+import logging
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class TamponEcriture:
+    # Objets en attente, passes par lots a `ecrire` (ex: bulk_create) depuis un thread
+    # dedie, des que `taille_lot` est atteinte ou au plus tard toutes les `intervalle` secondes.
+    def __init__(self, ecrire, taille_lot: int, intervalle: float):
+        self._ecrire = ecrire
+        self.taille_lot = taille_lot
+        self.intervalle = intervalle
+        self._en_attente = []
+        self._lock = threading.Lock()
+        self._reveil = threading.Event()
+        self._thread = None
+        atexit.register(self.vider)
+
+    def ajouter(self, objets) -> None:
+        with self._lock:
+            self._en_attente.extend(objets)
+            plein = len(self._en_attente) >= self.taille_lot
+            # Demarrage paresseux (et apres un fork: le thread du parent n'existe plus).
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._boucle, name="tampon-ecriture", daemon=True)
+                self._thread.start()
+        if plein:
+            self._reveil.set()
+
+    def vider(self) -> int:
+        # Ecrit tout ce qui est en attente; retourne le nombre d'objets ecrits.
+        with self._lock:
+            lot, self._en_attente = self._en_attente, []
+        if not lot:
+            return 0
+        try:
+            self._ecrire(lot)
+        except Exception:
+            # Le journal n'est pas critique: on trace l'echec sans bloquer les suivants.
+            logger.exception("Echec d'ecriture differee de %s objet(s).", len(lot))
+            return 0
+        return len(lot)
+
+    def _boucle(self) -> None:
+        while True:
+            self._reveil.wait(self.intervalle)
+            self._reveil.clear()
+            close_old_connections()
+            self.vider()
@@ -1,3 +1,204 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from ouvrages.models import Ouvrage
+from users.models import UserProfile, UserRole
+
+from .journal import archiver_activites, assurer_partitions, debut_mois, nom_partition
+from .metrics import registre_metriques
+from .models import Activity, ActivityType, User, log_activities, log_activity, tampon_activites
+from .tampon import TamponEcriture
+from .views import apply_ordering, paginate_queryset
+
+
+def drf_request(**params):
+    return Request(APIRequestFactory().get("/", params))
+
+
+class KeysetPaginationTests(TestCase):
+    def parcourir(self, qs_factory, **params):
+        # Suit les curseurs "next" puis "previous"; retourne les deux listes d'ids.
+        avant, cursor = [], ""
+        while cursor is not None:
+            items, meta = paginate_queryset(qs_factory(cursor=cursor, **params), drf_request(cursor=cursor, **params), default_page_size=2)
+            avant.extend(obj.id for obj in items)
+            dernier_previous, cursor = meta["previous"], meta["next"]
+
+        arriere, cursor = list(avant[-len(items):]), dernier_previous
+        while cursor is not None:
+            items, meta = paginate_queryset(qs_factory(cursor=cursor, **params), drf_request(cursor=cursor, **params), default_page_size=2)
+            arriere[:0] = [obj.id for obj in items]
+            cursor = meta["previous"]
+        return avant, arriere
+
+    def test_curseur_parcourt_sans_count_avec_egalites(self):
+        for i in range(5):
+            Activity.objects.create(type=ActivityType.OUVRAGE_AJOUTE, message=f"a{i}")
+        Activity.objects.update(created_at=Activity.objects.first().created_at)
+        attendu = list(Activity.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+        def qs_factory(**params):
+            return apply_ordering(Activity.objects.all(), drf_request(**params), ["created_at"], "-created_at")
+
+        with CaptureQueriesContext(connection) as ctx:
+            avant, arriere = self.parcourir(qs_factory)
+        self.assertEqual(avant, attendu)
+        self.assertEqual(arriere, attendu)
+        self.assertFalse(any("COUNT(" in q["sql"].upper() for q in ctx.captured_queries))
+
+    def test_curseur_colonne_nullable(self):
+        for i, annee in enumerate([2000, None, 1990, None, 2010]):
+            Ouvrage.objects.create(isbn=f"97803064061{i:02d}", titre=f"T{i}", auteur="A", categorie="C", annee=annee)
+
+        def qs_factory(**params):
+            return apply_ordering(Ouvrage.objects.all(), drf_request(**params), ["annee"], "annee")
+
+        avant, arriere = self.parcourir(qs_factory, ordering="annee")
+        annees = [Ouvrage.objects.get(id=i).annee for i in avant]
+        self.assertEqual(annees, [1990, 2000, 2010, None, None])
+        self.assertEqual(arriere, avant)
+
+    def test_curseur_invalide(self):
+        with self.assertRaises(ValidationError):
+            paginate_queryset(Activity.objects.order_by("-created_at"), drf_request(cursor="pas-un-curseur"))
+
+
+class TamponEcritureTests(SimpleTestCase):
+    def test_ecriture_par_lot_et_par_intervalle(self):
+        ecrits, lot_recu = [], threading.Event()
+
+        def ecrire(lot):
+            ecrits.append(list(lot))
+            lot_recu.set()
+
+        # Seuil de taille: le thread est reveille sans attendre l'intervalle.
+        tampon = TamponEcriture(ecrire, taille_lot=3, intervalle=3600)
+        tampon.ajouter([1, 2])
+        self.assertEqual(ecrits, [])
+        tampon.ajouter([3])
+        self.assertTrue(lot_recu.wait(5))
+        self.assertEqual(ecrits, [[1, 2, 3]])
+
+        # Intervalle: un lot incomplet finit par partir.
+        lot_recu.clear()
+        tampon = TamponEcriture(ecrire, taille_lot=100, intervalle=0.01)
+        tampon.ajouter([4])
+        self.assertTrue(lot_recu.wait(5))
+        self.assertEqual(ecrits[-1], [4])
+
+    def test_echec_d_ecriture_n_interrompt_pas_le_tampon(self):
+        tampon = TamponEcriture(mock.Mock(side_effect=RuntimeError), taille_lot=100, intervalle=3600)
+        tampon._en_attente.append(1)
+        with self.assertLogs("core.tampon", level="ERROR"):
+            self.assertEqual(tampon.vider(), 0)
+        self.assertEqual(tampon._en_attente, [])
+
+
+class JournalActivitesTests(TestCase):
+    def test_mode_synchrone_insere_immediatement(self):
+        log_activity(type=ActivityType.OUVRAGE_AJOUTE, message="sync")
+        self.assertTrue(Activity.objects.filter(message="sync").exists())
+
+    @override_settings(ACTIVITES_ASYNC=True)
+    def test_mode_asynchrone_hors_du_chemin_critique(self):
+        with mock.patch.object(tampon_activites, "ajouter") as ajouter:
+            with self.assertNumQueries(0), self.captureOnCommitCallbacks(execute=True):
+                log_activity(type=ActivityType.OUVRAGE_AJOUTE, message="a")
+                log_activities([{"type": ActivityType.OUVRAGE_AJOUTE, "message": "b"}])
+                # Mis en tampon au commit seulement.
+                ajouter.assert_not_called()
+        self.assertEqual([[a.message for a in appel.args[0]] for appel in ajouter.call_args_list], [["a"], ["b"]])
+        self.assertFalse(Activity.objects.exists())
+
+    def test_archivage_par_mois(self):
+        maintenant = timezone.now()
+        courant = debut_mois(maintenant.year, maintenant.month)
+        ancien = debut_mois(maintenant.year, maintenant.month - 3)
+        for i, date in enumerate([ancien, ancien + timedelta(days=2), courant]):
+            Activity.objects.create(type=ActivityType.OUVRAGE_AJOUTE, message=f"a{i}", created_at=date)
+
+        with tempfile.TemporaryDirectory() as dossier:
+            archives = archiver_activites(avant=courant, dossier=dossier)
+            self.assertEqual([(mois, nombre) for mois, nombre, _ in archives], [(f"{ancien:%Y-%m}", 2)])
+            with gzip.open(Path(dossier) / f"activites-{ancien:%Y-%m}.jsonl.gz", "rt", encoding="utf-8") as fichier:
+                lignes = [json.loads(ligne) for ligne in fichier]
+            self.assertEqual([ligne["message"] for ligne in lignes], ["a0", "a1"])
+            self.assertEqual(archiver_activites(avant=courant, dossier=dossier), [])
+        self.assertEqual(list(Activity.objects.values_list("message", flat=True)), ["a2"])
+
+    def test_partition_creee_apres_lignes_dans_la_partition_par_defaut(self):
+        # Chemin PostgreSQL simule: le mois courant a deja des lignes dans la partition par defaut,
+        # le mois suivant non. Seul le premier passe par detachement / deplacement / rattachement.
+        maintenant = timezone.now()
+        courant = debut_mois(maintenant.year, maintenant.month)
+        suivant = debut_mois(maintenant.year, maintenant.month + 1)
+        base = mock.MagicMock()
+        cursor = base.cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [(True,), (False,)]
+        with mock.patch("core.journal.connections", {"default": base}), \
+                mock.patch("core.journal._est_partitionnee", return_value=True), \
+                mock.patch("core.journal._partitions_existantes", return_value=set()):
+            creees = assurer_partitions(mois_d_avance=1)
+
+        self.assertEqual(creees, [nom_partition(courant), nom_partition(suivant)])
+        requetes = [" ".join(appel.args[0].split()[:3]) for appel in cursor.execute.call_args_list]
+        self.assertEqual(
+            requetes,
+            [
+                "SELECT EXISTS (SELECT",
+                'ALTER TABLE "core_activity"',
+                f'CREATE TABLE "{nom_partition(courant)}"',
+                f'INSERT INTO "{nom_partition(courant)}"',
+                'DELETE FROM "core_activity_defaut"',
+                'ALTER TABLE "core_activity"',
+                "SELECT EXISTS (SELECT",
+                f'CREATE TABLE "{nom_partition(suivant)}"',
+            ],
+        )
+        sql = [appel.args[0] for appel in cursor.execute.call_args_list]
+        self.assertIn('DETACH PARTITION "core_activity_defaut"', sql[1])
+        self.assertIn('ATTACH PARTITION "core_activity_defaut" DEFAULT', sql[5])
+        self.assertEqual(cursor.execute.call_args_list[3].args[1], [courant, suivant])
+
+
+class MetriquesTests(TestCase):
+    def setUp(self):
+        registre_metriques.vider()
+        self.admin = User.objects.create_user(username="admin", password="pass")
+        UserProfile.objects.create(user=self.admin, role=UserRole.ADMIN)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    @override_settings(METRIQUES_ENTETES=True)
+    def test_entetes_et_histogrammes_par_route(self):
+        ouvrage = Ouvrage.objects.create(isbn="9780306406157", titre="T", auteur="A", categorie="C")
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get(f"/api/catalogue/ouvrages/{ouvrage.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-DB-Queries"], str(len(requetes)))
+        self.assertIn("db;dur=", response["Server-Timing"])
+
+        texte = self.client.get("/api/ops/metrics/").content.decode()
+        libelles = 'route="api/catalogue/ouvrages/<int:ouvrage_id>/",method="GET"'
+        self.assertIn(f"db_queries_per_request_count{{{libelles}}} 1", texte)
+        self.assertIn(f'db_queries_per_request_bucket{{{libelles},le="+Inf"}} 1', texte)
+        self.assertIn("# TYPE http_request_duration_seconds histogram", texte)
+
+    def test_reserve_aux_admins(self):
+        lecteur = User.objects.create_user(username="lecteur", password="pass")
+        UserProfile.objects.create(user=lecteur, role=UserRole.LECTEUR)
+        self.client.force_authenticate(lecteur)
+        self.assertEqual(self.client.get("/api/ops/metrics/").status_code, 403)
@@ -1,9 +1,10 @@
 from django.urls import path
 
-from .api import initier_paiement, payer, messages
+from .api import initier_paiement, payer, messages, metriques
 
 urlpatterns = [
     path("api/paiements/initier/", initier_paiement),
     path("api/paiements/<int:paiement_id>/payer/", payer),
     path("api/messages/", messages),
+    path("api/ops/metrics/", metriques),
 ]
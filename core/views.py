@@ -1,5 +1,13 @@
 # Role de ce fichier: utilitaires partages pour les vues DRF (tri, pagination).
+import base64
+import binascii
+import datetime
+import json
 import math
+from decimal import Decimal
+
+from django.db.models import F, Q
+from rest_framework.exceptions import ValidationError
 
 
 # Utilitaire: applique un tri controle depuis la query string.
@@ -15,20 +23,27 @@ def apply_ordering(qs, request, allowed_fields, default):
     return qs.order_by(ordering)
 
 
+def _page_size(request, default_page_size, max_page_size):
+    try:
+        page_size = int(request.query_params.get("page_size", default_page_size))
+    except ValueError:
+        page_size = default_page_size
+    return max(1, min(page_size, max_page_size))
+
+
 # Utilitaire: pagination simple pour reponses API.
 def paginate_queryset(qs, request, *, default_page_size=10, max_page_size=100):
     # Payload: ?page=&page_size= ; Reponse: (items, meta pagination).
+    # Mode curseur (opt-in): ?cursor= (vide pour la premiere page), voir paginate_keyset.
+    page_size = _page_size(request, default_page_size, max_page_size)
+    if "cursor" in request.query_params:
+        return paginate_keyset(qs, request.query_params.get("cursor"), page_size)
+
     try:
         page = int(request.query_params.get("page", 1))
     except ValueError:
         page = 1
-    try:
-        page_size = int(request.query_params.get("page_size", default_page_size))
-    except ValueError:
-        page_size = default_page_size
-
     page = max(page, 1)
-    page_size = max(1, min(page_size, max_page_size))
 
     total = qs.count()
     pages = max(1, math.ceil(total / page_size))
@@ -38,3 +53,129 @@ def paginate_queryset(qs, request, *, default_page_size=10, max_page_size=100):
         qs[offset:offset + page_size],
         {"page": page, "page_size": page_size, "total": total, "pages": pages},
     )
+
+
+# -----------------------------
+# Pagination par curseur (keyset)
+# -----------------------------
+def _tri_keyset(qs):
+    # Colonne de tri posee par apply_ordering (+ id en departage).
+    ordering = [o for o in qs.query.order_by if isinstance(o, str)]
+    ordering = ordering[0] if ordering else "id"
+    field = ordering.lstrip("-")
+    if field in {"id", "pk"}:
+        field = None
+    return ordering, field, ordering.startswith("-")
+
+
+def _champ_nullable(model, path: str) -> bool:
+    # True si la colonne (ou une relation traversee) peut etre NULL.
+    for part in path.split("__"):
+        field = model._meta.get_field(part)
+        if field.null:
+            return True
+        model = field.related_model
+    return False
+
+
+def _valeur_tri(obj, field):
+    for part in field.split("__"):
+        obj = getattr(obj, part, None)
+        if obj is None:
+            return None
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return str(obj)
+    return obj
+
+
+def _encoder_curseur(ordering, value, pk, sens):
+    payload = json.dumps({"o": ordering, "v": value, "id": pk, "s": sens}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decoder_curseur(cursor, ordering):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+        valide = (
+            position["o"] == ordering
+            and position["s"] in {"n", "p"}
+            and isinstance(position["id"], int)
+        )
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        valide = False
+    if not valide:
+        raise ValidationError({"detail": "Curseur invalide."})
+    return position
+
+
+def _ordre(field, desc, nulls_last, nullable):
+    id_order = "-id" if desc else "id"
+    if field is None:
+        return [id_order]
+    expr = F(field).desc if desc else F(field).asc
+    if not nullable:
+        return [expr(), id_order]
+    return [expr(nulls_last=True) if nulls_last else expr(nulls_first=True), id_order]
+
+
+def _apres(field, desc, nulls_last, nullable, value, pk):
+    # Lignes strictement apres (value, pk) dans l'ordre (field, id).
+    cmp = "lt" if desc else "gt"
+    if field is None:
+        return Q(**{f"id__{cmp}": pk})
+    if value is None:
+        q = Q(**{f"{field}__isnull": True, f"id__{cmp}": pk})
+        if not nulls_last:
+            q |= Q(**{f"{field}__isnull": False})
+        return q
+    q = Q(**{f"{field}__{cmp}": value}) | Q(**{field: value, f"id__{cmp}": pk})
+    if nullable and nulls_last:
+        q |= Q(**{f"{field}__isnull": True})
+    return q
+
+
+# Utilitaire: pagination keyset sur la colonne de tri + id (sans COUNT ni OFFSET).
+def paginate_keyset(qs, cursor, page_size):
+    # Reponse: (items, { page_size, next, previous }) avec curseurs opaques.
+    # Les NULL sont places en fin de parcours; une page profonde coute comme la premiere.
+    ordering, field, desc = _tri_keyset(qs)
+    # Les annotations (ex: pertinence de recherche) sont calculees, jamais NULL ici.
+    nullable = (
+        field is not None
+        and field not in qs.query.annotations
+        and _champ_nullable(qs.model, field)
+    )
+    position = _decoder_curseur(cursor, ordering) if cursor else None
+
+    # Page precedente: on parcourt l'ordre inverse puis on remet la page a l'endroit.
+    reculer = position is not None and position["s"] == "p"
+    parcours_desc = desc != reculer
+    nulls_last = not reculer
+
+    qs = qs.order_by(*_ordre(field, parcours_desc, nulls_last, nullable))
+    if position is not None:
+        qs = qs.filter(_apres(field, parcours_desc, nulls_last, nullable, position["v"], position["id"]))
+
+    rows = list(qs[:page_size + 1])
+    encore = len(rows) > page_size
+    rows = rows[:page_size]
+    if reculer:
+        rows.reverse()
+
+    def curseur(obj, sens):
+        value = _valeur_tri(obj, field) if field else None
+        return _encoder_curseur(ordering, value, obj.pk, sens)
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if reculer:
+            previous_cursor = curseur(rows[0], "p") if encore else None
+            next_cursor = curseur(rows[-1], "n")
+        else:
+            next_cursor = curseur(rows[-1], "n") if encore else None
+            previous_cursor = curseur(rows[0], "p") if position is not None else None
+
+    return rows, {"page_size": page_size, "next": next_cursor, "previous": previous_cursor}
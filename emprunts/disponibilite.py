@@ -0,0 +1,237 @@
+# Role de ce fichier: moteur de disponibilite par ouvrage (occupation jour par jour).
+import threading
+from datetime import date, timedelta
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import CacheLRU
+
+from .models import Emprunt, Reservation, StatutEmprunt, StatutReservation
+
+# Horizon de la chronologie (jours a partir d'aujourd'hui): taille fixe, quelles que soient
+# les dates demandees ou enregistrees (les intervalles sont tronques a l'horizon).
+HORIZON_JOURS = 366
+
+STATUTS_EMPRUNT_OCCUPANT = (StatutEmprunt.EN_COURS, StatutEmprunt.EN_RETARD)
+STATUTS_RESERVATION_OCCUPANT = (StatutReservation.EN_ATTENTE, StatutReservation.VALIDEE)
+
+Intervalle = Optional[Tuple[date, date]]
+
+
+class ChronologieOccupation:
+    # Arbre de segments (ajout sur plage + maximum sur plage, propagation paresseuse)
+    # indexe par jour a partir de `debut`: chaque operation est en O(log n).
+    def __init__(self, debut: date, nb_jours: int):
+        self.debut = debut
+        self.nb_jours = nb_jours
+        self._max = [0] * (4 * nb_jours)
+        self._ajout = [0] * (4 * nb_jours)
+
+    def ajouter(self, d1: date, d2: date, delta: int) -> None:
+        i, j = self._indices(d1, d2)
+        if i <= j:
+            self._ajouter(1, 0, self.nb_jours - 1, i, j, delta)
+
+    def occupation_max(self, d1: date, d2: date) -> int:
+        i, j = self._indices(d1, d2)
+        if i > j:
+            return 0
+        return self._maximum(1, 0, self.nb_jours - 1, i, j)
+
+    def _indices(self, d1: date, d2: date):
+        # Les jours passes sont ignores (la chronologie commence aujourd'hui).
+        return max((d1 - self.debut).days, 0), min((d2 - self.debut).days, self.nb_jours - 1)
+
+    def _ajouter(self, noeud, gauche, droite, i, j, delta):
+        if j < gauche or droite < i:
+            return
+        if i <= gauche and droite <= j:
+            self._max[noeud] += delta
+            self._ajout[noeud] += delta
+            return
+        milieu = (gauche + droite) // 2
+        self._ajouter(2 * noeud, gauche, milieu, i, j, delta)
+        self._ajouter(2 * noeud + 1, milieu + 1, droite, i, j, delta)
+        self._max[noeud] = self._ajout[noeud] + max(self._max[2 * noeud], self._max[2 * noeud + 1])
+
+    def _maximum(self, noeud, gauche, droite, i, j):
+        if j < gauche or droite < i:
+            return float("-inf")
+        if i <= gauche and droite <= j:
+            return self._max[noeud]
+        milieu = (gauche + droite) // 2
+        return self._ajout[noeud] + max(
+            self._maximum(2 * noeud, gauche, milieu, i, j),
+            self._maximum(2 * noeud + 1, milieu + 1, droite, i, j),
+        )
+
+
+# -----------------------------
+# Intervalles occupes (bornes incluses)
+# -----------------------------
+def intervalle_emprunt(emprunt: Emprunt, today: date) -> Intervalle:
+    # Un emprunt ouvert bloque l'exemplaire jusqu'au retour prevu (au moins aujourd'hui si en retard).
+    if emprunt.date_retour_effective is not None or emprunt.statut not in STATUTS_EMPRUNT_OCCUPANT:
+        return None
+    return today, max(emprunt.date_retour_prevue, today)
+
+
+def intervalle_reservation(reservation: Reservation, today: date) -> Intervalle:
+    if reservation.statut not in STATUTS_RESERVATION_OCCUPANT or reservation.date_fin < today:
+        return None
+    return max(reservation.date_debut, today), reservation.date_fin
+
+
+class DisponibiliteOuvrage:
+    # Chronologie d'un ouvrage + intervalle actuellement compte pour chaque emprunt/reservation,
+    # pour appliquer les changements d'etat par difference.
+    def __init__(self, ouvrage_id: int, today: date, intervalles: dict):
+        self.ouvrage_id = ouvrage_id
+        self.jour = today
+        self.fin = today + timedelta(days=HORIZON_JOURS)
+        self.chronologie = ChronologieOccupation(today, HORIZON_JOURS + 1)
+        self.intervalles = {}
+        for cle, intervalle in intervalles.items():
+            self.appliquer(cle, intervalle)
+
+    def appliquer(self, cle, intervalle: Intervalle) -> None:
+        # Intervalle tronque a l'horizon (ignore s'il commence au-dela).
+        if intervalle is not None:
+            intervalle = None if intervalle[0] > self.fin else (intervalle[0], min(intervalle[1], self.fin))
+        ancien = self.intervalles.pop(cle, None)
+        if ancien is not None:
+            self.chronologie.ajouter(*ancien, -1)
+        if intervalle is not None:
+            self.chronologie.ajouter(*intervalle, 1)
+            self.intervalles[cle] = intervalle
+
+    def occupation_par_jour(self, d1: date, d2: date) -> list:
+        # Balayage des intervalles: +1 au premier jour, -1 le lendemain du dernier.
+        nb_jours = (d2 - d1).days + 1
+        variations = [0] * (nb_jours + 1)
+        for debut, fin in self.intervalles.values():
+            i, j = max((debut - d1).days, 0), min((fin - d1).days, nb_jours - 1)
+            if i <= j:
+                variations[i] += 1
+                variations[j + 1] -= 1
+        occupation, courant = [], 0
+        for variation in variations[:nb_jours]:
+            courant += variation
+            occupation.append(courant)
+        return occupation
+
+
+def _charger(ouvrage_id: int, today: date) -> DisponibiliteOuvrage:
+    # Deux requetes: emprunts ouverts et reservations actives de l'ouvrage.
+    intervalles = {}
+    emprunts = Emprunt.objects.filter(
+        exemplaire__ouvrage_id=ouvrage_id,
+        date_retour_effective__isnull=True,
+        statut__in=STATUTS_EMPRUNT_OCCUPANT,
+    ).only("id", "date_retour_prevue", "date_retour_effective", "statut")
+    for emprunt in emprunts:
+        intervalles[("emprunt", emprunt.id)] = intervalle_emprunt(emprunt, today)
+    reservations = Reservation.objects.filter(
+        ouvrage_id=ouvrage_id,
+        statut__in=STATUTS_RESERVATION_OCCUPANT,
+        date_fin__gte=today,
+    ).only("id", "date_debut", "date_fin", "statut")
+    for reservation in reservations:
+        intervalles[("reservation", reservation.id)] = intervalle_reservation(reservation, today)
+    return DisponibiliteOuvrage(ouvrage_id, today, intervalles)
+
+
+class MoteurDisponibilite:
+    # Chronologies par ouvrage, chargees a la demande et tenues a jour par signaux.
+    def __init__(self, taille: int, ttl: float):
+        self._cache = CacheLRU(taille=taille, ttl=ttl)
+        self._lock = threading.RLock()
+        # Compteur de changements par ouvrage (et global pour vider()): une chronologie chargee
+        # hors verrou n'est gardee que si aucun changement n'est survenu pendant le chargement.
+        self._versions = {}
+        self._epoque = 0
+
+    def _version(self, ouvrage_id: int):
+        return self._epoque, self._versions.get(ouvrage_id, 0)
+
+    def _charger_et_garder(self, ouvrage_id: int, today: date) -> DisponibiliteOuvrage:
+        # Requetes hors verrou: un chargement ne bloque pas les lectures des autres ouvrages.
+        with self._lock:
+            version = self._version(ouvrage_id)
+        dispo = _charger(ouvrage_id, today)
+        with self._lock:
+            if self._version(ouvrage_id) == version:
+                self._cache.set(ouvrage_id, dispo)
+        return dispo
+
+    def _disponibilite(self, ouvrage_id: int) -> DisponibiliteOuvrage:
+        today = timezone.localdate()
+        dispo = self._cache.get(ouvrage_id)
+        if dispo is None or dispo.jour != today:
+            dispo = self._charger_et_garder(ouvrage_id, today)
+        return dispo
+
+    def occupation_max(self, ouvrage_id: int, d1: date, d2: date) -> int:
+        dispo = self._disponibilite(ouvrage_id)
+        with self._lock:
+            return dispo.chronologie.occupation_max(d1, d2)
+
+    def exemplaires_libres(self, ouvrage, d1: date, d2: date) -> int:
+        # Exemplaires libres sur toute la periode [d1, d2] (jour le plus charge).
+        return max(ouvrage.exemplaires_total - self.occupation_max(ouvrage.id, d1, d2), 0)
+
+    def exemplaires_libres_en_base(self, ouvrage, d1: date, d2: date) -> int:
+        # Ecritures: chronologie relue en base (un autre processus a pu la modifier),
+        # a appeler sous le verrou de file de l'ouvrage; elle remplace celle du cache.
+        dispo = self._charger_et_garder(ouvrage.id, timezone.localdate())
+        with self._lock:
+            occupes = dispo.chronologie.occupation_max(d1, d2)
+        return max(ouvrage.exemplaires_total - occupes, 0)
+
+    def calendrier(self, ouvrage, d1: date, d2: date) -> list:
+        # [(jour, exemplaires libres)] pour chaque jour de [d1, d2].
+        dispo = self._disponibilite(ouvrage.id)
+        with self._lock:
+            occupation = dispo.occupation_par_jour(d1, d2)
+        return [
+            (d1 + timedelta(days=i), max(ouvrage.exemplaires_total - occupes, 0))
+            for i, occupes in enumerate(occupation)
+        ]
+
+    def appliquer(self, ouvrage_id: int, cle, intervalle: Intervalle) -> None:
+        # Mise a jour incrementale d'une chronologie deja chargee (sinon rien a faire).
+        with self._lock:
+            self._versions[ouvrage_id] = self._versions.get(ouvrage_id, 0) + 1
+            dispo = self._cache.get(ouvrage_id)
+            if dispo is None:
+                return
+            if dispo.jour != timezone.localdate():
+                self._cache.invalider(ouvrage_id)
+            else:
+                dispo.appliquer(cle, intervalle)
+
+    def invalider(self, *ouvrage_ids) -> None:
+        with self._lock:
+            for ouvrage_id in ouvrage_ids:
+                self._versions[ouvrage_id] = self._versions.get(ouvrage_id, 0) + 1
+            self._cache.invalider(*ouvrage_ids)
+
+    def vider(self) -> None:
+        with self._lock:
+            self._epoque += 1
+            self._cache.vider()
+
+
+moteur_disponibilite = MoteurDisponibilite(
+    taille=getattr(settings, "DISPONIBILITE_CACHE_TAILLE", 1024),
+    ttl=getattr(settings, "DISPONIBILITE_CACHE_TTL", 3600),
+)
+
+
+def invalider_disponibilite(*ouvrage_ids) -> None:
+    # Pour les ecritures groupees (update/bulk_create) qui ne declenchent pas de signaux.
+    moteur_disponibilite.invalider(*ouvrage_ids)
+    transaction.on_commit(lambda: moteur_disponibilite.invalider(*ouvrage_ids))
@@ -0,0 +1,22 @@
+# Role de ce fichier: commande d'expiration des reservations perimees (une fois ou en boucle).
+import time
+
+from django.core.management.base import BaseCommand
+
+from emprunts.services import expirer_reservations
+
+
+class Command(BaseCommand):
+    help = "Expire les reservations dont la periode est terminee (une fois ou en boucle)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--boucle", action="store_true", help="Relance l'expiration a intervalle regulier.")
+        parser.add_argument("--intervalle", type=int, default=3600, help="Secondes entre deux passages (--boucle).")
+
+    def handle(self, *args, **options):
+        while True:
+            resultat = expirer_reservations()
+            self.stdout.write(self.style.SUCCESS(f"Reservations expirees: {resultat['expirees']}."))
+            if not options["boucle"]:
+                return
+            time.sleep(max(1, options["intervalle"]))
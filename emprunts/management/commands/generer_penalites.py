@@ -0,0 +1,27 @@
+# Role de ce fichier: commande de generation en lot des penalites de retard.
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from emprunts.services import TAILLE_LOT_PENALITES, generer_penalites_en_lot
+
+
+class Command(BaseCommand):
+    help = "Genere ou met a jour en lot les penalites de tous les emprunts en retard."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--taille-lot", type=int, default=TAILLE_LOT_PENALITES)
+        parser.add_argument("--tarif", type=Decimal, default=None, help="Tarif par jour (defaut: parametres).")
+
+    def handle(self, *args, **options):
+        resultat = generer_penalites_en_lot(
+            tarif_par_jour=options["tarif"],
+            taille_lot=max(1, options["taille_lot"]),
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Penalites creees: {resultat['creees']}. "
+                f"Mises a jour: {resultat['mises_a_jour']}. "
+                f"Payees ignorees: {resultat['payees_ignorees']}."
+            )
+        )
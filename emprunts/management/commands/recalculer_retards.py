@@ -1,20 +1,18 @@
+# Role de ce fichier: commande de recalcul des retards et des penalites.
 from django.core.management.base import BaseCommand
 
-from emprunts.models import Emprunt, StatutEmprunt
-from emprunts.services import generer_ou_maj_penalite, recalculer_tous_les_retards
+from emprunts.services import generer_penalites_en_lot, recalculer_tous_les_retards
 
 
 class Command(BaseCommand):
     help = "Recalcule les statuts de retard et met a jour les penalites."
 
     def handle(self, *args, **options):
-        total = recalculer_tous_les_retards()
-        penalites = 0
-        for emprunt in Emprunt.objects.filter(statut=StatutEmprunt.EN_RETARD):
-            if generer_ou_maj_penalite(emprunt):
-                penalites += 1
+        total = sum(recalculer_tous_les_retards().values())
+        penalites = generer_penalites_en_lot()
         self.stdout.write(
             self.style.SUCCESS(
-                f"Retards recalcules: {total}. Penalites traitees: {penalites}."
+                f"Retards recalcules: {total}. "
+                f"Penalites creees: {penalites['creees']}, mises a jour: {penalites['mises_a_jour']}."
             )
         )
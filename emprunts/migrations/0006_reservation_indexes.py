@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adherents', '0001_initial'),
+        ('emprunts', '0005_alter_reservation_montant_estime'),
+        ('ouvrages', '0007_ouvrage_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['ouvrage', 'statut', 'date_debut', 'date_fin'], name='reservation_ouvrage_statut_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['statut', 'date_fin'], name='reservation_statut_fin_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+def numeroter_files(apps, schema_editor):
+    # Positions des reservations en attente existantes, par ouvrage et ordre d'arrivee.
+    Reservation = apps.get_model("emprunts", "Reservation")
+    en_attente = (
+        Reservation.objects.filter(statut="EN_ATTENTE")
+        .order_by("ouvrage_id", "date_creation", "id")
+        .only("id", "ouvrage_id")
+    )
+    a_numeroter, positions = [], {}
+    for reservation in en_attente.iterator():
+        positions[reservation.ouvrage_id] = positions.get(reservation.ouvrage_id, 0) + 1
+        reservation.position = positions[reservation.ouvrage_id]
+        a_numeroter.append(reservation)
+    Reservation.objects.bulk_update(a_numeroter, ["position"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adherents', '0001_initial'),
+        ('emprunts', '0006_reservation_indexes'),
+        ('ouvrages', '0007_ouvrage_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='position',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(numeroter_files, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('position__isnull', False)), fields=['ouvrage', 'position'], name='reservation_file_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adherents', '0001_initial'),
+        ('emprunts', '0007_reservation_position'),
+        ('exemplaires', '0001_initial'),
+        ('ouvrages', '0007_ouvrage_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(fields=['statut', 'date_retour_prevue'], name='emprunt_statut_retour_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(fields=['statut', 'date_emprunt'], name='emprunt_statut_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(fields=['adherent', 'statut'], name='emprunt_adherent_statut_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(fields=['date_emprunt'], name='emprunt_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(condition=models.Q(('date_retour_effective__isnull', True)), fields=['exemplaire'], name='emprunt_ouvert_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='penalite',
+            index=models.Index(fields=['payee', 'date_creation'], name='penalite_payee_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='penalite',
+            index=models.Index(fields=['date_creation'], name='penalite_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['date_creation'], name='reservation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['statut', 'date_creation'], name='reservation_statut_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['adherent', 'date_creation'], name='reservation_adherent_date_idx'),
+        ),
+    ]
@@ -38,6 +38,23 @@ class Emprunt(models.Model):
         default=StatutEmprunt.EN_COURS,
     )
 
+    class Meta:
+        indexes = [
+            # Listes par statut: retards (tri date_retour_prevue, recalcul), en cours (tri date_emprunt).
+            models.Index(fields=["statut", "date_retour_prevue"], name="emprunt_statut_retour_idx"),
+            models.Index(fields=["statut", "date_emprunt"], name="emprunt_statut_date_idx"),
+            # Quota et emprunts actifs d'un adherent.
+            models.Index(fields=["adherent", "statut"], name="emprunt_adherent_statut_idx"),
+            # Listes sans filtre (recents, historique): tri -date_emprunt.
+            models.Index(fields=["date_emprunt"], name="emprunt_date_idx"),
+            # Emprunt ouvert d'un exemplaire (scan, retours, disponibilites).
+            models.Index(
+                fields=["exemplaire"],
+                condition=models.Q(date_retour_effective__isnull=True),
+                name="emprunt_ouvert_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"Emprunt #{self.id} - {self.exemplaire.code_barre}"
 
@@ -73,6 +90,13 @@ class Penalite(models.Model):
     payee = models.BooleanField(default=False)
     date_creation = models.DateField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Liste des penalites (filtre payee optionnel, tri -date_creation).
+            models.Index(fields=["payee", "date_creation"], name="penalite_payee_date_idx"),
+            models.Index(fields=["date_creation"], name="penalite_date_idx"),
+        ]
+
     def __str__(self):
         return f"Penalite Emprunt #{self.emprunt_id} - {self.montant}"
 
@@ -109,6 +133,8 @@ class Reservation(models.Model):
     montant_estime = models.DecimalField(max_digits=10, decimal_places=2)
     date_creation = models.DateTimeField(auto_now_add=True)
     date_traitement = models.DateTimeField(blank=True, null=True)
+    # Rang dans la file d'attente de l'ouvrage (1 = prochain servi), tant que EN_ATTENTE.
+    position = models.PositiveIntegerField(blank=True, null=True)
 
     class Meta:
         constraints = [
@@ -118,6 +144,25 @@ class Reservation(models.Model):
                 name="unique_active_reservation",
             ),
         ]
+        indexes = [
+            # Reservations actives d'un ouvrage sur une periode (disponibilites, scan).
+            models.Index(
+                fields=["ouvrage", "statut", "date_debut", "date_fin"],
+                name="reservation_ouvrage_statut_idx",
+            ),
+            # Expiration des reservations dont la periode est passee.
+            models.Index(fields=["statut", "date_fin"], name="reservation_statut_fin_idx"),
+            # Listes (tri -date_creation): toutes, par statut, par adherent.
+            models.Index(fields=["date_creation"], name="reservation_date_idx"),
+            models.Index(fields=["statut", "date_creation"], name="reservation_statut_date_idx"),
+            models.Index(fields=["adherent", "date_creation"], name="reservation_adherent_date_idx"),
+            # File d'attente: prochain servi = position la plus basse de l'ouvrage.
+            models.Index(
+                fields=["ouvrage", "position"],
+                condition=models.Q(position__isnull=False),
+                name="reservation_file_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Reservation {self.ouvrage.titre} - {self.adherent.user.username}"
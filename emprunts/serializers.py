@@ -68,6 +68,25 @@ class CreerEmpruntInputSerializer(serializers.Serializer):
     adherent_id = serializers.IntegerField()
 
 
+class CreerEmpruntLotInputSerializer(serializers.Serializer):
+    # Input emprunt en lot (guichet): plusieurs exemplaires pour un adherent.
+    adherent_id = serializers.IntegerField()
+    exemplaire_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        min_length=1,
+        max_length=50,
+    )
+
+
+class RetourLotInputSerializer(serializers.Serializer):
+    # Input retour en lot (boite de retour): codes-barres scannes.
+    codes_barre = serializers.ListField(
+        child=serializers.CharField(max_length=50),
+        min_length=1,
+        max_length=500,
+    )
+
+
 class CreerEmpruntLecteurSerializer(serializers.Serializer):
     # Input creation emprunt lecteur.
     exemplaire_id = serializers.IntegerField()
@@ -91,6 +110,7 @@ class ReservationSerializer(serializers.ModelSerializer):
             "date_debut",
             "date_fin",
             "statut",
+            "position",
             "montant_estime",
             "date_creation",
             "date_traitement",
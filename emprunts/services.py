@@ -1,27 +1,38 @@
 # Role de ce fichier: logique metier reutilisable pour emprunts/retards/penalites.
+import random
+import time
+from collections import Counter, defaultdict
 from datetime import timedelta
 from decimal import Decimal
 from typing import Optional
 
-from django.db import transaction
+from django.db import OperationalError, transaction
+from django.db.models import Case, Count, F, Max, PositiveIntegerField, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from adherents.models import Adherent
-from core.models import ActivityType, Parametre, log_activity
-from exemplaires.models import EtatExemplaire, Exemplaire
+from core.models import ActivityType, Parametre, log_activities, log_activity, parametres_cache
+from exemplaires.models import EtatExemplaire, Exemplaire, ajuster_compteurs, ajuster_compteurs_en_lot
+from exemplaires.scan import invalider_scan, invalider_scan_ouvrages
+from ouvrages.models import Ouvrage
 
-from .models import Emprunt, Penalite, StatutEmprunt
+from .disponibilite import invalider_disponibilite, moteur_disponibilite
+from .models import Emprunt, Penalite, Reservation, StatutEmprunt, StatutReservation
 
 TARIF_PAR_JOUR_DEFAUT = Decimal("1000.00")
+TAILLE_LOT_PENALITES = 1000
+# Rejeu de creer_emprunt sur interblocage (deadlock) / echec de serialisation.
+TENTATIVES_EMPRUNT = 3
+PAUSE_TENTATIVE_EMPRUNT = 0.05
 
 
 # -----------------------------
 # Helpers: parametres systeme
 # -----------------------------
 def get_parametres() -> Parametre:
-    # Utilise une seule ligne (id=1) pour les parametres systeme.
-    p, _ = Parametre.objects.get_or_create(id=1)
-    return p
+    # Parametres systeme (id=1) servis par le cache processus du core.
+    return parametres_cache.get()
 
 
 def get_tarif_penalite_par_jour() -> Decimal:
@@ -60,8 +71,9 @@ def get_quota_emprunts_actifs() -> int:
 # Helpers: retards + penalites
 # -----------------------------
 @transaction.atomic
-def recalculer_statut_emprunt(emprunt: Emprunt) -> Emprunt:
+def recalculer_statut_emprunt(emprunt: Emprunt, update_fields=("statut",)) -> Emprunt:
     # Recalcule le statut selon les dates (retard/retour/en cours).
+    # `update_fields`: champs deja modifies a enregistrer dans le meme UPDATE.
     is_returned = emprunt.date_retour_effective is not None
     late_days = emprunt.jours_de_retard()
 
@@ -70,19 +82,35 @@ def recalculer_statut_emprunt(emprunt: Emprunt) -> Emprunt:
     else:
         emprunt.statut = StatutEmprunt.RETOURNE if is_returned else StatutEmprunt.EN_COURS
 
-    emprunt.save(update_fields=["statut"])
+    emprunt.save(update_fields=list(update_fields))
     return emprunt
 
 
 @transaction.atomic
-def recalculer_tous_les_retards() -> int:
-    # Recalcule le statut pour tous les emprunts (batch).
-    count = 0
-    qs = Emprunt.objects.all().only("id", "date_retour_prevue", "date_retour_effective", "statut")
-    for e in qs:
-        recalculer_statut_emprunt(e)
-        count += 1
-    return count
+def recalculer_tous_les_retards() -> dict:
+    # Recalcule le statut des emprunts ouverts (batch ensembliste).
+    # Seuls les emprunts non rendus dont le statut change sont mis a jour:
+    # un UPDATE conditionnel par statut cible, sans charger les lignes en memoire.
+    today = timezone.localdate()
+    ouverts = Emprunt.objects.filter(date_retour_effective__isnull=True)
+
+    en_retard = (
+        ouverts
+        .filter(date_retour_prevue__lt=today)
+        .exclude(statut=StatutEmprunt.EN_RETARD)
+        .update(statut=StatutEmprunt.EN_RETARD)
+    )
+    en_cours = (
+        ouverts
+        .filter(date_retour_prevue__gte=today)
+        .exclude(statut=StatutEmprunt.EN_COURS)
+        .update(statut=StatutEmprunt.EN_COURS)
+    )
+
+    return {
+        StatutEmprunt.EN_RETARD.value: en_retard,
+        StatutEmprunt.EN_COURS.value: en_cours,
+    }
 
 
 @transaction.atomic
@@ -100,6 +128,9 @@ def generer_ou_maj_penalite(emprunt: Emprunt, tarif_par_jour: Optional[Decimal]
         defaults={"jours_retard": jours, "montant": montant, "payee": False},
     )
 
+    # Emprunt deja charge: la serialisation de la penalite ne le relit pas.
+    penalite.emprunt = emprunt
+
     if not created and penalite.payee is False:
         penalite.jours_retard = jours
         penalite.montant = montant
@@ -115,23 +146,129 @@ def generer_ou_maj_penalite(emprunt: Emprunt, tarif_par_jour: Optional[Decimal]
     return penalite
 
 
+def _maj_penalites_lot(lignes, tarif: Decimal, today, resultat: dict) -> set:
+    # Upsert des penalites pour un lot de lignes (id, prevue, effective, user_id).
+    # Retourne les ids d'emprunts dont la penalite, deja payee, est laissee telle quelle.
+    existantes = {
+        p.emprunt_id: p
+        for p in Penalite.objects.filter(
+            emprunt_id__in=[ligne[0] for ligne in lignes]
+        ).only("id", "emprunt_id", "jours_retard", "montant", "payee")
+    }
+
+    a_creer, a_maj, activites, payees = [], [], [], set()
+    for emprunt_id, prevue, effective, user_id in lignes:
+        jours = ((effective or today) - prevue).days
+        if jours <= 0:
+            continue
+        montant = Decimal(jours) * tarif
+
+        penalite = existantes.get(emprunt_id)
+        if penalite is None:
+            a_creer.append(Penalite(emprunt_id=emprunt_id, jours_retard=jours, montant=montant, payee=False))
+            activites.append({
+                "type": ActivityType.PENALITE_CREE,
+                "message": f"Penalite creee pour emprunt #{emprunt_id}",
+                "user_id": user_id,
+            })
+        elif penalite.payee:
+            resultat["payees_ignorees"] += 1
+            payees.add(emprunt_id)
+        elif penalite.jours_retard != jours or penalite.montant != montant:
+            penalite.jours_retard = jours
+            penalite.montant = montant
+            a_maj.append(penalite)
+
+    Penalite.objects.bulk_create(a_creer)
+    Penalite.objects.bulk_update(a_maj, ["jours_retard", "montant"])
+    log_activities(activites)
+
+    resultat["creees"] += len(a_creer)
+    resultat["mises_a_jour"] += len(a_maj)
+    return payees
+
+
+def generer_penalites_en_lot(
+    *,
+    tarif_par_jour: Optional[Decimal] = None,
+    taille_lot: int = TAILLE_LOT_PENALITES,
+) -> dict:
+    # Cree ou met a jour les penalites de tous les emprunts en retard (batch).
+    # Parcours par lots sur l'id (memoire constante), une transaction par lot,
+    # penalites deja payees ignorees.
+    tarif = Decimal(tarif_par_jour if tarif_par_jour is not None else get_tarif_penalite_par_jour())
+    today = timezone.localdate()
+    resultat = {"creees": 0, "mises_a_jour": 0, "payees_ignorees": 0}
+
+    qs = (
+        Emprunt.objects
+        .filter(statut=StatutEmprunt.EN_RETARD)
+        .order_by("id")
+        .values_list("id", "date_retour_prevue", "date_retour_effective", "adherent__user_id")
+    )
+    dernier_id = 0
+    while True:
+        lignes = list(qs.filter(id__gt=dernier_id)[:taille_lot])
+        if not lignes:
+            break
+        dernier_id = lignes[-1][0]
+        with transaction.atomic():
+            _maj_penalites_lot(lignes, tarif, today, resultat)
+
+    return resultat
+
+
 # -----------------------------
 # Helpers: circulation emprunt
 # -----------------------------
-@transaction.atomic
+def _avec_rejeu(fonction, **kwargs):
+    # Un interblocage / echec de serialisation est rejoue, sauf dans une transaction englobante.
+    for tentative in range(TENTATIVES_EMPRUNT):
+        try:
+            return fonction(**kwargs)
+        except OperationalError:
+            if transaction.get_connection().in_atomic_block or tentative == TENTATIVES_EMPRUNT - 1:
+                raise
+            # Attente exponentielle avec alea pour desynchroniser les requetes rejouees.
+            time.sleep(PAUSE_TENTATIVE_EMPRUNT * (2 ** tentative) * random.uniform(0.5, 1.5))
+
+
 def creer_emprunt(*, exemplaire: Exemplaire, adherent: Adherent) -> Emprunt:
     # Cree un emprunt en respectant quota, dates et disponibilite.
-    if exemplaire.etat != EtatExemplaire.DISPONIBLE:
-        raise ValueError("Exemplaire indisponible.")
+    return _avec_rejeu(_creer_emprunt, exemplaire=exemplaire, adherent=adherent)
 
-    quota = get_quota_emprunts_actifs()
-    actifs = Emprunt.objects.filter(
-        adherent=adherent,
-        statut__in=[StatutEmprunt.EN_COURS, StatutEmprunt.EN_RETARD],
-    ).count()
 
-    if actifs >= quota:
-        raise ValueError("Quota d'emprunts actifs depasse.")
+@transaction.atomic
+def _creer_emprunt(*, exemplaire: Exemplaire, adherent: Adherent) -> Emprunt:
+    # Verrou sur l'adherent: serialise le controle de quota de ses emprunts concurrents.
+    Adherent.objects.select_for_update().only("id").get(id=adherent.id)
+
+    # UPDATE conditionnel, quota compris: un seul emprunt concurrent peut faire passer
+    # l'exemplaire a EMPRUNTE, et seulement sous le quota. Le comptage est une sous-requete
+    # de l'UPDATE, instruction posterieure au verrou: il voit les emprunts deja valides.
+    actifs = (
+        Emprunt.objects.filter(
+            adherent=adherent,
+            statut__in=[StatutEmprunt.EN_COURS, StatutEmprunt.EN_RETARD],
+        )
+        .order_by()
+        .values("adherent")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    pris = (
+        Exemplaire.objects.alias(actifs=Coalesce(Subquery(actifs), 0))
+        .filter(id=exemplaire.id, etat=EtatExemplaire.DISPONIBLE, actifs__lt=get_quota_emprunts_actifs())
+        .update(etat=EtatExemplaire.EMPRUNTE)
+    )
+    if not pris:
+        # Echec seulement: une requete de plus pour en donner la raison.
+        if Exemplaire.objects.filter(id=exemplaire.id, etat=EtatExemplaire.DISPONIBLE).exists():
+            raise ValueError("Quota d'emprunts actifs depasse.")
+        raise ValueError("Exemplaire indisponible.")
+
+    ajuster_compteurs(exemplaire.ouvrage_id, disponibles=-1)
+    exemplaire.marquer_etat_en_base(EtatExemplaire.EMPRUNTE)
 
     today = timezone.localdate()
     due = today + timedelta(days=get_duree_emprunt_jours())
@@ -143,9 +280,6 @@ def creer_emprunt(*, exemplaire: Exemplaire, adherent: Adherent) -> Emprunt:
         statut=StatutEmprunt.EN_COURS,
     )
 
-    exemplaire.etat = EtatExemplaire.EMPRUNTE
-    exemplaire.save(update_fields=["etat"])
-
     log_activity(
         type=ActivityType.EMPRUNT_CREE,
         message=f"Emprunt cree pour {exemplaire.code_barre}",
@@ -155,6 +289,85 @@ def creer_emprunt(*, exemplaire: Exemplaire, adherent: Adherent) -> Emprunt:
     return emprunt
 
 
+def creer_emprunts_en_lot(*, adherent: Adherent, exemplaire_ids: list) -> list:
+    # Emprunt de plusieurs exemplaires pour un adherent (guichet).
+    # Retourne un resultat par exemplaire: {"exemplaire_id", "emprunt"} ou {"exemplaire_id", "detail"}.
+    return _avec_rejeu(_creer_emprunts_en_lot, adherent=adherent, exemplaire_ids=exemplaire_ids)
+
+
+@transaction.atomic
+def _creer_emprunts_en_lot(*, adherent: Adherent, exemplaire_ids: list) -> list:
+    Adherent.objects.select_for_update().only("id").get(id=adherent.id)
+    exemplaire_ids = list(dict.fromkeys(exemplaire_ids))
+    exemplaires = Exemplaire.objects.select_for_update().in_bulk(exemplaire_ids)
+
+    places = get_quota_emprunts_actifs() - Emprunt.objects.filter(
+        adherent=adherent,
+        statut__in=[StatutEmprunt.EN_COURS, StatutEmprunt.EN_RETARD],
+    ).count()
+
+    resultats, retenus = [], []
+    for exemplaire_id in exemplaire_ids:
+        exemplaire = exemplaires.get(exemplaire_id)
+        if exemplaire is None:
+            detail = "Exemplaire introuvable."
+        elif exemplaire.etat != EtatExemplaire.DISPONIBLE:
+            detail = "Exemplaire indisponible."
+        elif len(retenus) >= places:
+            detail = "Quota d'emprunts actifs depasse."
+        else:
+            retenus.append(exemplaire)
+            resultats.append({"exemplaire_id": exemplaire_id, "emprunt": None})
+            continue
+        resultats.append({"exemplaire_id": exemplaire_id, "detail": detail})
+
+    if not retenus:
+        return resultats
+
+    # Une seule instruction pour tous les exemplaires; un ecart signifie qu'un emprunt
+    # concurrent est passe entre lecture et ecriture (moteur sans verrou de ligne): on rejoue.
+    pris = Exemplaire.objects.filter(
+        id__in=[e.id for e in retenus], etat=EtatExemplaire.DISPONIBLE
+    ).update(etat=EtatExemplaire.EMPRUNTE)
+    if pris != len(retenus):
+        raise OperationalError("Exemplaires modifies pendant l'emprunt en lot.")
+    ajuster_compteurs_en_lot({
+        ouvrage_id: -nombre for ouvrage_id, nombre in Counter(e.ouvrage_id for e in retenus).items()
+    })
+    invalider_scan(*[e.code_barre for e in retenus])
+    invalider_disponibilite(*{e.ouvrage_id for e in retenus})
+    # Ouvrages charges en une requete pour la serialisation des emprunts crees.
+    ouvrages = Ouvrage.objects.in_bulk({e.ouvrage_id for e in retenus})
+    for exemplaire in retenus:
+        exemplaire.marquer_etat_en_base(EtatExemplaire.EMPRUNTE)
+        exemplaire.ouvrage = ouvrages[exemplaire.ouvrage_id]
+
+    due = timezone.localdate() + timedelta(days=get_duree_emprunt_jours())
+    emprunts = Emprunt.objects.bulk_create([
+        Emprunt(
+            exemplaire=exemplaire,
+            adherent=adherent,
+            date_retour_prevue=due,
+            statut=StatutEmprunt.EN_COURS,
+        )
+        for exemplaire in retenus
+    ])
+    log_activities(
+        {
+            "type": ActivityType.EMPRUNT_CREE,
+            "message": f"Emprunt cree pour {exemplaire.code_barre}",
+            "user": adherent.user,
+        }
+        for exemplaire in retenus
+    )
+
+    par_exemplaire = {emprunt.exemplaire_id: emprunt for emprunt in emprunts}
+    for resultat in resultats:
+        if "emprunt" in resultat:
+            resultat["emprunt"] = par_exemplaire[resultat["exemplaire_id"]]
+    return resultats
+
+
 @transaction.atomic
 def enregistrer_retour(*, emprunt: Emprunt) -> dict:
     # Enregistre un retour, met a jour statut et penalites.
@@ -162,13 +375,12 @@ def enregistrer_retour(*, emprunt: Emprunt) -> dict:
         raise ValueError("Cet emprunt est deja retourne.")
 
     emprunt.date_retour_effective = timezone.localdate()
-    emprunt.save(update_fields=["date_retour_effective"])
-
-    recalculer_statut_emprunt(emprunt)
+    recalculer_statut_emprunt(emprunt, update_fields=("date_retour_effective", "statut"))
     penalite = generer_ou_maj_penalite(emprunt)
 
     emprunt.exemplaire.etat = EtatExemplaire.DISPONIBLE
     emprunt.exemplaire.save(update_fields=["etat"])
+    promouvoir_reservations({emprunt.exemplaire.ouvrage_id: 1})
 
     log_activity(
         type=ActivityType.RETOUR_ENREGISTRE,
@@ -177,3 +389,263 @@ def enregistrer_retour(*, emprunt: Emprunt) -> dict:
     )
 
     return {"emprunt": emprunt, "penalite": penalite}
+
+
+def enregistrer_retours_en_lot(*, codes_barre: list) -> list:
+    # Retour groupe (boite de retour) par codes-barres, en operations ensemblistes.
+    # Retourne un resultat par code: emprunt rendu (+ retard/penalite) ou detail de l'erreur.
+    return _avec_rejeu(_enregistrer_retours_en_lot, codes_barre=codes_barre)
+
+
+@transaction.atomic
+def _enregistrer_retours_en_lot(*, codes_barre: list) -> list:
+    codes_barre = list(dict.fromkeys(codes_barre))
+    today = timezone.localdate()
+    lignes = {
+        ligne[4]: ligne
+        for ligne in Emprunt.objects.select_for_update()
+        .filter(exemplaire__code_barre__in=codes_barre, date_retour_effective__isnull=True)
+        .values_list(
+            "id",
+            "date_retour_prevue",
+            "adherent__user_id",
+            "exemplaire_id",
+            "exemplaire__code_barre",
+            "exemplaire__ouvrage_id",
+            "exemplaire__etat",
+        )
+    }
+    inconnus = set(codes_barre) - set(lignes)
+    if inconnus:
+        inconnus -= set(
+            Exemplaire.objects.filter(code_barre__in=inconnus).values_list("code_barre", flat=True)
+        )
+
+    resultats = []
+    if lignes:
+        emprunt_ids = [ligne[0] for ligne in lignes.values()]
+        # Meme regle que recalculer_statut_emprunt: un retour tardif reste EN_RETARD.
+        rendus = Emprunt.objects.filter(id__in=emprunt_ids, date_retour_effective__isnull=True).update(
+            date_retour_effective=today,
+            statut=Case(
+                When(date_retour_prevue__lt=today, then=Value(StatutEmprunt.EN_RETARD)),
+                default=Value(StatutEmprunt.RETOURNE),
+            ),
+        )
+        if rendus != len(emprunt_ids):
+            raise OperationalError("Emprunts modifies pendant le retour en lot.")
+
+        tarif = Decimal(get_tarif_penalite_par_jour())
+        penalites = {"creees": 0, "mises_a_jour": 0, "payees_ignorees": 0}
+        payees = _maj_penalites_lot(
+            [(ligne[0], ligne[1], today, ligne[2]) for ligne in lignes.values()],
+            tarif,
+            today,
+            penalites,
+        )
+
+        # Seuls les exemplaires non disponibles changent les compteurs.
+        a_liberer = [ligne for ligne in lignes.values() if ligne[6] != EtatExemplaire.DISPONIBLE]
+        Exemplaire.objects.filter(id__in=[ligne[3] for ligne in a_liberer]).update(
+            etat=EtatExemplaire.DISPONIBLE
+        )
+        liberes = Counter(ligne[5] for ligne in a_liberer)
+        ajuster_compteurs_en_lot(liberes)
+        promouvoir_reservations(liberes)
+        invalider_scan(*lignes.keys())
+        invalider_disponibilite(*{ligne[5] for ligne in lignes.values()})
+
+        log_activities(
+            {
+                "type": ActivityType.RETOUR_ENREGISTRE,
+                "message": f"Retour enregistre pour emprunt #{ligne[0]}",
+                "user_id": ligne[2],
+            }
+            for ligne in lignes.values()
+        )
+
+    for code in codes_barre:
+        ligne = lignes.get(code)
+        if ligne is None:
+            detail = "Exemplaire introuvable." if code in inconnus else "Aucun emprunt en cours."
+            resultats.append({"code_barre": code, "detail": detail})
+            continue
+        jours = max((today - ligne[1]).days, 0)
+        # Penalite deja payee: rien a percevoir (meme regle que _maj_penalites_lot).
+        du = jours and ligne[0] not in payees
+        resultats.append({
+            "code_barre": code,
+            "emprunt_id": ligne[0],
+            "jours_retard": jours,
+            "penalite": str(Decimal(jours) * tarif) if du else None,
+        })
+    return resultats
+
+
+# -----------------------------
+# Reservations: file d'attente, expiration
+# -----------------------------
+# Chaque reservation EN_ATTENTE a une position dense (1..n) dans la file de son ouvrage;
+# elle la perd (position=None) en quittant EN_ATTENTE, et les suivantes remontent.
+def _verrouiller_files(ouvrage_ids) -> dict:
+    # Serialise les modifications de file d'un ouvrage (ordre fixe: pas d'interblocage).
+    # Retourne {ouvrage_id: exemplaires_total} lu sous le verrou.
+    return dict(
+        Ouvrage.objects.select_for_update()
+        .filter(id__in=sorted(ouvrage_ids))
+        .values_list("id", "exemplaires_total")
+    )
+
+
+def _tasser_files(positions_liberees: dict) -> None:
+    # {ouvrage_id: positions quittees}: un seul UPDATE pour toutes les files, chaque position
+    # suivante recule du nombre de places liberees devant elle dans sa file.
+    files, cas = Q(), []
+    for ouvrage_id, positions in positions_liberees.items():
+        if not positions:
+            continue
+        positions = sorted(positions)
+        bornes = positions[1:] + [None]
+        files |= Q(ouvrage_id=ouvrage_id, position__gt=positions[0])
+        cas.extend(
+            When(
+                ouvrage_id=ouvrage_id,
+                position__gt=debut,
+                then=F("position") - rang,
+                **({} if fin is None else {"position__lt": fin}),
+            )
+            for rang, (debut, fin) in enumerate(zip(positions, bornes), start=1)
+        )
+    if not cas:
+        return
+    Reservation.objects.filter(files).update(
+        position=Case(*cas, default=F("position"), output_field=PositiveIntegerField())
+    )
+
+
+def _ajouter_en_file(*, adherent: Adherent, ouvrage: Ouvrage, date_debut, date_fin, montant_estime) -> Reservation:
+    # Reservation EN_ATTENTE en fin de file (file deja verrouillee par l'appelant).
+    dernier = Reservation.objects.filter(ouvrage=ouvrage, position__isnull=False).aggregate(n=Max("position"))["n"]
+    return Reservation.objects.create(
+        adherent=adherent,
+        ouvrage=ouvrage,
+        date_debut=date_debut,
+        date_fin=date_fin,
+        montant_estime=montant_estime,
+        statut=StatutReservation.EN_ATTENTE,
+        position=(dernier or 0) + 1,
+    )
+
+
+@transaction.atomic
+def creer_reservation(*, adherent: Adherent, ouvrage: Ouvrage, date_debut, date_fin, montant_estime) -> Reservation:
+    # Cree une reservation EN_ATTENTE en fin de file.
+    _verrouiller_files([ouvrage.id])
+    return _ajouter_en_file(
+        adherent=adherent,
+        ouvrage=ouvrage,
+        date_debut=date_debut,
+        date_fin=date_fin,
+        montant_estime=montant_estime,
+    )
+
+
+@transaction.atomic
+def reserver_ouvrage(*, adherent: Adherent, ouvrage: Ouvrage, date_debut, date_fin, montant_estime) -> Reservation:
+    # Reservation d'un lecteur: acceptee seulement si aucun exemplaire n'est libre sur la periode.
+    # Disponibilite recalculee en base sous le verrou: le cache du processus peut etre en retard
+    # sur les reservations acceptees par les autres workers.
+    ouvrage.exemplaires_total = _verrouiller_files([ouvrage.id])[ouvrage.id]
+    disponibles = moteur_disponibilite.exemplaires_libres_en_base(ouvrage, date_debut, date_fin)
+    if disponibles:
+        raise ValueError(
+            f"Ouvrage disponible ({disponibles} exemplaire(s) libre(s)). Reservation non necessaire."
+        )
+    return _ajouter_en_file(
+        adherent=adherent,
+        ouvrage=ouvrage,
+        date_debut=date_debut,
+        date_fin=date_fin,
+        montant_estime=montant_estime,
+    )
+
+
+@transaction.atomic
+def changer_statut_reservation(reservation: Reservation, statut: str) -> Reservation:
+    # Annulation / validation / refus: la reservation sort de la file.
+    # Statut relu sous le verrou: une requete concurrente a pu la traiter entre-temps.
+    _verrouiller_files([reservation.ouvrage_id])
+    reservation.refresh_from_db(fields=["position", "statut"])
+    if reservation.statut not in (StatutReservation.EN_ATTENTE, StatutReservation.VALIDEE):
+        raise ValueError("Reservation deja traitee.")
+    position = reservation.position
+    reservation.statut = statut
+    reservation.position = None
+    reservation.date_traitement = timezone.now()
+    reservation.save(update_fields=["statut", "position", "date_traitement"])
+    if position is not None:
+        _tasser_files({reservation.ouvrage_id: [position]})
+    return reservation
+
+
+@transaction.atomic
+def expirer_reservations() -> dict:
+    # Passe en EXPIREE les reservations actives dont la periode est terminee (un seul UPDATE).
+    today = timezone.localdate()
+    perimees = Reservation.objects.filter(
+        statut__in=[StatutReservation.EN_ATTENTE, StatutReservation.VALIDEE],
+        date_fin__lt=today,
+    )
+    lignes = list(perimees.values_list("ouvrage_id", "position"))
+    if not lignes:
+        return {"expirees": 0}
+    _verrouiller_files({ouvrage_id for ouvrage_id, _ in lignes})
+    lignes = list(perimees.values_list("ouvrage_id", "position"))
+    expirees = perimees.update(statut=StatutReservation.EXPIREE, position=None, date_traitement=timezone.now())
+    positions_liberees = defaultdict(list)
+    for ouvrage_id, position in lignes:
+        if position is not None:
+            positions_liberees[ouvrage_id].append(position)
+    _tasser_files(positions_liberees)
+    # update() ne declenche pas de signaux.
+    invalider_disponibilite(*{ouvrage_id for ouvrage_id, _ in lignes})
+    invalider_scan_ouvrages(*{ouvrage_id for ouvrage_id, _ in lignes})
+    return {"expirees": expirees}
+
+
+def promouvoir_reservations(liberes: dict) -> list:
+    # Valide, par ouvrage, les `nombre` premieres reservations de la file dont la periode
+    # a commence ({ouvrage_id: nombre d'exemplaires rendus}); retourne leurs ids.
+    liberes = {ouvrage_id: nombre for ouvrage_id, nombre in liberes.items() if nombre > 0}
+    if not liberes:
+        return []
+    today = timezone.localdate()
+    with transaction.atomic():
+        _verrouiller_files(liberes)
+        # Parcours de l'index de file (ouvrage, position), du premier servi au dernier.
+        candidates = (
+            Reservation.objects.filter(
+                ouvrage_id__in=list(liberes),
+                position__isnull=False,
+                date_debut__lte=today,
+                date_fin__gte=today,
+            )
+            .order_by("ouvrage_id", "position")
+            .values_list("id", "ouvrage_id", "position")
+        )
+        promues = []
+        positions_liberees = defaultdict(list)
+        for reservation_id, ouvrage_id, position in candidates:
+            if len(positions_liberees[ouvrage_id]) < liberes[ouvrage_id]:
+                positions_liberees[ouvrage_id].append(position)
+                promues.append(reservation_id)
+        if promues:
+            Reservation.objects.filter(id__in=promues).update(
+                statut=StatutReservation.VALIDEE,
+                position=None,
+                date_traitement=timezone.now(),
+            )
+            _tasser_files(positions_liberees)
+            # EN_ATTENTE et VALIDEE occupent tous deux la chronologie: seul le scan change.
+            invalider_scan_ouvrages(*positions_liberees)
+    return promues
@@ -0,0 +1,46 @@
+# Role de ce fichier: signaux emprunts (mise a jour incrementale des disponibilites).
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from exemplaires.models import Exemplaire
+
+from .disponibilite import intervalle_emprunt, intervalle_reservation, moteur_disponibilite
+from .models import Emprunt, Reservation
+
+
+def _ouvrage_de_emprunt(emprunt: Emprunt) -> int:
+    if Emprunt.exemplaire.is_cached(emprunt):
+        return emprunt.exemplaire.ouvrage_id
+    return Exemplaire.objects.filter(id=emprunt.exemplaire_id).values_list("ouvrage_id", flat=True).first()
+
+
+@receiver(post_save, sender=Emprunt)
+def emprunt_enregistre(sender, instance, **kwargs):
+    ouvrage_id = _ouvrage_de_emprunt(instance)
+    intervalle = intervalle_emprunt(instance, timezone.localdate())
+    cle = ("emprunt", instance.id)
+    transaction.on_commit(lambda: moteur_disponibilite.appliquer(ouvrage_id, cle, intervalle))
+
+
+@receiver(post_delete, sender=Emprunt)
+def emprunt_supprime(sender, instance, **kwargs):
+    ouvrage_id = _ouvrage_de_emprunt(instance)
+    cle = ("emprunt", instance.id)
+    transaction.on_commit(lambda: moteur_disponibilite.appliquer(ouvrage_id, cle, None))
+
+
+@receiver(post_save, sender=Reservation)
+def reservation_enregistree(sender, instance, **kwargs):
+    intervalle = intervalle_reservation(instance, timezone.localdate())
+    cle = ("reservation", instance.id)
+    ouvrage_id = instance.ouvrage_id
+    transaction.on_commit(lambda: moteur_disponibilite.appliquer(ouvrage_id, cle, intervalle))
+
+
+@receiver(post_delete, sender=Reservation)
+def reservation_supprimee(sender, instance, **kwargs):
+    cle = ("reservation", instance.id)
+    ouvrage_id = instance.ouvrage_id
+    transaction.on_commit(lambda: moteur_disponibilite.appliquer(ouvrage_id, cle, None))
@@ -1,19 +1,52 @@
-from datetime import timedelta
+import random
+import re
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from rest_framework.test import APIClient
 
 from adherents.models import Adherent
-from core.models import Parametre
-from exemplaires.models import EtatExemplaire, Exemplaire
-from ouvrages.models import Ouvrage
+from core.models import (
+    Activity,
+    ActivityType,
+    Message,
+    Paiement,
+    Parametre,
+    StatutPaiement,
+    TypePaiement,
+    parametres_cache,
+)
+from exemplaires.models import EtatExemplaire, Exemplaire, creer_exemplaires
+from exemplaires.scan import cache_scan
+from ouvrages.models import DemandeLivre, Ebook, FormatEbook, Ouvrage
+from ouvrages.search import index_catalogue, index_trigrammes
+from ouvrages.suggestions import suggestions_catalogue
+from users.models import UserProfile, UserRole
+from users.serializers import RoleTokenObtainPairSerializer
 
-from .models import Emprunt, StatutEmprunt
+from .disponibilite import HORIZON_JOURS, ChronologieOccupation, _charger, moteur_disponibilite
+from .models import Emprunt, Penalite, Reservation, StatutEmprunt, StatutReservation
 from .services import (
+    changer_statut_reservation,
     creer_emprunt,
+    creer_reservation,
+    enregistrer_retour,
+    expirer_reservations,
     generer_ou_maj_penalite,
+    generer_penalites_en_lot,
+    get_duree_emprunt_jours,
+    get_quota_emprunts_actifs,
+    get_tarif_penalite_par_jour,
     recalculer_tous_les_retards,
 )
+from .views import resume_dashboard, taux_rotation_ouvrages
 
 
 User = get_user_model()
@@ -21,6 +54,8 @@ User = get_user_model()
 
 class EmpruntServiceTests(TestCase):
     def setUp(self):
+        # Le cache processus survit au rollback des tests: on repart d'un etat vide.
+        parametres_cache.invalider()
         self.user = User.objects.create_user(username="lecteur", password="pass")
         self.adherent = Adherent.objects.create(user=self.user, adresse="Test", telephone="000")
         self.ouvrage = Ouvrage.objects.create(
@@ -67,3 +102,916 @@ class EmpruntServiceTests(TestCase):
         penalite = generer_ou_maj_penalite(emprunt)
         self.assertIsNotNone(penalite)
         self.assertGreater(penalite.jours_retard, 0)
+
+    def test_recalcul_retards_ne_touche_que_les_emprunts_ouverts(self):
+        today = timezone.localdate()
+        en_retard = Emprunt.objects.create(
+            exemplaire=self.exemplaire,
+            adherent=self.adherent,
+            date_retour_prevue=today - timedelta(days=2),
+            statut=StatutEmprunt.EN_COURS,
+        )
+        prolonge = Emprunt.objects.create(
+            exemplaire=self.exemplaire,
+            adherent=self.adherent,
+            date_retour_prevue=today + timedelta(days=5),
+            statut=StatutEmprunt.EN_RETARD,
+        )
+        rendu = Emprunt.objects.create(
+            exemplaire=self.exemplaire,
+            adherent=self.adherent,
+            date_retour_prevue=today - timedelta(days=10),
+            date_retour_effective=today - timedelta(days=12),
+            statut=StatutEmprunt.RETOURNE,
+        )
+
+        par_statut = recalculer_tous_les_retards()
+
+        self.assertEqual(par_statut, {StatutEmprunt.EN_RETARD: 1, StatutEmprunt.EN_COURS: 1})
+        en_retard.refresh_from_db()
+        prolonge.refresh_from_db()
+        rendu.refresh_from_db()
+        self.assertEqual(en_retard.statut, StatutEmprunt.EN_RETARD)
+        self.assertEqual(prolonge.statut, StatutEmprunt.EN_COURS)
+        self.assertEqual(rendu.statut, StatutEmprunt.RETOURNE)
+        self.assertEqual(recalculer_tous_les_retards(), {StatutEmprunt.EN_RETARD: 0, StatutEmprunt.EN_COURS: 0})
+
+    def test_generer_penalites_en_lot(self):
+        today = timezone.localdate()
+        nouveau = Emprunt.objects.create(
+            exemplaire=self.exemplaire,
+            adherent=self.adherent,
+            date_retour_prevue=today - timedelta(days=4),
+            statut=StatutEmprunt.EN_RETARD,
+        )
+        deja_payee = Emprunt.objects.create(
+            exemplaire=self.exemplaire,
+            adherent=self.adherent,
+            date_retour_prevue=today - timedelta(days=6),
+            date_retour_effective=today - timedelta(days=1),
+            statut=StatutEmprunt.EN_RETARD,
+        )
+        Penalite.objects.create(emprunt=deja_payee, jours_retard=1, montant=Decimal("10"), payee=True)
+        a_jour = Emprunt.objects.create(
+            exemplaire=self.exemplaire,
+            adherent=self.adherent,
+            date_retour_prevue=today - timedelta(days=2),
+            statut=StatutEmprunt.EN_RETARD,
+        )
+        Penalite.objects.create(emprunt=a_jour, jours_retard=1, montant=Decimal("10"))
+
+        resultat = generer_penalites_en_lot(tarif_par_jour=Decimal("100"), taille_lot=2)
+
+        self.assertEqual(resultat, {"creees": 1, "mises_a_jour": 1, "payees_ignorees": 1})
+        self.assertEqual(nouveau.penalite.montant, Decimal("400"))
+        a_jour.penalite.refresh_from_db()
+        self.assertEqual(a_jour.penalite.jours_retard, 2)
+        deja_payee.penalite.refresh_from_db()
+        self.assertEqual(deja_payee.penalite.montant, Decimal("10"))
+        self.assertEqual(
+            Activity.objects.filter(type=ActivityType.PENALITE_CREE, user=self.user).count(),
+            1,
+        )
+
+    def test_parametres_en_cache_et_invalides_au_save(self):
+        get_quota_emprunts_actifs()
+        with self.assertNumQueries(0):
+            get_quota_emprunts_actifs()
+            get_duree_emprunt_jours()
+
+        parametres = Parametre.objects.get(id=1)
+        parametres.quota_emprunts_actifs = 7
+        parametres.save()
+        self.assertEqual(get_quota_emprunts_actifs(), 7)
+
+    def test_emprunts_en_lot_resultat_par_exemplaire(self):
+        quota = get_quota_emprunts_actifs()
+        libres = [
+            Exemplaire.objects.create(ouvrage=self.ouvrage, code_barre=f"EX-LOT-{i}") for i in range(quota)
+        ]
+        pris = Exemplaire.objects.create(ouvrage=self.ouvrage, code_barre="EX-LOT-PRIS", etat=EtatExemplaire.EMPRUNTE)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser(username="admin", password="pass"))
+
+        ids = [self.exemplaire.id] + [e.id for e in libres] + [pris.id, 999999]
+        response = client.post(
+            "/api/emprunts/creer-lot/",
+            {"adherent_id": self.adherent.id, "exemplaire_ids": ids},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["crees"], quota)
+        details = [r.get("detail") for r in response.data["resultats"]]
+        self.assertEqual(
+            details,
+            [None] * quota + ["Quota d'emprunts actifs depasse.", "Exemplaire indisponible.", "Exemplaire introuvable."],
+        )
+        self.assertEqual(Emprunt.objects.filter(adherent=self.adherent).count(), quota)
+        self.assertEqual(Activity.objects.filter(type=ActivityType.EMPRUNT_CREE).count(), quota)
+        self.ouvrage.refresh_from_db()
+        self.assertEqual(self.ouvrage.exemplaires_disponibles, 1)
+
+    def test_retours_en_lot_par_code_barre(self):
+        Parametre.objects.update_or_create(id=1, defaults={"quota_emprunts_actifs": 10})
+        exemplaires = [self.exemplaire] + [
+            Exemplaire.objects.create(ouvrage=self.ouvrage, code_barre=f"EX-RET-{i}") for i in range(4)
+        ]
+        emprunts = [creer_emprunt(exemplaire=e, adherent=self.adherent) for e in exemplaires[:4]]
+        Emprunt.objects.filter(id__in=[emprunts[0].id, emprunts[2].id]).update(
+            date_retour_prevue=timezone.localdate() - timedelta(days=2)
+        )
+        # Penalite deja reglee: laissee telle quelle, aucun montant annonce.
+        Penalite.objects.create(emprunt=emprunts[2], jours_retard=1, montant=Decimal("0.50"), payee=True)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser(username="admin", password="pass"))
+
+        codes = [e.code_barre for e in exemplaires] + ["INCONNU"]
+        with CaptureQueriesContext(connection) as requetes:
+            response = client.post("/api/emprunts/retour-lot/", {"codes_barre": codes}, format="json")
+        self.assertLess(len(requetes.captured_queries), 20)
+
+        self.assertEqual(response.data["rendus"], 4)
+        resultats = response.data["resultats"]
+        self.assertEqual(resultats[0]["jours_retard"], 2)
+        self.assertEqual(Decimal(resultats[0]["penalite"]), 2 * get_tarif_penalite_par_jour())
+        self.assertIsNone(resultats[1]["penalite"])
+        self.assertEqual(resultats[2]["jours_retard"], 2)
+        self.assertIsNone(resultats[2]["penalite"])
+        self.assertEqual(resultats[4]["detail"], "Aucun emprunt en cours.")
+        self.assertEqual(resultats[5]["detail"], "Exemplaire introuvable.")
+
+        statuts = dict(Emprunt.objects.values_list("id", "statut"))
+        self.assertEqual(statuts[emprunts[0].id], StatutEmprunt.EN_RETARD)
+        self.assertEqual(statuts[emprunts[1].id], StatutEmprunt.RETOURNE)
+        self.assertEqual(Penalite.objects.get(payee=False).emprunt_id, emprunts[0].id)
+        self.assertEqual(Penalite.objects.get(payee=True).montant, Decimal("0.50"))
+        self.ouvrage.refresh_from_db()
+        self.assertEqual(self.ouvrage.exemplaires_disponibles, 5)
+
+        response = client.post("/api/emprunts/retour-lot/", {"codes_barre": codes[:1]}, format="json")
+        self.assertEqual(response.data["rendus"], 0)
+
+    def test_taux_rotation_classe_en_sql(self):
+        autre = Ouvrage.objects.create(isbn="9780306406164", titre="Autre", auteur="Auteur", categorie="Test")
+        creer_exemplaires(autre, 4)
+        creer_emprunt(exemplaire=self.exemplaire, adherent=self.adherent)
+        creer_emprunt(exemplaire=autre.exemplaires.first(), adherent=self.adherent)
+
+        with self.assertNumQueries(1):
+            classement = taux_rotation_ouvrages(limit=10)
+        self.assertEqual(
+            [(ligne["ouvrage_id"], ligne["nb_exemplaires"], ligne["taux_rotation"]) for ligne in classement],
+            [(self.ouvrage.id, 1, 1.0), (autre.id, 4, 0.25)],
+        )
+        with self.assertNumQueries(2):
+            resume = resume_dashboard()
+        self.assertEqual(
+            resume,
+            {"nb_emprunts_total": 2, "nb_emprunts_en_retard": 0, "nb_penalites_impayees": 0},
+        )
+
+
+class DisponibiliteTests(TestCase):
+    def setUp(self):
+        moteur_disponibilite.vider()
+        self.today = timezone.localdate()
+        self.ouvrage = Ouvrage.objects.create(isbn="9780306406157", titre="Dispo", auteur="Auteur", categorie="Test")
+        self.exemplaires = creer_exemplaires(self.ouvrage, 2)
+        self.ouvrage.refresh_from_db()
+        user = User.objects.create_user(username="lecteur", password="pass")
+        self.adherent = Adherent.objects.create(user=user, adresse="Test", telephone="000")
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_chronologie_identique_au_calcul_naif(self):
+        generateur = random.Random(42)
+        chronologie = ChronologieOccupation(self.today, 60)
+        jours = [0] * 60
+        for _ in range(200):
+            a, b = sorted(generateur.randrange(60) for _ in range(2))
+            delta = generateur.choice([1, -1])
+            chronologie.ajouter(self.today + timedelta(days=a), self.today + timedelta(days=b), delta)
+            for jour in range(a, b + 1):
+                jours[jour] += delta
+            a, b = sorted(generateur.randrange(60) for _ in range(2))
+            self.assertEqual(
+                chronologie.occupation_max(self.today + timedelta(days=a), self.today + timedelta(days=b)),
+                max(jours[a:b + 1]),
+            )
+
+    def reserver(self, debut, fin):
+        return self.client.post(
+            "/api/reservations/",
+            {
+                "ouvrage_id": self.ouvrage.id,
+                "date_debut": str(self.today + timedelta(days=debut)),
+                "date_fin": str(self.today + timedelta(days=fin)),
+            },
+            format="json",
+        )
+
+    def test_reservation_selon_le_jour_le_plus_charge(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            creer_emprunt(exemplaire=self.exemplaires[0], adherent=self.adherent)
+        # Un exemplaire reste libre: reservation refusee, chronologie chargee.
+        self.assertEqual(self.reserver(1, 5).status_code, 400)
+        self.assertEqual(moteur_disponibilite.exemplaires_libres(self.ouvrage, self.today, self.today), 1)
+
+        # Mise a jour incrementale: le second exemplaire part, la reservation devient possible.
+        with self.captureOnCommitCallbacks(execute=True):
+            creer_emprunt(exemplaire=self.exemplaires[1], adherent=self.adherent)
+        with self.assertNumQueries(0):
+            self.assertEqual(moteur_disponibilite.exemplaires_libres(self.ouvrage, self.today, self.today), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.reserver(1, 5).status_code, 201)
+
+        fin_retour = get_duree_emprunt_jours()
+        self.assertEqual(
+            moteur_disponibilite.occupation_max(self.ouvrage.id, self.today + timedelta(days=1), self.today),
+            0,
+        )
+        self.assertEqual(
+            moteur_disponibilite.occupation_max(
+                self.ouvrage.id, self.today + timedelta(days=1), self.today + timedelta(days=fin_retour)
+            ),
+            3,
+        )
+
+    def test_reservation_ignore_la_chronologie_perimee(self):
+        # Un autre processus rend les deux exemplaires sans que ce cache le sache:
+        # la creation relit l'occupation en base et refuse la reservation.
+        with self.captureOnCommitCallbacks(execute=True):
+            for exemplaire in self.exemplaires[:2]:
+                creer_emprunt(exemplaire=exemplaire, adherent=self.adherent)
+        self.assertEqual(moteur_disponibilite.exemplaires_libres(self.ouvrage, self.today, self.today), 0)
+        Emprunt.objects.update(statut=StatutEmprunt.RETOURNE, date_retour_effective=self.today)
+        Ouvrage.objects.filter(id=self.ouvrage.id).update(exemplaires_disponibles=2)
+
+        reponse = self.reserver(1, 5)
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn("2 exemplaire(s) libre(s)", reponse.data["detail"])
+        self.assertFalse(Reservation.objects.exists())
+        # La chronologie relue remplace celle du cache.
+        with self.assertNumQueries(0):
+            self.assertEqual(moteur_disponibilite.exemplaires_libres(self.ouvrage, self.today, self.today), 2)
+
+    def test_calendrier_jour_par_jour(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            emprunt = creer_emprunt(exemplaire=self.exemplaires[0], adherent=self.adherent)
+            Reservation.objects.create(
+                adherent=self.adherent,
+                ouvrage=self.ouvrage,
+                date_debut=self.today + timedelta(days=2),
+                date_fin=self.today + timedelta(days=3),
+                montant_estime=Decimal("0"),
+                statut=StatutReservation.VALIDEE,
+            )
+        retour = (emprunt.date_retour_prevue - self.today).days
+        url = f"/api/catalogue/ouvrages/{self.ouvrage.id}/disponibilite/"
+        response = self.client.get(url, {"to": str(self.today + timedelta(days=retour + 1))})
+        self.assertEqual(response.status_code, 200)
+        attendus = [1] * (retour + 2)
+        attendus[2] = attendus[3] = 0
+        attendus[retour + 1] = 2
+        self.assertEqual([jour["disponibles"] for jour in response.data["jours"]], attendus)
+
+        # Chronologie en cache: seule la lecture de l'ouvrage touche la base.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url, {"from": "2000-01-01"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"to": "pas-une-date"}).status_code, 400)
+
+    def test_chargement_hors_verrou(self):
+        autre = Ouvrage.objects.create(isbn="9780131103627", titre="Autre", auteur="Auteur", categorie="Test")
+        self.assertEqual(moteur_disponibilite.occupation_max(autre.id, self.today, self.today), 0)
+        lectures = []
+
+        def charger_lentement(ouvrage_id, today):
+            # Pendant le chargement: les autres ouvrages restent lisibles, et un changement
+            # concurrent sur celui-ci empeche de garder la chronologie chargee.
+            lecteur = threading.Thread(
+                target=lambda: lectures.append(moteur_disponibilite.occupation_max(autre.id, today, today))
+            )
+            lecteur.start()
+            lecteur.join(timeout=5)
+            moteur_disponibilite.appliquer(ouvrage_id, ("emprunt", 0), (today, today))
+            return _charger(ouvrage_id, today)
+
+        with mock.patch("emprunts.disponibilite._charger", side_effect=charger_lentement):
+            moteur_disponibilite.occupation_max(self.ouvrage.id, self.today, self.today)
+        self.assertEqual(lectures, [0])
+        with self.assertNumQueries(2):
+            moteur_disponibilite.occupation_max(self.ouvrage.id, self.today, self.today)
+
+    def test_reservation_bornee_a_l_horizon(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for exemplaire in self.exemplaires:
+                creer_emprunt(exemplaire=exemplaire, adherent=self.adherent)
+        reponse = self.reserver(1, HORIZON_JOURS + 1)
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn("Date de fin invalide", reponse.data["detail"])
+        self.assertEqual(self.reserver(1, HORIZON_JOURS).status_code, 201)
+
+    def test_chronologie_de_taille_fixe(self):
+        # Une reservation tres lointaine ne fait pas grossir la chronologie: elle est tronquee.
+        Reservation.objects.create(
+            adherent=self.adherent,
+            ouvrage=self.ouvrage,
+            date_debut=self.today + timedelta(days=10),
+            date_fin=date(4000, 1, 1),
+            montant_estime=Decimal("0"),
+            statut=StatutReservation.EN_ATTENTE,
+        )
+        dispo = _charger(self.ouvrage.id, self.today)
+        self.assertEqual(dispo.chronologie.nb_jours, HORIZON_JOURS + 1)
+        limite = self.today + timedelta(days=HORIZON_JOURS)
+        self.assertEqual(dispo.chronologie.occupation_max(limite, limite), 1)
+        self.assertEqual(dispo.chronologie.occupation_max(self.today, self.today + timedelta(days=9)), 0)
+
+    def test_calendrier_borne_a_l_horizon(self):
+        url = f"/api/catalogue/ouvrages/{self.ouvrage.id}/disponibilite/"
+        limite = self.today + timedelta(days=HORIZON_JOURS)
+        for params in [{"from": "9999-12-25"}, {"from": str(self.today), "to": "9999-01-02"}]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("hors horizon", response.data["detail"])
+        # Derniers jours de l'horizon: periode par defaut tronquee a la limite.
+        response = self.client.get(url, {"from": str(limite - timedelta(days=2))})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["to"], limite)
+        self.assertEqual(len(response.data["jours"]), 3)
+
+
+class ReservationFileTests(TestCase):
+    def setUp(self):
+        parametres_cache.invalider()
+        self.today = timezone.localdate()
+        self.ouvrage = Ouvrage.objects.create(isbn="9780306406157", titre="File", auteur="Auteur", categorie="Test")
+        self.exemplaire = creer_exemplaires(self.ouvrage, 1)[0]
+        self.adherents = [
+            Adherent.objects.create(
+                user=User.objects.create_user(username=f"lecteur{i}", password="pass"),
+                adresse="Test",
+                telephone="000",
+            )
+            for i in range(3)
+        ]
+
+    def reservation(self, adherent, debut, fin, statut=StatutReservation.EN_ATTENTE):
+        return Reservation.objects.create(
+            adherent=adherent,
+            ouvrage=self.ouvrage,
+            date_debut=self.today + timedelta(days=debut),
+            date_fin=self.today + timedelta(days=fin),
+            montant_estime=Decimal("0"),
+            statut=statut,
+        )
+
+    def test_expiration_des_reservations_passees(self):
+        passee = self.reservation(self.adherents[0], -5, -1)
+        validee = self.reservation(self.adherents[1], -5, -1, StatutReservation.VALIDEE)
+        en_cours = self.reservation(self.adherents[2], -1, 3)
+        self.assertEqual(expirer_reservations(), {"expirees": 2})
+        statuts = dict(Reservation.objects.values_list("id", "statut"))
+        self.assertEqual(statuts[passee.id], StatutReservation.EXPIREE)
+        self.assertEqual(statuts[validee.id], StatutReservation.EXPIREE)
+        self.assertEqual(statuts[en_cours.id], StatutReservation.EN_ATTENTE)
+        self.assertEqual(expirer_reservations(), {"expirees": 0})
+
+    def en_file(self, adherent, debut, fin):
+        return creer_reservation(
+            adherent=adherent,
+            ouvrage=self.ouvrage,
+            date_debut=self.today + timedelta(days=debut),
+            date_fin=self.today + timedelta(days=fin),
+            montant_estime=Decimal("0"),
+        )
+
+    def positions(self):
+        return dict(Reservation.objects.values_list("id", "position"))
+
+    def test_file_dense_maintenue(self):
+        reservations = [self.en_file(adherent, 0, 4) for adherent in self.adherents]
+        self.assertEqual([r.position for r in reservations], [1, 2, 3])
+
+        changer_statut_reservation(reservations[0], StatutReservation.ANNULEE)
+        positions = self.positions()
+        self.assertIsNone(positions[reservations[0].id])
+        self.assertEqual([positions[r.id] for r in reservations[1:]], [1, 2])
+        self.assertEqual(self.en_file(self.adherents[0], 1, 5).position, 3)
+
+    def test_changement_de_statut_sur_instance_perimee(self):
+        # Deux traitements concurrents: le second relit le statut sous le verrou et echoue.
+        premiere, seconde = [self.en_file(adherent, 0, 4) for adherent in self.adherents[:2]]
+        perimee = Reservation.objects.get(id=premiere.id)
+        changer_statut_reservation(premiere, StatutReservation.ANNULEE)
+
+        with self.assertRaisesMessage(ValueError, "Reservation deja traitee."):
+            changer_statut_reservation(perimee, StatutReservation.VALIDEE)
+        positions = self.positions()
+        self.assertEqual(Reservation.objects.get(id=premiere.id).statut, StatutReservation.ANNULEE)
+        self.assertEqual([positions[premiere.id], positions[seconde.id]], [None, 1])
+
+    def test_retour_valide_la_prochaine_reservation(self):
+        emprunt = creer_emprunt(exemplaire=self.exemplaire, adherent=self.adherents[0])
+        future = self.en_file(self.adherents[0], 10, 12)
+        premiere = self.en_file(self.adherents[1], -1, 4)
+        seconde = self.en_file(self.adherents[2], -2, 4)
+
+        enregistrer_retour(emprunt=emprunt)
+        statuts = dict(Reservation.objects.values_list("id", "statut"))
+        self.assertEqual(statuts[premiere.id], StatutReservation.VALIDEE)
+        self.assertEqual(statuts[seconde.id], StatutReservation.EN_ATTENTE)
+        self.assertEqual(statuts[future.id], StatutReservation.EN_ATTENTE)
+        # La reservation promue quitte la file, les suivantes remontent.
+        positions = self.positions()
+        self.assertEqual((positions[future.id], positions[premiere.id], positions[seconde.id]), (1, None, 2))
+
+        expirer_reservations()
+        self.assertEqual(self.positions()[seconde.id], 2)
+        Reservation.objects.filter(id=future.id).update(date_fin=self.today - timedelta(days=1))
+        self.assertEqual(expirer_reservations(), {"expirees": 1})
+        self.assertEqual(self.positions()[seconde.id], 1)
+
+
+class EmpruntConcurrenceTests(TransactionTestCase):
+    # Plusieurs threads (une connexion chacun) empruntent en meme temps.
+    def setUp(self):
+        parametres_cache.invalider()
+        self.ouvrage = Ouvrage.objects.create(
+            isbn="9780306406157", titre="Concurrence", auteur="Auteur", categorie="Test"
+        )
+
+    def emprunter_en_parallele(self, demandes):
+        barriere = threading.Barrier(len(demandes))
+        resultats = []
+
+        def emprunter(exemplaire_id, adherent_id):
+            try:
+                exemplaire = Exemplaire.objects.get(id=exemplaire_id)
+                adherent = Adherent.objects.get(id=adherent_id)
+                barriere.wait()
+                creer_emprunt(exemplaire=exemplaire, adherent=adherent)
+                resultats.append("ok")
+            except ValueError as ex:
+                resultats.append(str(ex))
+            except Exception as ex:
+                resultats.append(type(ex).__name__)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=emprunter, args=demande) for demande in demandes]
+        # SQLite verrouille la table entiere (erreur immediate, sans attente): on laisse
+        # plus de rejeux qu'en production pour absorber la contention du test.
+        with mock.patch("emprunts.services.TENTATIVES_EMPRUNT", 10):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return resultats
+
+    def creer_adherent(self, username):
+        user = User.objects.create_user(username=username, password="pass")
+        return Adherent.objects.create(user=user, adresse="Test", telephone="000")
+
+    def verifier_coherence(self, resultats):
+        # Ce qui ne depend pas de l'ordonnancement des threads: un emprunt au plus par exemplaire,
+        # un emprunt par "ok", compteurs egaux a l'etat des exemplaires en base.
+        self.assertFalse(Emprunt.objects.values("exemplaire").annotate(n=Count("id")).filter(n__gt=1).exists())
+        self.assertEqual(Emprunt.objects.count(), resultats.count("ok"))
+        exemplaires = Exemplaire.objects.filter(ouvrage=self.ouvrage)
+        self.assertEqual(exemplaires.filter(etat=EtatExemplaire.EMPRUNTE).count(), Emprunt.objects.count())
+        self.ouvrage.refresh_from_db()
+        self.assertEqual(
+            (self.ouvrage.exemplaires_total, self.ouvrage.exemplaires_disponibles),
+            (exemplaires.count(), exemplaires.filter(etat=EtatExemplaire.DISPONIBLE).count()),
+        )
+
+    def test_un_seul_emprunt_par_exemplaire(self):
+        exemplaire = Exemplaire.objects.create(ouvrage=self.ouvrage, code_barre="EX-CONC-1")
+        adherents = [self.creer_adherent(f"lecteur{i}") for i in range(8)]
+
+        resultats = self.emprunter_en_parallele([(exemplaire.id, a.id) for a in adherents])
+
+        self.assertEqual(resultats.count("ok") + resultats.count("Exemplaire indisponible."), 8)
+        self.assertEqual(Emprunt.objects.filter(exemplaire=exemplaire).count(), 1)
+        self.verifier_coherence(resultats)
+
+    def test_quota_respecte_et_exemplaires_tous_pretes(self):
+        exemplaires = [
+            Exemplaire.objects.create(ouvrage=self.ouvrage, code_barre=f"EX-CONC-{i}") for i in range(8)
+        ]
+        adherents = [self.creer_adherent(f"lecteur{i}") for i in range(4)]
+        quota = get_quota_emprunts_actifs()
+
+        # Chaque adherent demande 2 exemplaires distincts (quota >= 2): aucun refus metier possible.
+        demandes = [(e.id, adherents[i % 4].id) for i, e in enumerate(exemplaires)]
+        resultats = self.emprunter_en_parallele(demandes)
+        self.assertNotIn("Exemplaire indisponible.", resultats)
+        self.assertNotIn("Quota d'emprunts actifs depasse.", resultats)
+        self.verifier_coherence(resultats)
+
+        # Le meme adherent demande plus que son quota restant en parallele.
+        autres = [
+            Exemplaire.objects.create(ouvrage=self.ouvrage, code_barre=f"EX-QUOTA-{i}") for i in range(quota + 2)
+        ]
+        gourmand = self.creer_adherent("gourmand")
+        resultats = self.emprunter_en_parallele([(e.id, gourmand.id) for e in autres])
+        self.assertLessEqual(resultats.count("ok"), quota)
+        self.assertEqual(resultats.count("ok") + resultats.count("Quota d'emprunts actifs depasse."), quota + 2)
+        self.assertEqual(Emprunt.objects.filter(adherent=gourmand).count(), resultats.count("ok"))
+
+
+class PlansRequetesTests(TestCase):
+    # Les listes les plus sollicitees doivent etre servies par un index (pas de parcours complet).
+    ENDPOINTS_STAFF = [
+        "/api/emprunts/recents/",
+        "/api/emprunts/recents/?statut=EN_COURS",
+        "/api/emprunts/historique/",
+        "/api/emprunts/retards/",
+        "/api/emprunts/en-cours/",
+        "/api/penalites/",
+        "/api/penalites/?payee=false",
+        "/api/reservations/",
+        "/api/reservations/?statut=EN_ATTENTE",
+        "/api/dashboard/activities/",
+        "/api/messages/",
+        "/api/catalogue/ouvrages/",
+        "/api/catalogue/ouvrages/?categorie=Roman",
+        "/api/catalogue/ouvrages/?type_ressource=LIVRE",
+        "/api/catalogue/exemplaires-disponibles/",
+    ]
+    ENDPOINTS_LECTEUR = [
+        "/api/emprunts/recents/",
+        "/api/emprunts/historique/",
+        "/api/penalites/me/",
+        "/api/reservations/me/",
+        "/api/dashboard/activities/",
+        "/api/messages/",
+    ]
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username="biblio", password="pass")
+        UserProfile.objects.create(user=self.staff, role=UserRole.BIBLIOTHECAIRE)
+        self.lecteur = User.objects.create_user(username="lecteur", password="pass")
+        UserProfile.objects.create(user=self.lecteur, role=UserRole.LECTEUR)
+        Adherent.objects.create(user=self.lecteur, adresse="Test", telephone="000")
+
+    def parcours_complets(self, sql):
+        if connection.vendor == "postgresql":
+            with transaction.atomic(), connection.cursor() as cursor:
+                # Tables minuscules: sans ceci le planificateur prefere toujours le parcours sequentiel.
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("EXPLAIN " + sql)
+                plan = "\n".join(ligne[0] for ligne in cursor.fetchall())
+            return re.findall(r"Seq Scan on (\w+)", plan)
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            plan = [ligne[-1] for ligne in cursor.fetchall()]
+        # "SCAN t USING [COVERING] INDEX i" parcourt un index: seul "SCAN t" seul est refuse.
+        return [m.group(1) for ligne in plan if (m := re.fullmatch(r"SCAN (?:TABLE )?(\w+)", ligne))]
+
+    def verifier(self, user, endpoints):
+        client = APIClient()
+        client.force_authenticate(user)
+        for url in endpoints:
+            with CaptureQueriesContext(connection) as requetes:
+                self.assertEqual(client.get(url).status_code, 200, url)
+            for requete in requetes.captured_queries:
+                if requete["sql"].startswith("SELECT"):
+                    with self.subTest(url=url, sql=requete["sql"]):
+                        self.assertEqual(self.parcours_complets(requete["sql"]), [])
+
+    def test_listes_staff_sans_parcours_complet(self):
+        self.verifier(self.staff, self.ENDPOINTS_STAFF)
+
+    def test_listes_lecteur_sans_parcours_complet(self):
+        self.verifier(self.lecteur, self.ENDPOINTS_LECTEUR)
+
+
+class BudgetsRequetesTests(TestCase):
+    # Nombre exact de requetes SQL par endpoint, sur un jeu de donnees de taille realiste.
+    # Listes mesurees avec deux tailles de page et lots avec deux tailles: un N+1 change le
+    # compte et fait echouer le test. Authentification JWT comme en production (role dans le
+    # token: 1 requete, chargement du user). Les caches de donnees (index, chronologies, scan)
+    # sont vides avant chaque mesure: leur chargement est compte. Les parametres systeme,
+    # lus par chaque ecriture, sont precharges (toujours en cache en production).
+    # Savepoints et liberations non comptes (BEGIN/COMMIT hors tests).
+    NB_OUVRAGES = 60
+    NB_EXEMPLAIRES = 3
+    NB_ADHERENTS = 30
+    TAILLES_PAGE = (5, 50)
+
+    @classmethod
+    def setUpTestData(cls):
+        parametres_cache.invalider()
+        Parametre.objects.update_or_create(id=1, defaults={"quota_emprunts_actifs": 5})
+        cls.admin = User.objects.create_user(username="admin", password="pass")
+        UserProfile.objects.create(user=cls.admin, role=UserRole.ADMIN)
+        cls.staff = User.objects.create_user(username="biblio", password="pass")
+        UserProfile.objects.create(user=cls.staff, role=UserRole.BIBLIOTHECAIRE)
+
+        cls.adherents = []
+        for i in range(cls.NB_ADHERENTS):
+            user = User.objects.create_user(username=f"lecteur{i}", password="pass", last_name=f"Nom {i}")
+            UserProfile.objects.create(user=user, role=UserRole.LECTEUR)
+            cls.adherents.append(Adherent.objects.create(user=user, adresse="Test", telephone=f"{i:03d}"))
+        cls.lecteur = cls.adherents[0].user
+        # Deux adherents sans emprunt, pour les creations a mesurer.
+        emprunteurs, cls.sans_emprunt = cls.adherents[:-2], cls.adherents[-2:]
+
+        cls.ouvrages = [
+            Ouvrage.objects.create(
+                isbn=f"97800000{i:05d}",
+                titre=f"Titre {i}",
+                auteur=f"Auteur {i % 12}",
+                categorie=f"Categorie {i % 5}",
+            )
+            for i in range(cls.NB_OUVRAGES)
+        ]
+        exemplaires = [creer_exemplaires(ouvrage, cls.NB_EXEMPLAIRES) for ouvrage in cls.ouvrages]
+        creer_exemplaires(cls.ouvrages[0], 12)
+
+        today = timezone.localdate()
+        # Historique: emprunts rendus (plus longs pour le lecteur), penalites reglees.
+        rendus = Emprunt.objects.bulk_create([
+            Emprunt(
+                exemplaire=exemplaires[(i + j) % cls.NB_OUVRAGES][2],
+                adherent=adherent,
+                date_retour_prevue=today - timedelta(days=30 + j),
+                date_retour_effective=today - timedelta(days=25 + j),
+                statut=StatutEmprunt.RETOURNE,
+            )
+            for i, adherent in enumerate(emprunteurs)
+            for j in range(12 if i == 0 else 3)
+        ])
+        Penalite.objects.bulk_create([
+            Penalite(emprunt=emprunt, jours_retard=5, montant=Decimal("5000"), payee=True) for emprunt in rendus
+        ])
+        # Emprunts ouverts: un par adherent sur les ouvrages 2i et 2i+1, le second en retard.
+        ouverts = [
+            creer_emprunt(exemplaire=exemplaires[2 * i + j][0], adherent=adherent)
+            for i, adherent in enumerate(emprunteurs)
+            for j in range(2)
+        ]
+        Emprunt.objects.filter(id__in=[e.id for e in ouverts[1::2]]).update(
+            date_retour_prevue=today - timedelta(days=4)
+        )
+        recalculer_tous_les_retards()
+        generer_penalites_en_lot()
+
+        # Files de reservation: a venir, et commencees (promues par les retours).
+        for i, adherent in enumerate(emprunteurs):
+            for j in range(8 if i == 0 else 2):
+                creer_reservation(
+                    adherent=adherent,
+                    ouvrage=cls.ouvrages[(i + 3 * j) % cls.NB_OUVRAGES],
+                    date_debut=today + timedelta(days=1 + j),
+                    date_fin=today + timedelta(days=8 + j),
+                    montant_estime=Decimal("7000"),
+                )
+        for i, adherent in enumerate(emprunteurs[1:21]):
+            creer_reservation(
+                adherent=adherent,
+                ouvrage=cls.ouvrages[i % 10 + 20],
+                date_debut=today,
+                date_fin=today + timedelta(days=7),
+                montant_estime=Decimal("7000"),
+            )
+
+        # Ouvrage sans exemplaire libre (reservation possible), ouvrage supprimable.
+        cls.complet = Ouvrage.objects.create(isbn="9780000099999", titre="Complet", auteur="A", categorie="C")
+        creer_emprunt(exemplaire=creer_exemplaires(cls.complet, 1)[0], adherent=emprunteurs[5])
+        cls.supprimable = Ouvrage.objects.create(isbn="9780000099998", titre="Retire", auteur="A", categorie="C")
+        creer_exemplaires(cls.supprimable, cls.NB_EXEMPLAIRES)
+
+        DemandeLivre.objects.bulk_create([
+            DemandeLivre(adherent=cls.adherents[i % 10], titre=f"Demande {i}", auteur="Auteur") for i in range(80)
+        ])
+        cls.ebooks = Ebook.objects.bulk_create([
+            Ebook(
+                ouvrage=cls.ouvrages[i],
+                url_fichier=f"https://example.org/{i}.pdf",
+                format=FormatEbook.PDF,
+                nom_fichier=f"ebook-{i:02d}.pdf",
+                est_payant=i % 2 == 0,
+                prix=Decimal("500") if i % 2 == 0 else None,
+            )
+            for i in range(cls.NB_OUVRAGES)
+        ])
+        Paiement.objects.create(
+            user=cls.lecteur,
+            type=TypePaiement.EBOOK,
+            reference_objet=cls.ebooks[0].id,
+            montant=Decimal("500"),
+            statut=StatutPaiement.PAYE,
+        )
+        Message.objects.bulk_create([
+            Message(sender=adherent.user, recipient=cls.staff if i % 2 else None, contenu=f"Message {i}")
+            for i, adherent in enumerate(cls.adherents[:10] * 8)
+        ])
+        Activity.objects.bulk_create([
+            Activity(type=ActivityType.EMPRUNT_CREE, message=f"Activite {i}", user=cls.adherents[i % 3].user)
+            for i in range(150)
+        ])
+
+    def setUp(self):
+        parametres_cache.invalider()
+        parametres_cache.get()
+
+    def vider_caches(self):
+        moteur_disponibilite.vider()
+        cache_scan.vider()
+        index_catalogue.invalider()
+        index_trigrammes.invalider()
+        suggestions_catalogue.invalider()
+
+    def verifier(self, user, budget, methode, url, data=None, statut=200, format="json"):
+        client = APIClient()
+        token = RoleTokenObtainPairSerializer.get_token(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.vider_caches()
+        with CaptureQueriesContext(connection) as capture:
+            response = getattr(client, methode)(url, data, format=format)
+        self.assertEqual(response.status_code, statut, f"{methode.upper()} {url}: {response.content[:200]}")
+        requetes = [q["sql"] for q in capture.captured_queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(
+            len(requetes),
+            budget,
+            f"{methode.upper()} {url}: {len(requetes)} requetes (budget {budget})\n" + "\n".join(requetes),
+        )
+        return response
+
+    def verifier_liste(self, user, budget, url):
+        separateur = "&" if "?" in url else "?"
+        pages = [
+            self.verifier(user, budget, "get", f"{url}{separateur}page_size={taille}").data["results"]
+            for taille in self.TAILLES_PAGE
+        ]
+        # Sans page plus grande, la mesure ne prouverait rien.
+        self.assertGreater(len(pages[-1]), len(pages[0]), url)
+
+    def test_listes_staff(self):
+        ouvrage = self.ouvrages[0].id
+        for budget, url in [
+            (3, "/api/emprunts/recents/"),
+            (3, "/api/emprunts/historique/"),
+            (3, "/api/emprunts/retards/"),
+            (3, "/api/emprunts/en-cours/"),
+            (3, "/api/penalites/"),
+            (3, "/api/reservations/"),
+            (3, "/api/dashboard/activities/"),
+            (3, "/api/catalogue/ouvrages/"),
+            (4, "/api/catalogue/ouvrages/?search=titre"),
+            (4, "/api/catalogue/ouvrages/?facets=true"),
+            (3, "/api/demandes-livres/"),
+            (3, "/api/ebooks/"),
+            (3, "/api/adherents/"),
+            (3, "/api/catalogue/exemplaires-disponibles/"),
+            (4, f"/api/catalogue/ouvrages/{ouvrage}/exemplaires/"),
+        ]:
+            with self.subTest(url=url):
+                self.verifier_liste(self.staff, budget, url)
+
+    def test_listes_lecteur(self):
+        for budget, url in [
+            (3, "/api/emprunts/recents/"),
+            (3, "/api/emprunts/historique/"),
+            (3, "/api/penalites/me/"),
+            (3, "/api/reservations/"),
+            (3, "/api/reservations/me/"),
+            (3, "/api/dashboard/activities/"),
+            (3, "/api/demandes-livres/me/"),
+            (3, "/api/catalogue/ouvrages/"),
+        ]:
+            with self.subTest(url=url):
+                self.verifier_liste(self.lecteur, budget, url)
+
+    def test_lectures(self):
+        ouvrage = self.ouvrages[0].id
+        paye, gratuit = self.ebooks[0].id, self.ebooks[1].id
+        code = Exemplaire.objects.filter(ouvrage=self.complet).values_list("code_barre", flat=True).get()
+        for user, budget, url in [
+            (self.staff, 2, "/api/messages/"),
+            (self.lecteur, 2, "/api/messages/"),
+            (self.staff, 7, "/api/dashboard/stats/"),
+            (self.lecteur, 4, "/api/dashboard/stats/"),
+            (self.admin, 1, "/api/ops/metrics/"),
+            (self.lecteur, 3, "/api/catalogue/suggest/?q=tit"),
+            (self.lecteur, 2, f"/api/catalogue/ouvrages/{ouvrage}/"),
+            (self.lecteur, 4, f"/api/catalogue/ouvrages/{ouvrage}/disponibilite/"),
+            (self.lecteur, 2, f"/api/ebooks/{paye}/"),
+            (self.lecteur, 3, f"/api/ebooks/{paye}/download/"),
+            (self.lecteur, 2, f"/api/ebooks/{gratuit}/download/"),
+            (self.staff, 2, f"/api/exemplaires/scan/{code}/"),
+        ]:
+            with self.subTest(url=url):
+                self.verifier(user, budget, "get", url)
+
+    def libres(self, ouvrages):
+        return [
+            Exemplaire.objects.filter(ouvrage=ouvrage, etat=EtatExemplaire.DISPONIBLE).values_list("id", flat=True)[0]
+            for ouvrage in ouvrages
+        ]
+
+    def test_emprunts(self):
+        premier, *lot = self.libres(self.ouvrages[40:44])
+        self.verifier(
+            self.staff, 8, "post", "/api/emprunts/creer/",
+            {"exemplaire_id": premier, "adherent_id": self.sans_emprunt[0].id}, 201,
+        )
+        self.verifier(
+            self.adherents[3].user, 8, "post", "/api/lecteur/emprunts/creer/", {"exemplaire_id": lot[0]}, 201
+        )
+        # Lot de 1 puis de 3 exemplaires: meme budget.
+        lots = [(self.sans_emprunt[1], lot[1:2]), (self.sans_emprunt[0], self.libres(self.ouvrages[44:47]))]
+        for adherent, ids in lots:
+            self.verifier(
+                self.staff, 10, "post", "/api/emprunts/creer-lot/",
+                {"adherent_id": adherent.id, "exemplaire_ids": ids}, 201,
+            )
+
+    def test_retours(self):
+        ouverts = Emprunt.objects.filter(date_retour_effective__isnull=True).order_by("exemplaire__ouvrage_id")
+        en_retard = ouverts.filter(statut=StatutEmprunt.EN_RETARD)
+        # Retour d'un emprunt en retard (penalite mise a jour) avec une reservation promue.
+        emprunt = en_retard.filter(exemplaire__ouvrage=self.ouvrages[21]).get()
+        self.verifier(self.staff, 12, "post", f"/api/emprunts/{emprunt.id}/retour/")
+        emprunt = ouverts.filter(adherent__user=self.lecteur).first()
+        self.verifier(self.lecteur, 8, "post", f"/api/lecteur/emprunts/{emprunt.id}/retour/")
+        # Lot de 1 puis de 3 codes-barres (retards, reservations promues): meme budget.
+        for ouvrages in [self.ouvrages[23:24], self.ouvrages[25:30:2]]:
+            codes = list(
+                en_retard.filter(exemplaire__ouvrage__in=ouvrages).values_list("exemplaire__code_barre", flat=True)
+            )
+            self.assertEqual(len(codes), len(ouvrages))
+            response = self.verifier(self.staff, 11, "post", "/api/emprunts/retour-lot/", {"codes_barre": codes})
+            self.assertEqual(response.data["rendus"], len(codes))
+
+    def test_traitements_en_lot(self):
+        self.verifier(self.staff, 3, "post", "/api/emprunts/recalcul-retards/")
+        self.verifier(self.staff, 4, "post", "/api/penalites/generer/")
+
+    def test_penalites_et_paiements(self):
+        penalite = Penalite.objects.filter(payee=False).order_by("id")
+        self.verifier(self.staff, 4, "post", f"/api/penalites/{penalite[0].id}/payer/")
+        response = self.verifier(
+            self.lecteur, 2, "post", "/api/paiements/initier/",
+            {"type": TypePaiement.PENALITE, "reference_objet": penalite[0].id, "montant": "4000"}, 201,
+        )
+        self.verifier(self.lecteur, 5, "post", f"/api/paiements/{response.data['id']}/payer/")
+
+    def test_reservations(self):
+        self.verifier(
+            self.lecteur, 8, "post", "/api/reservations/",
+            {
+                "ouvrage_id": self.complet.id,
+                "date_debut": timezone.localdate() + timedelta(days=1),
+                "date_fin": timezone.localdate() + timedelta(days=5),
+            },
+            201,
+        )
+        en_attente = Reservation.objects.filter(statut=StatutReservation.EN_ATTENTE).order_by("id")
+        mienne = en_attente.filter(adherent__user=self.lecteur).first()
+        self.verifier(self.lecteur, 6, "post", f"/api/reservations/{mienne.id}/annuler/")
+        for action in ("valider", "refuser"):
+            reservation = en_attente.exclude(adherent__user=self.lecteur).first()
+            self.verifier(self.staff, 6, "post", f"/api/reservations/{reservation.id}/{action}/")
+
+    def test_catalogue_ecritures(self):
+        response = self.verifier(
+            self.staff, 8, "post", "/api/catalogue/ouvrages/",
+            {"isbn": "9780306406157", "titre": "Nouveau", "auteur": "A", "categorie": "C", "nombre_exemplaires": 3},
+            201, format="multipart",
+        )
+        ouvrage = response.data["id"]
+        self.verifier(
+            self.staff, 3, "patch", f"/api/catalogue/ouvrages/{ouvrage}/", {"titre": "Renomme"}, format="multipart"
+        )
+        self.verifier(self.staff, 9, "delete", f"/api/catalogue/ouvrages/{self.supprimable.id}/", None, 204)
+        self.verifier(self.staff, 6, "post", f"/api/catalogue/ouvrages/{ouvrage}/exemplaires/", {"nombre": 5}, 201)
+        exemplaire = Exemplaire.objects.filter(ouvrage_id=ouvrage).first()
+        self.verifier(self.staff, 6, "delete", f"/api/catalogue/exemplaires/{exemplaire.id}/", None, 204)
+
+        response = self.verifier(
+            self.lecteur, 3, "post", "/api/demandes-livres/", {"titre": "Introuvable", "auteur": "X"}, 201
+        )
+        self.verifier(
+            self.staff, 4, "post", f"/api/demandes-livres/{response.data['id']}/status/",
+            {"statut": "TROUVE", "ouvrage_id": ouvrage},
+        )
+        response = self.verifier(
+            self.staff, 4, "post", "/api/ebooks/",
+            {"ouvrage": ouvrage, "format": "PDF", "nom_fichier": "n.pdf", "url_fichier": "https://example.org/n.pdf"},
+            201, format="multipart",
+        )
+        ebook = response.data["id"]
+        self.verifier(self.staff, 3, "patch", f"/api/ebooks/{ebook}/", {"nom_fichier": "m.pdf"}, format="multipart")
+        self.verifier(self.staff, 3, "delete", f"/api/ebooks/{ebook}/", None, 204)
+
+    def test_messages(self):
+        self.verifier(self.lecteur, 2, "post", "/api/messages/", {"contenu": "Bonjour"}, 201)
+        self.verifier(
+            self.staff, 3, "post", "/api/messages/", {"contenu": "Bonjour", "recipient_id": self.lecteur.id}, 201
+        )
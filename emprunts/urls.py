@@ -3,8 +3,10 @@ from django.urls import path
 
 from .views import (
     creer_emprunt_api,
+    creer_emprunts_lot_api,
     creer_emprunt_lecteur,
     retour_emprunt_api,
+    retour_emprunts_lot_api,
     retour_emprunt_lecteur,
     recalcul_retards_api,
     emprunts_recents,
@@ -12,6 +14,7 @@ from .views import (
     emprunts_retards,
     emprunts_en_cours,
     liste_penalites,
+    generer_penalites_api,
     mes_penalites,
     payer_penalite,
     stats_dashboard,
@@ -26,8 +29,10 @@ from .views import (
 urlpatterns = [
     # Emprunts
     path("api/emprunts/creer/", creer_emprunt_api),
+    path("api/emprunts/creer-lot/", creer_emprunts_lot_api),
     path("api/lecteur/emprunts/creer/", creer_emprunt_lecteur),
     path("api/emprunts/<int:emprunt_id>/retour/", retour_emprunt_api),
+    path("api/emprunts/retour-lot/", retour_emprunts_lot_api),
     path("api/lecteur/emprunts/<int:emprunt_id>/retour/", retour_emprunt_lecteur),
     path("api/emprunts/recalcul-retards/", recalcul_retards_api),
     path("api/emprunts/recents/", emprunts_recents),
@@ -38,6 +43,7 @@ urlpatterns = [
     # Pénalités
     path("api/penalites/", liste_penalites),
     path("api/penalites/me/", mes_penalites),
+    path("api/penalites/generer/", generer_penalites_api),
     path("api/penalites/<int:penalite_id>/payer/", payer_penalite),
 
     # Dashboard
@@ -1,5 +1,9 @@
 # Role de ce fichier: endpoints DRF pour emprunts, penalites, stats, activities.
-from django.db.models import Count, F, Q
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery
+from django.db.models.functions import Cast, Coalesce
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
@@ -12,21 +16,30 @@ from core.serializers import ActivitySerializer
 from core.views import apply_ordering, paginate_queryset
 from exemplaires.models import Exemplaire
 from ouvrages.models import Ouvrage
+from ouvrages.search import annoter_pertinence, suggerer_ouvrages
 from users.models import UserRole
 from users.views import IsAdminOrBibliothecaire, IsLecteur, get_user_role
 
+from .disponibilite import HORIZON_JOURS
 from .models import Emprunt, Penalite, Reservation, StatutEmprunt, StatutReservation
 from .services import (
+    changer_statut_reservation,
     creer_emprunt,
+    creer_emprunts_en_lot,
     enregistrer_retour,
+    enregistrer_retours_en_lot,
+    generer_penalites_en_lot,
     get_tarif_reservation_par_jour,
     recalculer_tous_les_retards,
+    reserver_ouvrage,
 )
 from .serializers import (
     CreerEmpruntInputSerializer,
+    CreerEmpruntLotInputSerializer,
     CreerEmpruntLecteurSerializer,
     EmpruntSerializer,
     PenaliteSerializer,
+    RetourLotInputSerializer,
     ReservationCreateSerializer,
     ReservationSerializer,
 )
@@ -56,27 +69,37 @@ def ouvrages_les_plus_empruntes(limit: int = 10):
 
 
 def taux_rotation_ouvrages(limit: int = 10):
-    # Taux de rotation par ouvrage (emprunts / exemplaires).
-    qs = Ouvrage.objects.annotate(
-        nb_exemplaires=Count("exemplaires", distinct=True),
-        total_emprunts=Count("exemplaires__emprunts", distinct=True),
-    ).filter(nb_exemplaires__gt=0)
-
-    data = []
-    for ouvrage in qs:
-        taux = 0
-        if ouvrage.nb_exemplaires:
-            taux = ouvrage.total_emprunts / ouvrage.nb_exemplaires
-        data.append({
-            "ouvrage_id": ouvrage.id,
-            "titre": ouvrage.titre,
-            "nb_exemplaires": ouvrage.nb_exemplaires,
-            "total_emprunts": ouvrage.total_emprunts,
-            "taux_rotation": round(taux, 2),
-        })
-
-    data.sort(key=lambda item: item["taux_rotation"], reverse=True)
-    return data[:limit]
+    # Taux de rotation par ouvrage (emprunts / exemplaires), classe et limite en SQL.
+    # Nombre d'exemplaires: compteur denormalise de l'ouvrage (voir ajuster_compteurs).
+    total_emprunts = (
+        Emprunt.objects.filter(exemplaire__ouvrage=OuterRef("pk"))
+        .order_by()
+        .values("exemplaire__ouvrage")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    qs = (
+        Ouvrage.objects.filter(exemplaires_total__gt=0)
+        .annotate(total_emprunts=Coalesce(Subquery(total_emprunts), 0))
+        .annotate(
+            taux_rotation=ExpressionWrapper(
+                Cast("total_emprunts", FloatField()) / F("exemplaires_total"),
+                output_field=FloatField(),
+            )
+        )
+        .order_by("-taux_rotation", "id")
+        .values("id", "titre", "exemplaires_total", "total_emprunts", "taux_rotation")[:limit]
+    )
+    return [
+        {
+            "ouvrage_id": ligne["id"],
+            "titre": ligne["titre"],
+            "nb_exemplaires": ligne["exemplaires_total"],
+            "total_emprunts": ligne["total_emprunts"],
+            "taux_rotation": round(ligne["taux_rotation"], 2),
+        }
+        for ligne in qs
+    ]
 
 
 def retards_frequents(limit: int = 10):
@@ -95,7 +118,7 @@ def retards_frequents(limit: int = 10):
 
 
 def resume_dashboard(user=None):
-    # Stats simples pour cartes dashboard.
+    # Stats simples pour cartes dashboard (agregation conditionnelle: une requete par table).
     emprunts = Emprunt.objects.all()
     penalites = Penalite.objects.all()
 
@@ -103,15 +126,12 @@ def resume_dashboard(user=None):
         emprunts = emprunts.filter(adherent__user=user)
         penalites = penalites.filter(emprunt__adherent__user=user)
 
-    return {
-        "nb_emprunts_total": emprunts.count(),
-        "nb_emprunts_en_retard": emprunts.filter(statut="EN_RETARD").count(),
-        "nb_penalites_impayees": penalites.filter(payee=False).count(),
-    }
-
-
-def reservation_date_overlap(start_a, end_a, start_b, end_b) -> bool:
-    return start_a <= end_b and start_b <= end_a
+    resume = emprunts.aggregate(
+        nb_emprunts_total=Count("id"),
+        nb_emprunts_en_retard=Count("id", filter=Q(statut=StatutEmprunt.EN_RETARD)),
+    )
+    resume.update(penalites.aggregate(nb_penalites_impayees=Count("id", filter=Q(payee=False))))
+    return resume
 
 
 # -----------------------------
@@ -127,12 +147,12 @@ def creer_emprunt_api(request):
     s.is_valid(raise_exception=True)
 
     try:
-        exemplaire = Exemplaire.objects.get(id=s.validated_data["exemplaire_id"])
+        exemplaire = Exemplaire.objects.select_related("ouvrage").get(id=s.validated_data["exemplaire_id"])
     except Exemplaire.DoesNotExist:
         return Response({"detail": "Exemplaire introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
     try:
-        adherent = Adherent.objects.get(id=s.validated_data["adherent_id"])
+        adherent = Adherent.objects.select_related("user").get(id=s.validated_data["adherent_id"])
     except Adherent.DoesNotExist:
         return Response({"detail": "Adherent introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -144,6 +164,33 @@ def creer_emprunt_api(request):
     return Response(EmpruntSerializer(e).data, status=status.HTTP_201_CREATED)
 
 
+@api_view(["POST"])
+@permission_classes([IsAdminOrBibliothecaire])
+def creer_emprunts_lot_api(request):
+    # Ce que ca fait: emprunt de plusieurs exemplaires pour un adherent (guichet).
+    # Payload: { adherent_id, exemplaire_ids: [...] }.
+    # Reponse: un resultat par exemplaire (emprunt cree ou detail de l'erreur).
+    s = CreerEmpruntLotInputSerializer(data=request.data)
+    s.is_valid(raise_exception=True)
+
+    try:
+        adherent = Adherent.objects.select_related("user").get(id=s.validated_data["adherent_id"])
+    except Adherent.DoesNotExist:
+        return Response({"detail": "Adherent introuvable."}, status=status.HTTP_404_NOT_FOUND)
+
+    resultats = creer_emprunts_en_lot(adherent=adherent, exemplaire_ids=s.validated_data["exemplaire_ids"])
+    crees = 0
+    for resultat in resultats:
+        if "emprunt" in resultat:
+            resultat["emprunt"] = EmpruntSerializer(resultat["emprunt"]).data
+            crees += 1
+
+    return Response(
+        {"crees": crees, "resultats": resultats},
+        status=status.HTTP_201_CREATED if crees else status.HTTP_400_BAD_REQUEST,
+    )
+
+
 @api_view(["POST"])
 @permission_classes([IsLecteur])
 def creer_emprunt_lecteur(request):
@@ -154,7 +201,7 @@ def creer_emprunt_lecteur(request):
     s.is_valid(raise_exception=True)
 
     try:
-        exemplaire = Exemplaire.objects.get(id=s.validated_data["exemplaire_id"])
+        exemplaire = Exemplaire.objects.select_related("ouvrage").get(id=s.validated_data["exemplaire_id"])
     except Exemplaire.DoesNotExist:
         return Response({"detail": "Exemplaire introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -178,7 +225,7 @@ def retour_emprunt_api(request, emprunt_id: int):
     # Payload: none.
     # Reponse: emprunt + penalite si besoin.
     try:
-        emprunt = Emprunt.objects.get(id=emprunt_id)
+        emprunt = Emprunt.objects.select_related("exemplaire__ouvrage", "adherent__user").get(id=emprunt_id)
     except Emprunt.DoesNotExist:
         return Response({"detail": "Emprunt introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -194,6 +241,20 @@ def retour_emprunt_api(request, emprunt_id: int):
     return Response(data, status=status.HTTP_200_OK)
 
 
+@api_view(["POST"])
+@permission_classes([IsAdminOrBibliothecaire])
+def retour_emprunts_lot_api(request):
+    # Ce que ca fait: retour groupe par codes-barres (boite de retour).
+    # Payload: { codes_barre: [...] }.
+    # Reponse: un resultat par code (emprunt rendu, retard, penalite) ou detail de l'erreur.
+    s = RetourLotInputSerializer(data=request.data)
+    s.is_valid(raise_exception=True)
+
+    resultats = enregistrer_retours_en_lot(codes_barre=s.validated_data["codes_barre"])
+    rendus = sum(1 for r in resultats if "emprunt_id" in r)
+    return Response({"rendus": rendus, "resultats": resultats}, status=status.HTTP_200_OK)
+
+
 @api_view(["POST"])
 @permission_classes([IsLecteur])
 def retour_emprunt_lecteur(request, emprunt_id: int):
@@ -201,7 +262,9 @@ def retour_emprunt_lecteur(request, emprunt_id: int):
     # Payload: none.
     # Reponse: emprunt + penalite si besoin.
     try:
-        emprunt = Emprunt.objects.get(id=emprunt_id, adherent__user=request.user)
+        emprunt = Emprunt.objects.select_related("exemplaire__ouvrage", "adherent__user").get(
+            id=emprunt_id, adherent__user=request.user
+        )
     except Emprunt.DoesNotExist:
         return Response({"detail": "Emprunt introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -222,9 +285,12 @@ def retour_emprunt_lecteur(request, emprunt_id: int):
 def recalcul_retards_api(request):
     # Ce que ca fait: batch recalcul des retards (admin/biblio).
     # Payload: none.
-    # Reponse: { recalculees }.
-    n = recalculer_tous_les_retards()
-    return Response({"recalcules": n}, status=status.HTTP_200_OK)
+    # Reponse: { recalcules, par_statut }.
+    par_statut = recalculer_tous_les_retards()
+    return Response(
+        {"recalcules": sum(par_statut.values()), "par_statut": par_statut},
+        status=status.HTTP_200_OK,
+    )
 
 
 @api_view(["GET"])
@@ -277,7 +343,16 @@ def emprunts_historique(request):
             qs = qs.filter(adherent_id=adherent_id)
 
     search = request.query_params.get("search")
-    if search:
+    # ?fuzzy=true: titres/auteurs approches (trigrammes), classes par pertinence.
+    fuzzy = bool(search) and request.query_params.get("fuzzy") == "true"
+    recherche_complete = True
+    if fuzzy:
+        scores, recherche_complete = suggerer_ouvrages(search)
+        qs = qs.filter(
+            Q(exemplaire__ouvrage_id__in=list(scores))
+            | Q(adherent__user__username__icontains=search)
+        ).annotate(pertinence=annoter_pertinence(scores, "exemplaire__ouvrage_id"))
+    elif search:
         qs = qs.filter(
             Q(exemplaire__ouvrage__titre__icontains=search)
             | Q(adherent__user__username__icontains=search)
@@ -286,11 +361,15 @@ def emprunts_historique(request):
     qs = apply_ordering(
         qs,
         request,
-        allowed_fields=["date_emprunt", "date_retour_prevue", "date_retour_effective", "statut"],
-        default="-date_emprunt",
+        allowed_fields=["date_emprunt", "date_retour_prevue", "date_retour_effective", "statut"]
+        + (["pertinence"] if fuzzy else []),
+        default="-pertinence" if fuzzy else "-date_emprunt",
     )
     items, meta = paginate_queryset(qs, request, default_page_size=20)
-    return Response({"results": EmpruntSerializer(items, many=True).data, "pagination": meta})
+    payload = {"results": EmpruntSerializer(items, many=True).data, "pagination": meta}
+    if fuzzy:
+        payload["recherche_complete"] = recherche_complete
+    return Response(payload)
 
 
 @api_view(["GET"])
@@ -384,6 +463,15 @@ def liste_penalites(request):
     return Response({"results": PenaliteSerializer(items, many=True).data, "pagination": meta})
 
 
+@api_view(["POST"])
+@permission_classes([IsAdminOrBibliothecaire])
+def generer_penalites_api(request):
+    # Ce que ca fait: batch generation des penalites de retard (admin/biblio).
+    # Payload: none.
+    # Reponse: { creees, mises_a_jour, payees_ignorees }.
+    return Response(generer_penalites_en_lot(), status=status.HTTP_200_OK)
+
+
 @api_view(["GET"])
 @permission_classes([IsLecteur])
 def mes_penalites(request):
@@ -409,7 +497,9 @@ def mes_penalites(request):
 def payer_penalite(request, penalite_id: int):
     # Ce que ca fait: marque une penalite comme payee.
     try:
-        p = Penalite.objects.get(id=penalite_id)
+        p = Penalite.objects.select_related("emprunt__exemplaire__ouvrage", "emprunt__adherent__user").get(
+            id=penalite_id
+        )
     except Penalite.DoesNotExist:
         return Response({"detail": "Pénalité introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -536,42 +626,32 @@ def reservations(request):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    exemplaires_total = Exemplaire.objects.filter(ouvrage=ouvrage).count()
-    if exemplaires_total == 0:
+    # Reservations bornees a l'horizon de la chronologie de disponibilite.
+    limite = today + timedelta(days=HORIZON_JOURS)
+    if date_fin > limite:
+        return Response(
+            {"detail": f"Date de fin invalide (au plus {limite.isoformat()})."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    if ouvrage.exemplaires_total == 0:
         return Response({"detail": "Aucun exemplaire pour cet ouvrage."}, status=status.HTTP_400_BAD_REQUEST)
 
-    reservations_overlap = Reservation.objects.filter(
-        ouvrage=ouvrage,
-        statut__in=[StatutReservation.EN_ATTENTE, StatutReservation.VALIDEE],
-        date_debut__lte=date_fin,
-        date_fin__gte=date_debut,
-    ).count()
-
-    emprunts_overlap = Emprunt.objects.filter(
-        exemplaire__ouvrage=ouvrage,
-        statut__in=[StatutEmprunt.EN_COURS, StatutEmprunt.EN_RETARD],
-        date_retour_prevue__gte=date_debut,
-    ).count()
-
-    if reservations_overlap + emprunts_overlap >= exemplaires_total:
-        tarif = get_tarif_reservation_par_jour()
-        jours = (date_fin - date_debut).days
-        montant = Decimal(jours) * Decimal(tarif)
-        reservation = Reservation.objects.create(
+    # Creation sous le verrou de file: la disponibilite y est recalculee en base (pas le cache).
+    tarif = get_tarif_reservation_par_jour()
+    jours = (date_fin - date_debut).days
+    montant = Decimal(jours) * Decimal(tarif)
+    try:
+        reservation = reserver_ouvrage(
             adherent=adherent,
             ouvrage=ouvrage,
             date_debut=date_debut,
             date_fin=date_fin,
             montant_estime=montant,
-            statut=StatutReservation.EN_ATTENTE,
         )
-        return Response(ReservationSerializer(reservation).data, status=status.HTTP_201_CREATED)
-
-    disponibles = exemplaires_total - (reservations_overlap + emprunts_overlap)
-    return Response(
-        {"detail": f"Ouvrage disponible ({disponibles} exemplaire(s) libre(s)). Reservation non necessaire."},
-        status=status.HTTP_400_BAD_REQUEST,
-    )
+    except ValueError as ex:
+        return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(ReservationSerializer(reservation).data, status=status.HTTP_201_CREATED)
 
 
 @api_view(["GET"])
@@ -589,16 +669,19 @@ def mes_reservations(request):
 def annuler_reservation(request, reservation_id: int):
     # Annule une reservation (lecteur).
     try:
-        reservation = Reservation.objects.get(id=reservation_id, adherent__user=request.user)
+        reservation = Reservation.objects.select_related("ouvrage", "adherent__user").get(
+            id=reservation_id, adherent__user=request.user
+        )
     except Reservation.DoesNotExist:
         return Response({"detail": "Reservation introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
     if reservation.statut != StatutReservation.EN_ATTENTE:
         return Response({"detail": "Reservation non annulable."}, status=status.HTTP_400_BAD_REQUEST)
 
-    reservation.statut = StatutReservation.ANNULEE
-    reservation.date_traitement = timezone.now()
-    reservation.save(update_fields=["statut", "date_traitement"])
+    try:
+        changer_statut_reservation(reservation, StatutReservation.ANNULEE)
+    except ValueError as ex:
+        return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
     return Response(ReservationSerializer(reservation).data, status=status.HTTP_200_OK)
 
 
@@ -607,16 +690,17 @@ def annuler_reservation(request, reservation_id: int):
 def valider_reservation(request, reservation_id: int):
     # Valide une reservation (admin/biblio).
     try:
-        reservation = Reservation.objects.get(id=reservation_id)
+        reservation = Reservation.objects.select_related("ouvrage", "adherent__user").get(id=reservation_id)
     except Reservation.DoesNotExist:
         return Response({"detail": "Reservation introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
     if reservation.statut != StatutReservation.EN_ATTENTE:
         return Response({"detail": "Reservation non modifiable."}, status=status.HTTP_400_BAD_REQUEST)
 
-    reservation.statut = StatutReservation.VALIDEE
-    reservation.date_traitement = timezone.now()
-    reservation.save(update_fields=["statut", "date_traitement"])
+    try:
+        changer_statut_reservation(reservation, StatutReservation.VALIDEE)
+    except ValueError as ex:
+        return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
     return Response(ReservationSerializer(reservation).data, status=status.HTTP_200_OK)
 
 
@@ -625,14 +709,15 @@ def valider_reservation(request, reservation_id: int):
 def refuser_reservation(request, reservation_id: int):
     # Refuse une reservation (admin/biblio).
     try:
-        reservation = Reservation.objects.get(id=reservation_id)
+        reservation = Reservation.objects.select_related("ouvrage", "adherent__user").get(id=reservation_id)
     except Reservation.DoesNotExist:
         return Response({"detail": "Reservation introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
     if reservation.statut != StatutReservation.EN_ATTENTE:
         return Response({"detail": "Reservation non modifiable."}, status=status.HTTP_400_BAD_REQUEST)
 
-    reservation.statut = StatutReservation.REFUSEE
-    reservation.date_traitement = timezone.now()
-    reservation.save(update_fields=["statut", "date_traitement"])
+    try:
+        changer_statut_reservation(reservation, StatutReservation.REFUSEE)
+    except ValueError as ex:
+        return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
     return Response(ReservationSerializer(reservation).data, status=status.HTTP_200_OK)
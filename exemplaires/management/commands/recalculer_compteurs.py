@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from exemplaires.models import recalculer_compteurs_exemplaires
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs d'exemplaires (total/disponibles) de tous les ouvrages."
+
+    def handle(self, *args, **options):
+        total = recalculer_compteurs_exemplaires()
+        self.stdout.write(self.style.SUCCESS(f"Compteurs recalcules: {total} ouvrage(s)."))
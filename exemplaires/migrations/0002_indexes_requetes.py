@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exemplaires', '0001_initial'),
+        ('ouvrages', '0007_ouvrage_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exemplaire',
+            index=models.Index(fields=['etat', 'ouvrage'], name='exemplaire_etat_ouvrage_idx'),
+        ),
+    ]
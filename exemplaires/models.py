@@ -1,7 +1,9 @@
 # Role de ce fichier: modele Exemplaire + helpers.
 from uuid import uuid4
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from ouvrages.models import Ouvrage
 
 
@@ -32,13 +34,156 @@ class Exemplaire(models.Model):
         default=EtatExemplaire.DISPONIBLE
     )
 
+    class Meta:
+        indexes = [
+            # Liste des exemplaires disponibles (filtre etat, jointure vers l'ouvrage); les
+            # exemplaires d'un ouvrage passent par l'index de la cle etrangere.
+            models.Index(fields=["etat", "ouvrage"], name="exemplaire_etat_ouvrage_idx"),
+        ]
+
     def __str__(self):
         return f"{self.code_barre} - {self.ouvrage.titre}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Memorise ouvrage et etat charges pour detecter les changements au save().
+        instance = super().from_db(db, field_names, values)
+        instance._ouvrage_initial = instance.__dict__.get("ouvrage_id")
+        instance._etat_initial = instance.__dict__.get("etat")
+        return instance
+
+    def _en_base(self):
+        # (ouvrage_id, etat) tels qu'enregistres; relu en base si inconnus.
+        ouvrage_id = getattr(self, "_ouvrage_initial", None)
+        etat = getattr(self, "_etat_initial", None)
+        if ouvrage_id is None or etat is None:
+            ligne = Exemplaire.objects.filter(pk=self.pk).values_list("ouvrage_id", "etat").first()
+            ouvrage_id, etat = ligne or (None, None)
+        return ouvrage_id, etat
+
+    def marquer_etat_en_base(self, etat) -> None:
+        # Etat deja ecrit en base par un UPDATE direct (compteurs ajustes par l'appelant):
+        # l'instance le reprend sans que save() y voie un changement a recompter.
+        self.etat = self._etat_initial = etat
+
+    def save(self, *args, **kwargs):
+        # Maintient les compteurs de l'ouvrage dans la meme transaction.
+        # Un changement d'ouvrage deplace l'exemplaire d'un compteur a l'autre.
+        # La suppression (instance, queryset, admin) est geree par signals.py.
+        update_fields = kwargs.get("update_fields")
+        champs = None if update_fields is None else set(update_fields)
+        with transaction.atomic():
+            creation = self._state.adding
+            maj_ouvrage = champs is None or bool(champs & {"ouvrage", "ouvrage_id"})
+            maj_etat = champs is None or "etat" in champs
+            suivi = not creation and (maj_ouvrage or maj_etat)
+            ancien_ouvrage, ancien_etat = self._en_base() if suivi else (None, None)
+            super().save(*args, **kwargs)
+            if creation:
+                ajuster_compteurs(
+                    self.ouvrage_id,
+                    total=1,
+                    disponibles=int(self.etat == EtatExemplaire.DISPONIBLE),
+                )
+                self._ouvrage_initial, self._etat_initial = self.ouvrage_id, self.etat
+            elif suivi:
+                ouvrage_id = self.ouvrage_id if maj_ouvrage else ancien_ouvrage
+                etat = self.etat if maj_etat else ancien_etat
+                if ouvrage_id != ancien_ouvrage:
+                    ajuster_compteurs(
+                        ancien_ouvrage,
+                        total=-1,
+                        disponibles=-int(ancien_etat == EtatExemplaire.DISPONIBLE),
+                    )
+                    ajuster_compteurs(
+                        ouvrage_id,
+                        total=1,
+                        disponibles=int(etat == EtatExemplaire.DISPONIBLE),
+                    )
+                elif etat != ancien_etat:
+                    ajuster_compteurs(
+                        ouvrage_id,
+                        disponibles=(
+                            int(etat == EtatExemplaire.DISPONIBLE)
+                            - int(ancien_etat == EtatExemplaire.DISPONIBLE)
+                        ),
+                    )
+                self._ouvrage_initial, self._etat_initial = ouvrage_id, etat
+
+
+# Taille des lots IN (...) de verification (limite de 2100 parametres sous SQL Server).
+TAILLE_LOT_CODES = 1000
+
+
+def generer_codes_barre(ouvrage_id: int, nombre: int) -> list:
+    # Helper: genere `nombre` codes uniques; une requete IN par lot de candidats,
+    # seuls les codes deja pris sont retires (collision tres rare sur 32 bits).
+    codes = []
+    while len(codes) < nombre:
+        candidats = set()
+        while len(candidats) < nombre - len(codes):
+            candidats.add(f"EX-{ouvrage_id}-{uuid4().hex[:8]}")
+        candidats = list(candidats - set(codes))
+        for debut in range(0, len(candidats), TAILLE_LOT_CODES):
+            lot = candidats[debut:debut + TAILLE_LOT_CODES]
+            pris = set(Exemplaire.objects.filter(code_barre__in=lot).values_list("code_barre", flat=True))
+            codes.extend(code for code in lot if code not in pris)
+    return codes
+
 
 def generate_code_barre(ouvrage_id: int) -> str:
     # Helper: genere un code unique pour un exemplaire.
-    while True:
-        code = f"EX-{ouvrage_id}-{uuid4().hex[:8]}"
-        if not Exemplaire.objects.filter(code_barre=code).exists():
-            return code
+    return generer_codes_barre(ouvrage_id, 1)[0]
+
+
+# -----------------------------
+# Helpers: compteurs ouvrage
+# -----------------------------
+def ajuster_compteurs(ouvrage_id: int, *, total: int = 0, disponibles: int = 0) -> None:
+    # Applique un delta atomique (UPDATE ... SET x = x + n) sur l'ouvrage.
+    if not total and not disponibles:
+        return
+    Ouvrage.objects.filter(id=ouvrage_id).update(
+        exemplaires_total=F("exemplaires_total") + total,
+        exemplaires_disponibles=F("exemplaires_disponibles") + disponibles,
+    )
+
+
+def ajuster_compteurs_en_lot(disponibles: dict) -> None:
+    # {ouvrage_id: delta de disponibles}: un seul UPDATE quel que soit le nombre d'ouvrages.
+    deltas = {ouvrage_id: delta for ouvrage_id, delta in disponibles.items() if delta}
+    if not deltas:
+        return
+    Ouvrage.objects.filter(id__in=sorted(deltas)).update(
+        exemplaires_disponibles=F("exemplaires_disponibles") + Case(
+            *[When(id=ouvrage_id, then=Value(delta)) for ouvrage_id, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+
+
+@transaction.atomic
+def creer_exemplaires(ouvrage: Ouvrage, nombre: int) -> list:
+    # Creation groupee d'exemplaires disponibles (+ compteurs).
+    exemplaires = Exemplaire.objects.bulk_create([
+        Exemplaire(ouvrage=ouvrage, code_barre=code)
+        for code in generer_codes_barre(ouvrage.id, nombre)
+    ])
+    ajuster_compteurs(ouvrage.id, total=len(exemplaires), disponibles=len(exemplaires))
+    return exemplaires
+
+
+def recalculer_compteurs_exemplaires() -> int:
+    # Recalcule tous les compteurs en un seul UPDATE (reparation).
+    exemplaires = Exemplaire.objects.filter(ouvrage=OuterRef("pk")).order_by().values("ouvrage")
+    total = exemplaires.annotate(n=Count("id")).values("n")
+    disponibles = (
+        exemplaires.filter(etat=EtatExemplaire.DISPONIBLE)
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    return Ouvrage.objects.update(
+        exemplaires_total=Coalesce(Subquery(total), 0),
+        exemplaires_disponibles=Coalesce(Subquery(disponibles), 0),
+    )
@@ -0,0 +1,119 @@
+# Role de ce fichier: resolution d'un code-barre scanne (exemplaire, emprunt, reservations) + cache.
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.cache import CacheLRU
+from emprunts.models import Emprunt, Reservation, StatutReservation
+
+from .models import Exemplaire
+
+# Reponses de scan par code-barre; TTL court, invalidees sur changement d'etat / emprunt.
+cache_scan = CacheLRU(
+    taille=getattr(settings, "SCAN_CACHE_TAILLE", 2048),
+    ttl=getattr(settings, "SCAN_CACHE_TTL", 10),
+)
+
+
+def invalider_scan(*codes_barre) -> None:
+    # Immediatement, puis au commit (une lecture concurrente a pu remettre l'ancienne valeur).
+    cache_scan.invalider(*codes_barre)
+    transaction.on_commit(lambda: cache_scan.invalider(*codes_barre))
+
+
+def invalider_scan_ouvrages(*ouvrage_ids) -> None:
+    # Scans des exemplaires de ces ouvrages (reservations: elles portent sur l'ouvrage).
+    ids = set(ouvrage_ids)
+
+    def invalider():
+        cache_scan.invalider_si(lambda payload: payload["ouvrage"]["id"] in ids)
+
+    invalider()
+    transaction.on_commit(invalider)
+
+
+def vider_scan() -> None:
+    cache_scan.vider()
+    transaction.on_commit(cache_scan.vider)
+
+
+def resoudre_code_barre(code_barre: str):
+    # Retourne le payload de scan (dict) ou None si le code est inconnu.
+    payload = cache_scan.get(code_barre)
+    if payload is None:
+        payload = _charger_scan(code_barre)
+        if payload is not None:
+            cache_scan.set(code_barre, payload)
+    return payload
+
+
+def _charger_scan(code_barre: str):
+    # Une seule requete: exemplaire + ouvrage (jointure), emprunt ouvert et reservations (sous-requetes).
+    emprunt = Emprunt.objects.filter(
+        exemplaire=OuterRef("pk"),
+        date_retour_effective__isnull=True,
+    ).order_by("-id")
+    reservations = Reservation.objects.filter(
+        ouvrage=OuterRef("ouvrage_id"),
+        statut__in=[StatutReservation.EN_ATTENTE, StatutReservation.VALIDEE],
+        date_fin__gte=timezone.localdate(),
+    )
+    # Prochaine servie: ordre de la file (les reservations validees, hors file, en dernier).
+    prochaine = reservations.order_by(F("position").asc(nulls_last=True), "id")
+    nombre = reservations.order_by().values("ouvrage").annotate(n=Count("id")).values("n")
+
+    exemplaire = (
+        Exemplaire.objects.select_related("ouvrage")
+        .annotate(
+            emprunt_id=Subquery(emprunt.values("id")[:1]),
+            emprunt_adherent_id=Subquery(emprunt.values("adherent_id")[:1]),
+            emprunt_username=Subquery(emprunt.values("adherent__user__username")[:1]),
+            emprunt_retour_prevue=Subquery(emprunt.values("date_retour_prevue")[:1]),
+            emprunt_statut=Subquery(emprunt.values("statut")[:1]),
+            reservations_actives=Coalesce(Subquery(nombre), 0),
+            reservation_id=Subquery(prochaine.values("id")[:1]),
+            reservation_username=Subquery(prochaine.values("adherent__user__username")[:1]),
+            reservation_debut=Subquery(prochaine.values("date_debut")[:1]),
+            reservation_fin=Subquery(prochaine.values("date_fin")[:1]),
+            reservation_statut=Subquery(prochaine.values("statut")[:1]),
+        )
+        .filter(code_barre=code_barre)
+        .first()
+    )
+    if exemplaire is None:
+        return None
+
+    ouvrage = exemplaire.ouvrage
+    return {
+        "exemplaire": {
+            "id": exemplaire.id,
+            "code_barre": exemplaire.code_barre,
+            "etat": exemplaire.etat,
+        },
+        "ouvrage": {
+            "id": ouvrage.id,
+            "titre": ouvrage.titre,
+            "auteur": ouvrage.auteur,
+            "isbn": ouvrage.isbn,
+            "exemplaires_disponibles": ouvrage.exemplaires_disponibles,
+        },
+        "emprunt": None if exemplaire.emprunt_id is None else {
+            "id": exemplaire.emprunt_id,
+            "adherent_id": exemplaire.emprunt_adherent_id,
+            "adherent_username": exemplaire.emprunt_username,
+            "date_retour_prevue": exemplaire.emprunt_retour_prevue,
+            "statut": exemplaire.emprunt_statut,
+        },
+        "reservations": {
+            "actives": exemplaire.reservations_actives,
+            "prochaine": None if exemplaire.reservation_id is None else {
+                "id": exemplaire.reservation_id,
+                "adherent_username": exemplaire.reservation_username,
+                "date_debut": exemplaire.reservation_debut,
+                "date_fin": exemplaire.reservation_fin,
+                "statut": exemplaire.reservation_statut,
+            },
+        },
+    }
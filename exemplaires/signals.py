@@ -0,0 +1,48 @@
+# Role de ce fichier: signaux exemplaires (compteurs de l'ouvrage, invalidation du cache de scan).
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from emprunts.models import Emprunt, Reservation
+from ouvrages.models import Ouvrage
+
+from .models import EtatExemplaire, Exemplaire, ajuster_compteurs
+from .scan import invalider_scan, invalider_scan_ouvrages, vider_scan
+
+
+@receiver(pre_delete, sender=Exemplaire)
+def exemplaire_avant_suppression(sender, instance, **kwargs):
+    # Fige ouvrage/etat en base tant que la ligne existe (delete() d'instance ou de queryset).
+    instance._ouvrage_initial, instance._etat_initial = instance._en_base()
+
+
+@receiver(post_delete, sender=Exemplaire)
+def exemplaire_supprime(sender, instance, origin=None, **kwargs):
+    # Decremente les compteurs, y compris pour queryset.delete() et l'action admin.
+    # Inutile quand l'ouvrage lui-meme est supprime (cascade).
+    if isinstance(origin, Ouvrage) or getattr(origin, "model", None) is Ouvrage:
+        return
+    ajuster_compteurs(
+        instance._ouvrage_initial,
+        total=-1,
+        disponibles=-int(instance._etat_initial == EtatExemplaire.DISPONIBLE),
+    )
+
+
+@receiver([post_save, post_delete], sender=Exemplaire)
+def exemplaire_modifie(sender, instance, **kwargs):
+    invalider_scan(instance.code_barre)
+
+
+@receiver([post_save, post_delete], sender=Emprunt)
+def emprunt_modifie(sender, instance, **kwargs):
+    # Code-barre connu sans requete si l'exemplaire est deja charge, sinon on vide tout.
+    if Emprunt.exemplaire.is_cached(instance):
+        invalider_scan(instance.exemplaire.code_barre)
+    else:
+        vider_scan()
+
+
+@receiver([post_save, post_delete], sender=Reservation)
+def reservation_modifiee(sender, instance, **kwargs):
+    # Les reservations portent sur l'ouvrage: tous ses exemplaires sont concernes.
+    invalider_scan_ouvrages(instance.ouvrage_id)
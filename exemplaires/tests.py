@@ -1,3 +1,114 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from uuid import UUID
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from adherents.models import Adherent
+from emprunts.models import Reservation, StatutReservation
+from emprunts.services import creer_emprunt, enregistrer_retour
+from ouvrages.models import Ouvrage
+
+from .models import Exemplaire, creer_exemplaires, generer_codes_barre
+from .scan import cache_scan, resoudre_code_barre
+
+
+class CodesBarreTests(TestCase):
+    def setUp(self):
+        self.ouvrage = Ouvrage.objects.create(isbn="9780306406157", titre="Test", auteur="Auteur", categorie="Test")
+
+    def test_creation_groupee_une_seule_verification(self):
+        with CaptureQueriesContext(connection) as requetes:
+            exemplaires = creer_exemplaires(self.ouvrage, 500)
+        selects = [q for q in requetes.captured_queries if q["sql"].startswith("SELECT")]
+        self.assertEqual(len(selects), 1)
+        codes = {e.code_barre for e in exemplaires}
+        self.assertEqual(len(codes), 500)
+        self.assertEqual(Exemplaire.objects.filter(code_barre__in=codes).count(), 500)
+
+    def test_seuls_les_codes_en_collision_sont_regeneres(self):
+        Exemplaire.objects.create(ouvrage=self.ouvrage, code_barre=f"EX-{self.ouvrage.id}-00000000")
+        uuids = [UUID(int=n << 96) for n in (0, 1, 0, 2)]
+        with mock.patch("exemplaires.models.uuid4", side_effect=uuids):
+            codes = generer_codes_barre(self.ouvrage.id, 2)
+        self.assertEqual(len(codes), 2)
+        self.assertNotIn(f"EX-{self.ouvrage.id}-00000000", codes)
+
+
+class ScanCodeBarreTests(TestCase):
+    def setUp(self):
+        cache_scan.vider()
+        self.ouvrage = Ouvrage.objects.create(isbn="9780306406157", titre="Test", auteur="Auteur", categorie="Test")
+        self.exemplaire = Exemplaire.objects.create(ouvrage=self.ouvrage, code_barre="EX-SCAN-1")
+        user = get_user_model().objects.create_user(username="lecteur", password="pass")
+        self.adherent = Adherent.objects.create(user=user, adresse="Test", telephone="000")
+
+    def test_une_requete_puis_cache(self):
+        with self.assertNumQueries(1):
+            payload = resoudre_code_barre("EX-SCAN-1")
+        self.assertEqual(payload["exemplaire"]["etat"], "DISPONIBLE")
+        self.assertIsNone(payload["emprunt"])
+
+    def test_reservation_invalide_seulement_son_ouvrage(self):
+        autre = Ouvrage.objects.create(isbn="9780131103627", titre="Autre", auteur="Auteur", categorie="Test")
+        Exemplaire.objects.create(ouvrage=autre, code_barre="EX-SCAN-2")
+        resoudre_code_barre("EX-SCAN-1")
+        resoudre_code_barre("EX-SCAN-2")
+
+        today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            Reservation.objects.create(
+                adherent=self.adherent,
+                ouvrage=self.ouvrage,
+                date_debut=today,
+                date_fin=today + timedelta(days=3),
+                montant_estime=Decimal("0"),
+                statut=StatutReservation.EN_ATTENTE,
+                position=1,
+            )
+        with self.assertNumQueries(0):
+            self.assertEqual(resoudre_code_barre("EX-SCAN-2")["reservations"]["actives"], 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(resoudre_code_barre("EX-SCAN-1")["reservations"]["actives"], 1)
+
+    def test_prochaine_reservation_selon_la_file(self):
+        # La tete de file commence plus tard que la suivante: c'est elle qui est annoncee.
+        today = timezone.localdate()
+        autre = Adherent.objects.create(
+            user=get_user_model().objects.create_user(username="autre", password="pass"),
+            adresse="Test",
+            telephone="000",
+        )
+        for adherent, debut, position in [(autre, 1, 2), (self.adherent, 5, 1)]:
+            Reservation.objects.create(
+                adherent=adherent,
+                ouvrage=self.ouvrage,
+                date_debut=today + timedelta(days=debut),
+                date_fin=today + timedelta(days=10),
+                montant_estime=Decimal("0"),
+                statut=StatutReservation.EN_ATTENTE,
+                position=position,
+            )
+        payload = resoudre_code_barre("EX-SCAN-1")
+        self.assertEqual(payload["reservations"]["actives"], 2)
+        self.assertEqual(payload["reservations"]["prochaine"]["adherent_username"], "lecteur")
+        with self.assertNumQueries(0):
+            resoudre_code_barre("EX-SCAN-1")
+        self.assertIsNone(resoudre_code_barre("INCONNU"))
+
+    def test_invalide_a_l_emprunt_et_au_retour(self):
+        resoudre_code_barre("EX-SCAN-1")
+        emprunt = creer_emprunt(exemplaire=self.exemplaire, adherent=self.adherent)
+        payload = resoudre_code_barre("EX-SCAN-1")
+        self.assertEqual(payload["exemplaire"]["etat"], "EMPRUNTE")
+        self.assertEqual(payload["emprunt"]["adherent_username"], "lecteur")
 
-# Create your tests here.
+        enregistrer_retour(emprunt=emprunt)
+        payload = resoudre_code_barre("EX-SCAN-1")
+        self.assertEqual(payload["exemplaire"]["etat"], "DISPONIBLE")
+        self.assertIsNone(payload["emprunt"])
@@ -1,10 +1,11 @@
 # Role de ce fichier: routes exemplaires.
 from django.urls import path
 
-from .views import exemplaire_detail, exemplaires_disponibles, exemplaires_par_ouvrage
+from .views import exemplaire_detail, exemplaire_scan, exemplaires_disponibles, exemplaires_par_ouvrage
 
 urlpatterns = [
     path("api/catalogue/exemplaires-disponibles/", exemplaires_disponibles),
     path("api/catalogue/ouvrages/<int:ouvrage_id>/exemplaires/", exemplaires_par_ouvrage),
     path("api/catalogue/exemplaires/<int:exemplaire_id>/", exemplaire_detail),
+    path("api/exemplaires/scan/<str:code>/", exemplaire_scan),
 ]
@@ -11,7 +11,8 @@ from users.views import IsAdminOrBibliothecaire
 
 from ouvrages.models import Ouvrage
 
-from .models import EtatExemplaire, Exemplaire, generate_code_barre
+from .models import EtatExemplaire, Exemplaire, creer_exemplaires
+from .scan import resoudre_code_barre
 from .serializers import ExemplaireDisponibleSerializer, ExemplaireSerializer
 
 
@@ -33,6 +34,18 @@ def exemplaires_disponibles(request):
     return Response({"results": ExemplaireDisponibleSerializer(items, many=True).data, "pagination": meta})
 
 
+@api_view(["GET"])
+@permission_classes([IsAdminOrBibliothecaire])
+def exemplaire_scan(request, code: str):
+    # Ce que ca fait: resout un code-barre scanne au guichet (cache LRU a TTL court).
+    # Permissions: ADMIN/BIBLIOTHECAIRE.
+    # Reponse: exemplaire, ouvrage, emprunt en cours et reservations actives.
+    payload = resoudre_code_barre(code)
+    if payload is None:
+        return Response({"detail": "Exemplaire introuvable."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(payload)
+
+
 @api_view(["GET", "POST"])
 @permission_classes([IsAdminOrBibliothecaire])
 def exemplaires_par_ouvrage(request, ouvrage_id: int):
@@ -69,11 +82,7 @@ def exemplaires_par_ouvrage(request, ouvrage_id: int):
     if nombre <= 0:
         return Response({"detail": "Nombre invalide."}, status=status.HTTP_400_BAD_REQUEST)
 
-    exemplaires = [
-        Exemplaire(ouvrage=ouvrage, code_barre=generate_code_barre(ouvrage.id))
-        for _ in range(nombre)
-    ]
-    Exemplaire.objects.bulk_create(exemplaires)
+    creer_exemplaires(ouvrage, nombre)
 
     log_activity(
         type=ActivityType.EXEMPLAIRE_AJOUTE,
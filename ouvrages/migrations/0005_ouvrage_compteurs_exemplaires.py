@@ -0,0 +1,37 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def initialiser_compteurs(apps, schema_editor):
+    Ouvrage = apps.get_model("ouvrages", "Ouvrage")
+    Exemplaire = apps.get_model("exemplaires", "Exemplaire")
+
+    exemplaires = Exemplaire.objects.filter(ouvrage=OuterRef("pk")).order_by().values("ouvrage")
+    total = exemplaires.annotate(n=Count("id")).values("n")
+    disponibles = exemplaires.filter(etat="DISPONIBLE").annotate(n=Count("id")).values("n")
+    Ouvrage.objects.update(
+        exemplaires_total=Coalesce(Subquery(total), 0),
+        exemplaires_disponibles=Coalesce(Subquery(disponibles), 0),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ouvrages", "0004_ouvrage_media_fields"),
+        ("exemplaires", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ouvrage",
+            name="exemplaires_total",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="ouvrage",
+            name="exemplaires_disponibles",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(initialiser_compteurs, migrations.RunPython.noop),
+    ]
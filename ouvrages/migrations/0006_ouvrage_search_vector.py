@@ -0,0 +1,58 @@
+from django.db import migrations
+
+# Recherche plein texte PostgreSQL: colonne tsvector ponderee (titre A, auteur/isbn B,
+# categorie C), remplie par trigger et indexee en GIN. Colonne hors modele Django:
+# les autres moteurs (SQLite, SQL Server) utilisent l'index memoire de ouvrages/search.py.
+SQL_CREATION = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "ALTER TABLE ouvrages_ouvrage ADD COLUMN search_vector tsvector",
+    """
+    CREATE FUNCTION ouvrages_ouvrage_search_vector_maj() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', unaccent(coalesce(NEW.titre, ''))), 'A')
+            || setweight(to_tsvector('simple', unaccent(coalesce(NEW.auteur, ''))), 'B')
+            || setweight(to_tsvector('simple', regexp_replace(coalesce(NEW.isbn, ''), '[-[:space:]]', '', 'g')), 'B')
+            || setweight(to_tsvector('simple', unaccent(coalesce(NEW.categorie, ''))), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER ouvrages_ouvrage_search_vector_trg
+    BEFORE INSERT OR UPDATE OF titre, auteur, isbn, categorie ON ouvrages_ouvrage
+    FOR EACH ROW EXECUTE FUNCTION ouvrages_ouvrage_search_vector_maj()
+    """,
+    "UPDATE ouvrages_ouvrage SET titre = titre",
+    "CREATE INDEX ouvrages_ouvrage_search_vector_gin ON ouvrages_ouvrage USING gin (search_vector)",
+]
+
+SQL_SUPPRESSION = [
+    "DROP TRIGGER IF EXISTS ouvrages_ouvrage_search_vector_trg ON ouvrages_ouvrage",
+    "DROP FUNCTION IF EXISTS ouvrages_ouvrage_search_vector_maj()",
+    "ALTER TABLE ouvrages_ouvrage DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def creer_recherche(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in SQL_CREATION:
+        schema_editor.execute(sql)
+
+
+def supprimer_recherche(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in SQL_SUPPRESSION:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ouvrages", "0005_ouvrage_compteurs_exemplaires"),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_recherche, supprimer_recherche),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# Recherche approximative PostgreSQL: index GIN trigrammes (pg_trgm) sur titre et auteur,
+# utilises par l'operateur <% de ouvrages/search.py. Sans effet sur les autres moteurs.
+SQL_CREATION = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX ouvrages_ouvrage_titre_trgm ON ouvrages_ouvrage USING gin (titre gin_trgm_ops)",
+    "CREATE INDEX ouvrages_ouvrage_auteur_trgm ON ouvrages_ouvrage USING gin (auteur gin_trgm_ops)",
+]
+
+SQL_SUPPRESSION = [
+    "DROP INDEX IF EXISTS ouvrages_ouvrage_titre_trgm",
+    "DROP INDEX IF EXISTS ouvrages_ouvrage_auteur_trgm",
+]
+
+
+def creer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in SQL_CREATION:
+        schema_editor.execute(sql)
+
+
+def supprimer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in SQL_SUPPRESSION:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ouvrages", "0006_ouvrage_search_vector"),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
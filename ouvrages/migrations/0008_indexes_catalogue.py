@@ -0,0 +1,25 @@
+# Generated by Django 5.2.9 on 2026-10-18 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ouvrages', '0007_ouvrage_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ouvrage',
+            index=models.Index(fields=['titre'], name='ouvrage_titre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ouvrage',
+            index=models.Index(fields=['categorie', 'titre'], name='ouvrage_categorie_titre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ouvrage',
+            index=models.Index(fields=['type_ressource', 'titre'], name='ouvrage_type_titre_idx'),
+        ),
+    ]
@@ -51,6 +51,24 @@ class Ouvrage(models.Model):
         blank=True,
         null=True,
     )
+    # Compteurs denormalises, tenus a jour par exemplaires.models.
+    exemplaires_total = models.IntegerField(
+        default=0,
+        editable=False,
+    )
+    exemplaires_disponibles = models.IntegerField(
+        default=0,
+        editable=False,
+    )
+
+    class Meta:
+        indexes = [
+            # Catalogue trie par titre (tri par defaut de la liste paginee).
+            models.Index(fields=["titre"], name="ouvrage_titre_idx"),
+            # Filtres du catalogue suivis du tri par titre.
+            models.Index(fields=["categorie", "titre"], name="ouvrage_categorie_titre_idx"),
+            models.Index(fields=["type_ressource", "titre"], name="ouvrage_type_titre_idx"),
+        ]
 
     def __str__(self):
         return f"{self.titre} ({self.isbn})"
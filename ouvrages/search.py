@@ -0,0 +1,304 @@
+# Role de ce fichier: recherche plein texte et approximative du catalogue (PostgreSQL + index memoire).
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+from django.db.models import BooleanField, Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+
+from core.cache import CacheProcessus
+
+from .models import Ouvrage
+
+# Poids par champ (equivalents des poids A/B/C de PostgreSQL).
+POIDS_CHAMPS = {"titre": 8, "auteur": 4, "isbn": 4, "categorie": 2}
+# Nombre max de resultats classes renvoyes par l'index memoire.
+LIMITE_RESULTATS = 1000
+
+# Recherche approximative: champs compares, seuil (= pg_trgm.word_similarity_threshold)
+# et nombre max de suggestions.
+CHAMPS_TRIGRAMMES = ("titre", "auteur")
+SEUIL_SIMILARITE = 0.6
+LIMITE_SUGGESTIONS = 100
+
+_RE_TIRETS_NUMERIQUES = re.compile(r"(?<=\d)[-\s](?=\d)")
+_RE_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def normaliser(texte: str) -> str:
+    # Minuscules sans accents; "978-2-07" devient "978207" (ISBN saisis avec tirets).
+    texte = unicodedata.normalize("NFKD", texte or "")
+    texte = "".join(c for c in texte if not unicodedata.combining(c)).lower()
+    return _RE_TIRETS_NUMERIQUES.sub("", texte)
+
+
+def tokeniser(texte: str) -> list:
+    return _RE_TOKEN.findall(normaliser(texte))
+
+
+def trigrammes(texte: str) -> set:
+    # Meme decoupage que pg_trgm: chaque mot est borde de "  " devant et " " derriere.
+    resultat = set()
+    for mot in tokeniser(texte):
+        mot = f"  {mot} "
+        resultat.update(mot[i:i + 3] for i in range(len(mot) - 2))
+    return resultat
+
+
+# -----------------------------
+# Index inverse en memoire (SQLite / SQL Server)
+# -----------------------------
+class IndexInverse:
+    # token -> {ouvrage_id: poids}; recherche par prefixe via une liste triee de tokens.
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._docs = {}
+        self._tokens = []
+        self._tokens_a_trier = False
+        self._lock = threading.RLock()
+
+    def indexer(self, ouvrage_id: int, champs: dict) -> None:
+        with self._lock:
+            self.retirer(ouvrage_id)
+            poids_doc = {}
+            for champ, valeur in champs.items():
+                for token in tokeniser(valeur):
+                    poids_doc[token] = max(poids_doc.get(token, 0), POIDS_CHAMPS[champ])
+            for token, poids in poids_doc.items():
+                if token not in self._postings:
+                    self._tokens_a_trier = True
+                self._postings[token][ouvrage_id] = poids
+            self._docs[ouvrage_id] = set(poids_doc)
+
+    def retirer(self, ouvrage_id: int) -> None:
+        with self._lock:
+            for token in self._docs.pop(ouvrage_id, ()):
+                posting = self._postings[token]
+                posting.pop(ouvrage_id, None)
+                if not posting:
+                    del self._postings[token]
+                    self._tokens_a_trier = True
+
+    def _tokens_prefixes(self, prefixe: str):
+        if self._tokens_a_trier:
+            self._tokens = sorted(self._postings)
+            self._tokens_a_trier = False
+        position = bisect_left(self._tokens, prefixe)
+        while position < len(self._tokens) and self._tokens[position].startswith(prefixe):
+            yield self._tokens[position]
+            position += 1
+
+    def rechercher(self, termes: list, limite: int = LIMITE_RESULTATS) -> dict:
+        # ET entre les termes, chaque terme etant un prefixe; retourne {id: score}.
+        with self._lock:
+            scores = None
+            for terme in termes:
+                trouves = {}
+                for token in self._tokens_prefixes(terme):
+                    for ouvrage_id, poids in self._postings[token].items():
+                        if poids > trouves.get(ouvrage_id, 0):
+                            trouves[ouvrage_id] = poids
+                if scores is None:
+                    scores = trouves
+                else:
+                    scores = {i: s + trouves[i] for i, s in scores.items() if i in trouves}
+                if not scores:
+                    return {}
+        meilleurs = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limite]
+        return dict(meilleurs)
+
+
+class IndexTrigrammes:
+    # trigramme -> {ouvrage_id: masque des champs}; similarite = part des trigrammes
+    # de la requete presents dans le champ (proche de word_similarity de pg_trgm).
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._docs = {}
+        self._lock = threading.RLock()
+
+    def indexer(self, ouvrage_id: int, champs: dict) -> None:
+        with self._lock:
+            self.retirer(ouvrage_id)
+            masques = {}
+            for bit, champ in enumerate(CHAMPS_TRIGRAMMES):
+                for trigramme in trigrammes(champs.get(champ)):
+                    masques[trigramme] = masques.get(trigramme, 0) | (1 << bit)
+            for trigramme, masque in masques.items():
+                self._postings[trigramme][ouvrage_id] = masque
+            self._docs[ouvrage_id] = set(masques)
+
+    def retirer(self, ouvrage_id: int) -> None:
+        with self._lock:
+            for trigramme in self._docs.pop(ouvrage_id, ()):
+                posting = self._postings[trigramme]
+                posting.pop(ouvrage_id, None)
+                if not posting:
+                    del self._postings[trigramme]
+
+    def rechercher(self, texte: str, *, limite: int, echeance: float) -> tuple:
+        # Retourne ({id: similarite}, complet); complet=False si l'echeance a coupe le parcours.
+        requete = trigrammes(texte)
+        if not requete:
+            return {}, True
+        compteurs = defaultdict(lambda: [0] * len(CHAMPS_TRIGRAMMES))
+        complet = True
+        with self._lock:
+            # Trigrammes rares d'abord: si le budget coupe, les plus discriminants sont vus.
+            for trigramme in sorted(requete, key=lambda t: len(self._postings.get(t, ()))):
+                if time.monotonic() > echeance:
+                    complet = False
+                    break
+                for ouvrage_id, masque in self._postings.get(trigramme, {}).items():
+                    compteur = compteurs[ouvrage_id]
+                    for bit in range(len(CHAMPS_TRIGRAMMES)):
+                        if masque & (1 << bit):
+                            compteur[bit] += 1
+        scores = {}
+        for ouvrage_id, compteur in compteurs.items():
+            similarite = max(compteur) / len(requete)
+            if similarite >= SEUIL_SIMILARITE:
+                scores[ouvrage_id] = similarite
+        meilleurs = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limite]
+        return dict(meilleurs), complet
+
+
+def _construire_index() -> IndexInverse:
+    index = IndexInverse()
+    for ouvrage_id, titre, auteur, isbn, categorie in (
+        Ouvrage.objects.values_list("id", "titre", "auteur", "isbn", "categorie").iterator()
+    ):
+        index.indexer(ouvrage_id, {"titre": titre, "auteur": auteur, "isbn": isbn, "categorie": categorie})
+    return index
+
+
+def _construire_index_trigrammes() -> IndexTrigrammes:
+    index = IndexTrigrammes()
+    for ouvrage_id, titre, auteur in Ouvrage.objects.values_list("id", "titre", "auteur").iterator():
+        index.indexer(ouvrage_id, {"titre": titre, "auteur": auteur})
+    return index
+
+
+# Index memoire du catalogue, tenus a jour par signaux (voir ouvrages/signals.py).
+index_catalogue = CacheProcessus(
+    _construire_index,
+    ttl=getattr(settings, "CATALOGUE_INDEX_TTL", 300),
+)
+index_trigrammes = CacheProcessus(
+    _construire_index_trigrammes,
+    ttl=getattr(settings, "CATALOGUE_INDEX_TTL", 300),
+)
+
+
+def indexer_ouvrage(ouvrage: Ouvrage) -> None:
+    champs = {
+        "titre": ouvrage.titre,
+        "auteur": ouvrage.auteur,
+        "isbn": ouvrage.isbn,
+        "categorie": ouvrage.categorie,
+    }
+    for cache in (index_catalogue, index_trigrammes):
+        index = cache.peek()
+        if index is not None:
+            index.indexer(ouvrage.id, champs)
+
+
+def desindexer_ouvrage(ouvrage_id: int) -> None:
+    for cache in (index_catalogue, index_trigrammes):
+        index = cache.peek()
+        if index is not None:
+            index.retirer(ouvrage_id)
+
+
+# -----------------------------
+# Point d'entree des vues
+# -----------------------------
+def rechercher_ouvrages(qs, texte: str):
+    # Filtre le queryset et annote `pertinence` (entier, plus grand = plus pertinent).
+    termes = tokeniser(texte)
+    if not termes:
+        return qs
+    if connections[qs.db].vendor == "postgresql":
+        return _rechercher_postgresql(qs, termes)
+
+    scores = index_catalogue.get().rechercher(termes)
+    if not scores:
+        return qs.none().annotate(pertinence=Value(0, output_field=IntegerField()))
+    return qs.filter(id__in=list(scores)).annotate(pertinence=annoter_pertinence(scores))
+
+
+def annoter_pertinence(scores: dict, champ: str = "id"):
+    # Expression {ouvrage_id: score} -> entier, `champ` pointant vers l'id d'ouvrage.
+    par_score = defaultdict(list)
+    for ouvrage_id, score in scores.items():
+        par_score[score].append(ouvrage_id)
+    return Case(
+        *[When(**{f"{champ}__in": ids}, then=Value(score)) for score, ids in par_score.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def suggerer_ouvrages(texte: str, *, limite: int = LIMITE_SUGGESTIONS, budget_ms=None) -> tuple:
+    # Recherche tolerante aux fautes sur titre/auteur.
+    # Retourne ({ouvrage_id: pertinence 0-1000}, complet); complet=False si le budget
+    # de latence a ete atteint (resultats partiels ou vides).
+    if budget_ms is None:
+        budget_ms = getattr(settings, "RECHERCHE_APPROX_BUDGET_MS", 200)
+    if connections[Ouvrage.objects.db].vendor == "postgresql":
+        scores, complet = _suggerer_postgresql(texte, limite, budget_ms)
+    else:
+        echeance = time.monotonic() + budget_ms / 1000
+        scores, complet = index_trigrammes.get().rechercher(texte, limite=limite, echeance=echeance)
+    return {ouvrage_id: int(similarite * 1000) for ouvrage_id, similarite in scores.items()}, complet
+
+
+def _rechercher_postgresql(qs, termes: list):
+    # Colonne search_vector (tsvector pondere + index GIN), voir migration 0006.
+    table = Ouvrage._meta.db_table
+    tsquery = " & ".join(f"{terme}:*" for terme in termes)
+    return qs.filter(
+        RawSQL(
+            f"{table}.search_vector @@ to_tsquery('simple', %s)",
+            (tsquery,),
+            output_field=BooleanField(),
+        )
+    ).annotate(
+        pertinence=RawSQL(
+            f"CAST(ts_rank({table}.search_vector, to_tsquery('simple', %s)) * 1000000 AS integer)",
+            (tsquery,),
+            output_field=IntegerField(),
+        )
+    )
+
+
+def _suggerer_postgresql(texte: str, limite: int, budget_ms: int) -> tuple:
+    # Operateur <% (word_similarity) servi par les index GIN gin_trgm_ops, voir migration 0007.
+    # Le budget est applique par statement_timeout, limite a cette requete.
+    table = Ouvrage._meta.db_table
+    texte = (texte or "").strip()
+    if not texte:
+        return {}, True
+    connection = connections[Ouvrage.objects.db]
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", (int(budget_ms),))
+            cursor.execute(
+                f"""
+                SELECT id, GREATEST(word_similarity(%s, titre), word_similarity(%s, auteur)) AS sim
+                FROM {table}
+                WHERE %s <%% titre OR %s <%% auteur
+                ORDER BY sim DESC, id
+                LIMIT %s
+                """,
+                (texte, texte, texte, texte, limite),
+            )
+            lignes = cursor.fetchall()
+            cursor.execute("SET LOCAL statement_timeout TO DEFAULT")
+    except OperationalError:
+        return {}, False
+    return dict(lignes), True
@@ -8,9 +8,6 @@ from .models import DemandeLivre, Ebook
 
 class OuvrageSerializer(serializers.ModelSerializer):
     # Sortie ouvrage + compteurs.
-    exemplaires_total = serializers.IntegerField(read_only=True)
-    exemplaires_disponibles = serializers.IntegerField(read_only=True)
-
     class Meta:
         model = Ouvrage
         fields = [
@@ -0,0 +1,49 @@
+# Role de ce fichier: signaux ouvrages (mise a jour des index memoire).
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from adherents.models import Adherent
+
+from .models import Ouvrage
+from .search import desindexer_ouvrage, indexer_ouvrage
+from .suggestions import mettre_a_jour
+
+
+@receiver(post_save, sender=Ouvrage)
+def ouvrage_enregistre(sender, instance, **kwargs):
+    def indexer():
+        indexer_ouvrage(instance)
+        mettre_a_jour("indexer_ouvrage", instance.id, instance.titre, instance.auteur, instance.categorie)
+
+    transaction.on_commit(indexer)
+
+
+@receiver(post_delete, sender=Ouvrage)
+def ouvrage_supprime(sender, instance, **kwargs):
+    ouvrage_id = instance.id
+
+    def desindexer():
+        desindexer_ouvrage(ouvrage_id)
+        mettre_a_jour("retirer_ouvrage", ouvrage_id)
+
+    transaction.on_commit(desindexer)
+
+
+@receiver(post_save, sender=Adherent)
+def adherent_enregistre(sender, instance, **kwargs):
+    user_id, username = instance.user_id, instance.user.username
+    transaction.on_commit(lambda: mettre_a_jour("indexer_adherent", user_id, username))
+
+
+@receiver(post_delete, sender=Adherent)
+def adherent_supprime(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: mettre_a_jour("retirer_adherent", user_id))
+
+
+@receiver(post_save, sender=get_user_model())
+def utilisateur_enregistre(sender, instance, **kwargs):
+    user_id, username = instance.id, instance.username
+    transaction.on_commit(lambda: mettre_a_jour("renommer_adherent", user_id, username))
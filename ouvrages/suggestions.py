@@ -0,0 +1,138 @@
+# Role de ce fichier: autocompletion (titres, auteurs, categories, adherents) en memoire.
+import threading
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from adherents.models import Adherent
+from core.cache import CacheProcessus
+
+from .models import Ouvrage
+from .search import tokeniser
+
+TYPES_SUGGESTIONS = ("titres", "auteurs", "categories", "adherents")
+LIMITE_SUGGESTIONS_DEFAUT = 8
+LIMITE_SUGGESTIONS_MAX = 20
+
+
+def _cles(libelle: str) -> list:
+    # Une cle par debut de mot: "Victor Hugo" -> "victor hugo", "hugo".
+    mots = tokeniser(libelle)
+    return [" ".join(mots[i:]) for i in range(len(mots))]
+
+
+class IndexPrefixes:
+    # Tableau trie de (cle normalisee, libelle); un libelle partage par plusieurs
+    # lignes (auteur, categorie) est compte et retire a la derniere reference.
+    def __init__(self):
+        self._entrees = []
+        self._references = {}
+
+    def ajouter(self, libelle: str) -> None:
+        if not libelle:
+            return
+        nombre = self._references.get(libelle, 0)
+        self._references[libelle] = nombre + 1
+        if nombre == 0:
+            for cle in _cles(libelle):
+                insort(self._entrees, (cle, libelle))
+
+    def retirer(self, libelle: str) -> None:
+        nombre = self._references.get(libelle, 0)
+        if nombre > 1:
+            self._references[libelle] = nombre - 1
+            return
+        if nombre == 0:
+            return
+        del self._references[libelle]
+        for cle in _cles(libelle):
+            position = bisect_left(self._entrees, (cle, libelle))
+            if position < len(self._entrees) and self._entrees[position] == (cle, libelle):
+                del self._entrees[position]
+
+    def completer(self, prefixe: str, limite: int) -> list:
+        resultats = []
+        position = bisect_left(self._entrees, (prefixe, ""))
+        while position < len(self._entrees) and len(resultats) < limite:
+            cle, libelle = self._entrees[position]
+            if not cle.startswith(prefixe):
+                break
+            if libelle not in resultats:
+                resultats.append(libelle)
+            position += 1
+        return resultats
+
+
+class SuggestionsCatalogue:
+    def __init__(self):
+        self.index = {type_: IndexPrefixes() for type_ in TYPES_SUGGESTIONS}
+        # Dernieres valeurs indexees, pour retirer les anciens libelles a la mise a jour.
+        self._ouvrages = {}
+        self._adherents = {}
+        self._lock = threading.RLock()
+
+    def indexer_ouvrage(self, ouvrage_id: int, titre: str, auteur: str, categorie: str) -> None:
+        with self._lock:
+            self.retirer_ouvrage(ouvrage_id)
+            valeurs = (titre, auteur, categorie)
+            for type_, valeur in zip(("titres", "auteurs", "categories"), valeurs):
+                self.index[type_].ajouter(valeur)
+            self._ouvrages[ouvrage_id] = valeurs
+
+    def retirer_ouvrage(self, ouvrage_id: int) -> None:
+        with self._lock:
+            valeurs = self._ouvrages.pop(ouvrage_id, None)
+            if valeurs is None:
+                return
+            for type_, valeur in zip(("titres", "auteurs", "categories"), valeurs):
+                self.index[type_].retirer(valeur)
+
+    def indexer_adherent(self, user_id: int, username: str) -> None:
+        with self._lock:
+            self.retirer_adherent(user_id)
+            self.index["adherents"].ajouter(username)
+            self._adherents[user_id] = username
+
+    def retirer_adherent(self, user_id: int) -> None:
+        with self._lock:
+            username = self._adherents.pop(user_id, None)
+            if username is not None:
+                self.index["adherents"].retirer(username)
+
+    def renommer_adherent(self, user_id: int, username: str) -> None:
+        # Appele sur chaque sauvegarde de User: ignore les comptes sans adherent.
+        with self._lock:
+            if user_id in self._adherents:
+                self.indexer_adherent(user_id, username)
+
+    def completer(self, texte: str, types, limite: int) -> dict:
+        prefixe = " ".join(tokeniser(texte))
+        if not prefixe:
+            return {type_: [] for type_ in types}
+        with self._lock:
+            return {type_: self.index[type_].completer(prefixe, limite) for type_ in types}
+
+
+def _construire_suggestions() -> SuggestionsCatalogue:
+    suggestions = SuggestionsCatalogue()
+    for ouvrage_id, titre, auteur, categorie in (
+        Ouvrage.objects.values_list("id", "titre", "auteur", "categorie").iterator()
+    ):
+        suggestions.indexer_ouvrage(ouvrage_id, titre, auteur, categorie)
+    for user_id, username in Adherent.objects.values_list("user_id", "user__username").iterator():
+        suggestions.indexer_adherent(user_id, username)
+    return suggestions
+
+
+# Index d'autocompletion, tenu a jour par signaux (voir ouvrages/signals.py).
+suggestions_catalogue = CacheProcessus(
+    _construire_suggestions,
+    ttl=getattr(settings, "CATALOGUE_INDEX_TTL", 300),
+)
+
+
+def mettre_a_jour(methode: str, *args) -> None:
+    # Applique une mise a jour si l'index est deja charge (sinon il sera construit a jour).
+    suggestions = suggestions_catalogue.peek()
+    if suggestions is not None:
+        getattr(suggestions, methode)(*args)
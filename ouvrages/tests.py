@@ -1,5 +1,19 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APIClient
 
+from adherents.models import Adherent
+from emprunts.services import creer_emprunt, enregistrer_retour
+from exemplaires.models import (
+    EtatExemplaire,
+    Exemplaire,
+    creer_exemplaires,
+    recalculer_compteurs_exemplaires,
+)
+
+from .models import Ouvrage
+from .search import index_catalogue, index_trigrammes, rechercher_ouvrages, suggerer_ouvrages
+from .suggestions import suggestions_catalogue
 from .serializers import OuvrageCreateSerializer, OuvrageUpdateSerializer
 
 
@@ -39,3 +53,172 @@ class OuvrageIsbnValidationTests(TestCase):
         )
         self.assertFalse(serializer.is_valid())
         self.assertIn("isbn", serializer.errors)
+
+
+class OuvrageCompteursExemplairesTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="lecteur", password="pass")
+        self.adherent = Adherent.objects.create(user=user, adresse="Test", telephone="000")
+        self.ouvrage = Ouvrage.objects.create(
+            isbn="9780306406157",
+            titre="Test",
+            auteur="Auteur",
+            categorie="Test",
+        )
+
+    def compteurs(self):
+        self.ouvrage.refresh_from_db()
+        return self.ouvrage.exemplaires_total, self.ouvrage.exemplaires_disponibles
+
+    def test_compteurs_suivent_creation_emprunt_retour_suppression(self):
+        premier, second = creer_exemplaires(self.ouvrage, 2)
+        Exemplaire.objects.create(ouvrage=self.ouvrage, code_barre="EX-PERDU", etat=EtatExemplaire.PERDU)
+        self.assertEqual(self.compteurs(), (3, 2))
+
+        emprunt = creer_emprunt(exemplaire=Exemplaire.objects.get(id=premier.id), adherent=self.adherent)
+        self.assertEqual(self.compteurs(), (3, 1))
+
+        enregistrer_retour(emprunt=emprunt)
+        self.assertEqual(self.compteurs(), (3, 2))
+
+        Exemplaire.objects.get(id=second.id).delete()
+        self.assertEqual(self.compteurs(), (2, 1))
+
+    def test_compteurs_suppression_queryset(self):
+        # queryset.delete() (action admin delete_selected) ne passe pas par Exemplaire.delete().
+        creer_exemplaires(self.ouvrage, 3)
+        Exemplaire.objects.create(ouvrage=self.ouvrage, code_barre="EX-PERDU", etat=EtatExemplaire.PERDU)
+        self.assertEqual(self.compteurs(), (4, 3))
+
+        garde = Exemplaire.objects.filter(etat=EtatExemplaire.DISPONIBLE).first()
+        Exemplaire.objects.filter(ouvrage=self.ouvrage).exclude(id=garde.id).delete()
+        self.assertEqual(self.compteurs(), (1, 1))
+
+    def test_compteurs_changement_ouvrage(self):
+        autre = Ouvrage.objects.create(isbn="9780131103627", titre="Autre", auteur="Auteur", categorie="Test")
+        disponible, perdu = creer_exemplaires(self.ouvrage, 2)
+        Exemplaire.objects.filter(id=perdu.id).update(etat=EtatExemplaire.PERDU)
+        recalculer_compteurs_exemplaires()
+
+        exemplaire = Exemplaire.objects.get(id=disponible.id)
+        exemplaire.ouvrage = autre
+        exemplaire.save()
+        exemplaire = Exemplaire.objects.get(id=perdu.id)
+        exemplaire.ouvrage = autre
+        exemplaire.etat = EtatExemplaire.DISPONIBLE
+        exemplaire.save(update_fields=["ouvrage", "etat"])
+
+        autre.refresh_from_db()
+        self.assertEqual(self.compteurs(), (0, 0))
+        self.assertEqual((autre.exemplaires_total, autre.exemplaires_disponibles), (2, 2))
+
+    def test_recalcul_compteurs(self):
+        creer_exemplaires(self.ouvrage, 3)
+        Ouvrage.objects.update(exemplaires_total=0, exemplaires_disponibles=42)
+        recalculer_compteurs_exemplaires()
+        self.assertEqual(self.compteurs(), (3, 3))
+
+
+class OuvrageRechercheTests(TestCase):
+    def setUp(self):
+        index_catalogue.invalider()
+        index_trigrammes.invalider()
+        self.roman = Ouvrage.objects.create(
+            isbn="9780306406157", titre="Les Misérables", auteur="Victor Hugo", categorie="Roman"
+        )
+        self.essai = Ouvrage.objects.create(
+            isbn="9782070360024", titre="Notre histoire", auteur="Collectif", categorie="Misérables et société"
+        )
+
+    def resultats(self, texte):
+        qs = rechercher_ouvrages(Ouvrage.objects.all(), texte).order_by("-pertinence", "id")
+        return list(qs.values_list("id", flat=True))
+
+    def test_titre_classe_avant_categorie(self):
+        self.assertEqual(self.resultats("miserables"), [self.roman.id, self.essai.id])
+
+    def test_prefixes_accents_et_isbn(self):
+        self.assertEqual(self.resultats("vic hug"), [self.roman.id])
+        self.assertEqual(self.resultats("978-2-07"), [self.essai.id])
+        self.assertEqual(self.resultats("hugo collectif"), [])
+
+    def test_index_mis_a_jour_apres_modification(self):
+        self.resultats("hugo")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.roman.auteur = "Anonyme"
+            self.roman.save()
+        self.assertEqual(self.resultats("hugo"), [])
+        self.assertEqual(self.resultats("anonyme"), [self.roman.id])
+
+    def test_recherche_approximative_tolere_les_fautes(self):
+        scores, complet = suggerer_ouvrages("victr hugo")
+        self.assertTrue(complet)
+        self.assertEqual(list(scores), [self.roman.id])
+        scores, _ = suggerer_ouvrages("miserabels")
+        self.assertEqual(list(scores), [self.roman.id])
+        self.assertEqual(suggerer_ouvrages("zzzz")[0], {})
+
+    def test_recherche_approximative_budget_depasse(self):
+        self.assertEqual(suggerer_ouvrages("hugo", budget_ms=-1), ({}, False))
+
+
+class CatalogueSuggestTests(TestCase):
+    def setUp(self):
+        suggestions_catalogue.invalider()
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username="admin", password="pass")
+        lecteur = User.objects.create_user(username="victoria", password="pass")
+        Adherent.objects.create(user=lecteur, adresse="Test", telephone="000")
+        self.ouvrage = Ouvrage.objects.create(
+            isbn="9780306406157", titre="Les Misérables", auteur="Victor Hugo", categorie="Roman"
+        )
+        Ouvrage.objects.create(isbn="9782070360024", titre="Notre-Dame de Paris", auteur="Victor Hugo", categorie="Roman")
+        self.client = APIClient()
+
+    def test_prefixes_par_type_sans_requete_sql(self):
+        self.client.force_authenticate(self.admin)
+        self.client.get("/api/catalogue/suggest/", {"q": "vic"})
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/catalogue/suggest/", {"q": "vic"})
+        self.assertEqual(response.data["auteurs"], ["Victor Hugo"])
+        self.assertEqual(response.data["adherents"], ["victoria"])
+        response = self.client.get("/api/catalogue/suggest/", {"q": "mise", "types": "titres"})
+        self.assertEqual(response.data, {"titres": ["Les Misérables"]})
+
+    def test_adherents_reserves_au_personnel(self):
+        self.client.force_authenticate(get_user_model().objects.get(username="victoria"))
+        response = self.client.get("/api/catalogue/suggest/", {"q": "vic"})
+        self.assertNotIn("adherents", response.data)
+
+    def test_index_suit_les_modifications(self):
+        self.client.force_authenticate(self.admin)
+        self.client.get("/api/catalogue/suggest/", {"q": "r"})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ouvrage.categorie = "Classique"
+            self.ouvrage.save()
+        response = self.client.get("/api/catalogue/suggest/", {"q": "r", "types": "categories"})
+        self.assertEqual(response.data["categories"], ["Roman"])
+        response = self.client.get("/api/catalogue/suggest/", {"q": "clas", "types": "categories"})
+        self.assertEqual(response.data["categories"], ["Classique"])
+
+
+class OuvrageFacettesTests(TestCase):
+    def setUp(self):
+        index_catalogue.invalider()
+        Ouvrage.objects.create(isbn="9780306406157", titre="Roman A", auteur="X", categorie="Roman", annee=2001)
+        Ouvrage.objects.create(isbn="9782070360024", titre="Roman B", auteur="Y", categorie="Roman", annee=2001)
+        Ouvrage.objects.create(
+            isbn="9782070368228", titre="Essai", auteur="Z", categorie="Essai", annee=1999, disponible=False
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_superuser(username="admin", password="pass"))
+
+    def test_facettes_du_jeu_de_resultats(self):
+        response = self.client.get("/api/catalogue/ouvrages/", {"facets": "true"})
+        facettes = response.data["facettes"]
+        self.assertEqual(facettes["categorie"], [{"valeur": "Roman", "total": 2}, {"valeur": "Essai", "total": 1}])
+        self.assertEqual(facettes["disponible"], [{"valeur": True, "total": 2}, {"valeur": False, "total": 1}])
+
+        response = self.client.get("/api/catalogue/ouvrages/", {"facets": "true", "search": "roman", "annee": "2001"})
+        self.assertEqual(response.data["facettes"]["annee"], [{"valeur": 2001, "total": 2}])
+        self.assertNotIn("facettes", self.client.get("/api/catalogue/ouvrages/").data)
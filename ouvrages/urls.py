@@ -2,7 +2,9 @@
 from django.urls import path
 
 from .views import (
+    catalogue_suggest,
     ouvrage_detail,
+    ouvrage_disponibilite,
     ouvrages_list,
     demandes_livres,
     mes_demandes_livres,
@@ -15,6 +17,8 @@ from .views import (
 urlpatterns = [
     path("api/catalogue/ouvrages/", ouvrages_list),
     path("api/catalogue/ouvrages/<int:ouvrage_id>/", ouvrage_detail),
+    path("api/catalogue/ouvrages/<int:ouvrage_id>/disponibilite/", ouvrage_disponibilite),
+    path("api/catalogue/suggest/", catalogue_suggest),
     path("api/demandes-livres/", demandes_livres),
     path("api/demandes-livres/me/", mes_demandes_livres),
     path("api/demandes-livres/<int:demande_id>/status/", demande_livre_status),
@@ -1,6 +1,10 @@
 # Role de ce fichier: endpoints DRF pour le catalogue (ouvrages).
+from collections import defaultdict
+from datetime import timedelta
+
 from django.db.models import Count, Q
 from django.db.models.deletion import ProtectedError
+from django.utils.dateparse import parse_date
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.permissions import IsAuthenticated
@@ -10,11 +14,20 @@ from django.utils import timezone
 
 from core.models import ActivityType, log_activity
 from core.views import apply_ordering, paginate_queryset
-from exemplaires.models import EtatExemplaire, Exemplaire, generate_code_barre
-from users.views import IsAdminOrBibliothecaire, IsLecteur
+from emprunts.disponibilite import HORIZON_JOURS, moteur_disponibilite
+from exemplaires.models import creer_exemplaires
+from users.models import UserRole
+from users.views import IsAdminOrBibliothecaire, IsLecteur, get_user_role
 from core.models import Paiement, StatutPaiement, TypePaiement
 
 from .models import Ouvrage, DemandeLivre, Ebook
+from .search import annoter_pertinence, rechercher_ouvrages, suggerer_ouvrages
+from .suggestions import (
+    LIMITE_SUGGESTIONS_DEFAUT,
+    LIMITE_SUGGESTIONS_MAX,
+    TYPES_SUGGESTIONS,
+    suggestions_catalogue,
+)
 from .serializers import (
     OuvrageCreateSerializer,
     OuvrageSerializer,
@@ -27,16 +40,45 @@ from .serializers import (
     EbookUpdateSerializer,
 )
 
+# Filtres du catalogue exposes en facettes (?facets=true).
+CHAMPS_FACETTES = ("categorie", "type_ressource", "disponible", "annee")
 
-def annotate_ouvrages(qs):
-    # Ajoute les compteurs d'exemplaires pour l'affichage.
-    return qs.annotate(
-        exemplaires_total=Count("exemplaires"),
-        exemplaires_disponibles=Count(
-            "exemplaires",
-            filter=Q(exemplaires__etat=EtatExemplaire.DISPONIBLE),
-        ),
-    )
+# Calendrier de disponibilite: periode par defaut et periode max (jours).
+CALENDRIER_JOURS_DEFAUT = 30
+CALENDRIER_JOURS_MAX = HORIZON_JOURS
+
+
+# -----------------------------
+# Helpers: parametres de date
+# -----------------------------
+def _date_param(request, nom: str, defaut):
+    # Date ISO en query param; None si le format ou la date est invalide.
+    valeur = request.query_params.get(nom)
+    if not valeur:
+        return defaut
+    try:
+        return parse_date(valeur)
+    except ValueError:
+        return None
+
+
+# -----------------------------
+# Helpers: facettes
+# -----------------------------
+def calculer_facettes(qs) -> dict:
+    # Histogrammes {champ: [{"valeur", "total"}]} du jeu de resultats, en une requete:
+    # un GROUP BY sur la combinaison des champs, ventile ensuite par champ.
+    totaux = {champ: defaultdict(int) for champ in CHAMPS_FACETTES}
+    for ligne in qs.order_by().values(*CHAMPS_FACETTES).annotate(total=Count("id")):
+        for champ in CHAMPS_FACETTES:
+            totaux[champ][ligne[champ]] += ligne["total"]
+    return {
+        champ: [
+            {"valeur": valeur, "total": total}
+            for valeur, total in sorted(valeurs.items(), key=lambda item: (-item[1], str(item[0])))
+        ]
+        for champ, valeurs in totaux.items()
+    }
 
 
 @api_view(["GET", "POST"])
@@ -46,7 +88,7 @@ def ouvrages_list(request):
     # Ce que ca fait: liste ou creation d'ouvrages.
     # Permissions: GET auth, POST admin/biblio.
     # Payload POST: champs ouvrage + nombre_exemplaires.
-    # Reponse: liste paginee ou ouvrage cree.
+    # Reponse: liste paginee ou ouvrage cree; ?facets=true ajoute "facettes".
     if request.method == "POST":
         if not IsAdminOrBibliothecaire().has_permission(request, None):
             return Response({"detail": "Acces interdit."}, status=status.HTTP_403_FORBIDDEN)
@@ -76,25 +118,24 @@ def ouvrages_list(request):
 
         nombre = data.get("nombre_exemplaires", 0)
         if nombre:
-            exemplaires = [
-                Exemplaire(ouvrage=ouvrage, code_barre=generate_code_barre(ouvrage.id))
-                for _ in range(nombre)
-            ]
-            Exemplaire.objects.bulk_create(exemplaires)
+            creer_exemplaires(ouvrage, nombre)
+            ouvrage.refresh_from_db(fields=["exemplaires_total", "exemplaires_disponibles"])
 
-        qs = annotate_ouvrages(Ouvrage.objects.filter(id=ouvrage.id))
-        return Response(OuvrageSerializer(qs.first()).data, status=status.HTTP_201_CREATED)
+        return Response(OuvrageSerializer(ouvrage).data, status=status.HTTP_201_CREATED)
 
-    qs = annotate_ouvrages(Ouvrage.objects.all())
+    qs = Ouvrage.objects.all()
 
+    # Recherche plein texte classee (titre > auteur/isbn > categorie), voir search.py.
+    # ?fuzzy=true: recherche tolerante aux fautes (trigrammes) sur titre/auteur.
     search = request.query_params.get("search")
-    if search:
-        qs = qs.filter(
-            Q(titre__icontains=search)
-            | Q(auteur__icontains=search)
-            | Q(isbn__icontains=search)
-            | Q(categorie__icontains=search)
-        )
+    fuzzy = request.query_params.get("fuzzy") == "true"
+    recherche_complete = True
+    if search and fuzzy:
+        scores, recherche_complete = suggerer_ouvrages(search)
+        qs = qs.filter(id__in=list(scores)).annotate(pertinence=annoter_pertinence(scores))
+    elif search:
+        qs = rechercher_ouvrages(qs, search)
+    tri_pertinence = bool(search) and "pertinence" in qs.query.annotations
 
     titre = request.query_params.get("titre")
     if titre:
@@ -120,15 +161,52 @@ def ouvrages_list(request):
     if disponible in {"true", "false"}:
         qs = qs.filter(disponible=(disponible == "true"))
 
+    annee = request.query_params.get("annee")
+    if annee and annee.isdigit():
+        qs = qs.filter(annee=int(annee))
+
+    facettes = calculer_facettes(qs) if request.query_params.get("facets") == "true" else None
+
     qs = apply_ordering(
         qs,
         request,
-        allowed_fields=["titre", "auteur", "annee", "categorie", "isbn", "type_ressource"],
-        default="titre",
+        allowed_fields=["titre", "auteur", "annee", "categorie", "isbn", "type_ressource"]
+        + (["pertinence"] if tri_pertinence else []),
+        default="-pertinence" if tri_pertinence else "titre",
     )
 
     items, meta = paginate_queryset(qs, request, default_page_size=10)
-    return Response({"results": OuvrageSerializer(items, many=True).data, "pagination": meta})
+    payload = {"results": OuvrageSerializer(items, many=True).data, "pagination": meta}
+    if facettes is not None:
+        payload["facettes"] = facettes
+    if search and fuzzy:
+        # False si le budget de latence a coupe la recherche (resultats partiels).
+        payload["recherche_complete"] = recherche_complete
+    return Response(payload)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def catalogue_suggest(request):
+    # Ce que ca fait: autocompletion par prefixe, servie par l'index memoire (pas de SQL).
+    # Payload: ?q=&types=titres,auteurs,categories,adherents&limit=
+    # Permissions: auth; suggestions d'adherents reservees a admin/biblio.
+    # Reponse: {"titres": [...], "auteurs": [...], ...} (types demandes uniquement).
+    autorises = list(TYPES_SUGGESTIONS)
+    if get_user_role(request.user) not in {UserRole.ADMIN, UserRole.BIBLIOTHECAIRE}:
+        autorises.remove("adherents")
+
+    demandes = request.query_params.get("types")
+    types = [t for t in demandes.split(",") if t in autorises] if demandes else autorises
+
+    try:
+        limite = int(request.query_params.get("limit", LIMITE_SUGGESTIONS_DEFAUT))
+    except ValueError:
+        limite = LIMITE_SUGGESTIONS_DEFAUT
+    limite = max(1, min(limite, LIMITE_SUGGESTIONS_MAX))
+
+    texte = request.query_params.get("q", "")
+    return Response(suggestions_catalogue.get().completer(texte, types, limite))
 
 
 @api_view(["GET", "PATCH", "DELETE"])
@@ -145,8 +223,7 @@ def ouvrage_detail(request, ouvrage_id: int):
         return Response({"detail": "Ouvrage introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
     if request.method == "GET":
-        qs = annotate_ouvrages(Ouvrage.objects.filter(id=ouvrage_id))
-        return Response(OuvrageSerializer(qs.first()).data)
+        return Response(OuvrageSerializer(ouvrage).data)
 
     if not IsAdminOrBibliothecaire().has_permission(request, None):
         return Response({"detail": "Acces interdit."}, status=status.HTTP_403_FORBIDDEN)
@@ -155,9 +232,7 @@ def ouvrage_detail(request, ouvrage_id: int):
         serializer = OuvrageUpdateSerializer(instance=ouvrage, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
-
-        qs = annotate_ouvrages(Ouvrage.objects.filter(id=ouvrage_id))
-        return Response(OuvrageSerializer(qs.first()).data)
+        return Response(OuvrageSerializer(ouvrage).data)
 
     try:
         ouvrage.delete()
@@ -170,6 +245,64 @@ def ouvrage_detail(request, ouvrage_id: int):
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def ouvrage_disponibilite(request, ouvrage_id: int):
+    # Ce que ca fait: exemplaires libres jour par jour, pour choisir des dates de reservation.
+    # Payload: ?from=AAAA-MM-JJ (defaut aujourd'hui)&to=AAAA-MM-JJ (defaut from + 30 jours),
+    # au plus aujourd'hui + HORIZON_JOURS.
+    # Reponse: {"ouvrage_id", "from", "to", "exemplaires_total", "jours": [{"date", "disponibles"}]}
+    # Calcule depuis la chronologie en cache de l'ouvrage (voir emprunts/disponibilite.py).
+    try:
+        ouvrage = Ouvrage.objects.get(id=ouvrage_id)
+    except Ouvrage.DoesNotExist:
+        return Response({"detail": "Ouvrage introuvable."}, status=status.HTTP_404_NOT_FOUND)
+
+    today = timezone.localdate()
+    # Dates bornees a l'horizon de la chronologie (verifie avant tout calcul de date).
+    limite = today + timedelta(days=HORIZON_JOURS)
+    hors_horizon = Response(
+        {"detail": f"Date hors horizon (au plus {limite.isoformat()})."},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+    debut = _date_param(request, "from", today)
+    if debut is not None and debut > limite:
+        return hors_horizon
+    fin = None if debut is None else _date_param(
+        request, "to", min(debut + timedelta(days=CALENDRIER_JOURS_DEFAUT), limite)
+    )
+    if debut is None or fin is None:
+        return Response({"detail": "Date invalide (format AAAA-MM-JJ)."}, status=status.HTTP_400_BAD_REQUEST)
+    if fin > limite:
+        return hors_horizon
+    if debut < today:
+        return Response(
+            {"detail": "Date de debut invalide (doit etre aujourd'hui ou future)."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if fin < debut:
+        return Response(
+            {"detail": "Date de fin invalide (doit etre apres la date de debut)."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if (fin - debut).days >= CALENDRIER_JOURS_MAX:
+        return Response(
+            {"detail": f"Periode trop longue (max {CALENDRIER_JOURS_MAX} jours)."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    jours = moteur_disponibilite.calendrier(ouvrage, debut, fin)
+    return Response(
+        {
+            "ouvrage_id": ouvrage.id,
+            "from": debut,
+            "to": fin,
+            "exemplaires_total": ouvrage.exemplaires_total,
+            "jours": [{"date": jour, "disponibles": disponibles} for jour, disponibles in jours],
+        }
+    )
+
+
 @api_view(["GET", "POST"])
 @permission_classes([IsAuthenticated])
 def demandes_livres(request):
@@ -223,7 +356,7 @@ def mes_demandes_livres(request):
 def demande_livre_status(request, demande_id: int):
     # Mise a jour du statut d'une demande.
     try:
-        demande = DemandeLivre.objects.get(id=demande_id)
+        demande = DemandeLivre.objects.select_related("adherent__user", "ouvrage").get(id=demande_id)
     except DemandeLivre.DoesNotExist:
         return Response({"detail": "Demande introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -313,7 +446,7 @@ def ebook_download(request, ebook_id: int):
 @parser_classes([MultiPartParser, FormParser])
 def ebook_detail(request, ebook_id: int):
     try:
-        ebook = Ebook.objects.get(id=ebook_id)
+        ebook = Ebook.objects.select_related("ouvrage").get(id=ebook_id)
     except Ebook.DoesNotExist:
         return Response({"detail": "Ebook introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -0,0 +1,17 @@
+# Role de ce fichier: auth JWT qui reprend le role embarque dans le token.
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .models import UserRole
+from .roles import ROLE_CACHE_ATTR
+
+ROLE_CLAIM = "role"
+
+
+class RoleJWTAuthentication(JWTAuthentication):
+    # Memorise le role du token sur request.user (permissions sans requete).
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        role = validated_token.get(ROLE_CLAIM)
+        if role in UserRole.values:
+            setattr(user, ROLE_CACHE_ATTR, role)
+        return user
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def creer_profils_manquants(apps, schema_editor):
+    # Backfill unique: les lectures de role ne creent plus de profil a la volee.
+    app_label, model_name = settings.AUTH_USER_MODEL.split(".")
+    User = apps.get_model(app_label, model_name)
+    UserProfile = apps.get_model("users", "UserProfile")
+
+    sans_profil = User.objects.filter(profile__isnull=True).values_list("id", "is_superuser")
+    UserProfile.objects.bulk_create(
+        [
+            UserProfile(user_id=user_id, role="ADMIN" if is_superuser else "LECTEUR")
+            for user_id, is_superuser in sans_profil
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_profils_manquants, migrations.RunPython.noop),
+    ]
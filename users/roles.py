@@ -0,0 +1,30 @@
+# Role de ce fichier: resolution du role d'un user (sans ecriture en base).
+from typing import Optional
+
+from .models import UserProfile, UserRole
+
+# Le role est memorise sur l'objet user (claim JWT ou premiere lecture du profil):
+# les verifications suivantes de la meme requete ne font aucune requete SQL.
+ROLE_CACHE_ATTR = "_role_cache"
+
+
+def get_user_role(user) -> Optional[str]:
+    # Retourne ADMIN/BIBLIOTHECAIRE/LECTEUR ou None si anon.
+    if user is None or not user.is_authenticated:
+        return None
+    role = getattr(user, ROLE_CACHE_ATTR, None)
+    if role is None:
+        role = _resoudre_role(user)
+        setattr(user, ROLE_CACHE_ATTR, role)
+    return role
+
+
+def _resoudre_role(user) -> str:
+    # Lecture seule: un user sans profil est traite comme lecteur.
+    if getattr(user, "is_superuser", False):
+        return UserRole.ADMIN
+    try:
+        profile = user.profile
+    except UserProfile.DoesNotExist:
+        return UserRole.LECTEUR
+    return profile.role or UserRole.LECTEUR
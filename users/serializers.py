@@ -1,10 +1,15 @@
 # Role de ce fichier: serializers DRF pour gestion admin des users.
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth import get_user_model
 
 from adherents.models import Adherent
 
+from .authentication import ROLE_CLAIM
 from .models import UserProfile, UserRole
+from .roles import get_user_role
 
 User = get_user_model()
 
@@ -76,3 +81,28 @@ class AdminUserUpdateSerializer(serializers.Serializer):
 class AdminPasswordResetSerializer(serializers.Serializer):
     # Input reset password admin.
     password = serializers.CharField(write_only=True, min_length=6)
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    # Login: ajoute le role au refresh token (recopie dans l'access token).
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[ROLE_CLAIM] = get_user_role(user)
+        return token
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    # Refresh: relit le role en base, un changement de role est donc pris
+    # en compte au plus tard a l'expiration de l'access token.
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data["access"])
+        user = (
+            User.objects.select_related("profile")
+            .filter(**{api_settings.USER_ID_FIELD: access[api_settings.USER_ID_CLAIM]})
+            .first()
+        )
+        access[ROLE_CLAIM] = get_user_role(user)
+        data["access"] = str(access)
+        return data
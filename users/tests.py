@@ -1,3 +1,53 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from .models import UserProfile, UserRole
+from .roles import get_user_role
+
+
+User = get_user_model()
+
+
+class RoleResolutionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="biblio", password="pass12345")
+        UserProfile.objects.create(user=self.user, role=UserRole.BIBLIOTHECAIRE)
+        self.client = APIClient()
+
+    def test_get_user_role_sans_profil_ne_cree_rien(self):
+        sans_profil = User.objects.create_user(username="nouveau", password="pass12345")
+        self.assertEqual(get_user_role(sans_profil), UserRole.LECTEUR)
+        self.assertFalse(UserProfile.objects.filter(user=sans_profil).exists())
+
+    def test_role_memorise_sur_le_user(self):
+        user = User.objects.get(id=self.user.id)
+        self.assertEqual(get_user_role(user), UserRole.BIBLIOTHECAIRE)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_role(user), UserRole.BIBLIOTHECAIRE)
+
+    def test_role_dans_le_token_et_me_sans_lecture_du_profil(self):
+        response = self.client.post(
+            "/api/auth/token/",
+            {"username": "biblio", "password": "pass12345"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+        # 1 requete: chargement du user par l'authentification JWT.
+        with self.assertNumQueries(1):
+            me = self.client.get("/api/auth/me/")
+        self.assertEqual(me.data["role"], UserRole.BIBLIOTHECAIRE)
+
+    def test_refresh_relit_le_role(self):
+        tokens = self.client.post(
+            "/api/auth/token/",
+            {"username": "biblio", "password": "pass12345"},
+            format="json",
+        ).data
+        UserProfile.objects.filter(user=self.user).update(role=UserRole.ADMIN)
+
+        access = self.client.post("/api/auth/token/refresh/", {"refresh": tokens["refresh"]}, format="json").data["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.assertEqual(self.client.get("/api/auth/me/").data["role"], UserRole.ADMIN)
@@ -1,6 +1,4 @@
 # Role de ce fichier: endpoints auth + admin users + permissions par role.
-from typing import Optional
-
 from django.contrib.auth import get_user_model
 from django.db import IntegrityError, transaction
 from django.db.models import Q
@@ -17,6 +15,7 @@ from emprunts.models import Emprunt, Reservation
 from ouvrages.models import DemandeLivre
 
 from .models import UserProfile, UserRole
+from .roles import get_user_role  # noqa: F401 (re-export pour les autres apps)
 from .serializers import (
     AdminPasswordResetSerializer,
     AdminUserCreateSerializer,
@@ -28,16 +27,6 @@ User = get_user_model()
 
 
 # Permissions par role: utilisees dans toutes les apps.
-def get_user_role(user) -> Optional[str]:
-    # Retourne ADMIN/BIBLIOTHECAIRE/LECTEUR ou None si anon.
-    if user is None or not user.is_authenticated:
-        return None
-    if getattr(user, "is_superuser", False):
-        return UserRole.ADMIN
-    profile, _ = UserProfile.objects.get_or_create(user=user)
-    return getattr(profile, "role", None) or UserRole.LECTEUR
-
-
 class IsAdmin(BasePermission):
     # Autorise uniquement le role ADMIN.
     def has_permission(self, request, view):